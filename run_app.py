@@ -1,46 +1,693 @@
+import time
+_T_PROCESS_START = time.perf_counter()  # 冷启动计时起点（在其它 import 之前）
+
 import sys
 import os
 import json
-import time
 import threading
+import importlib
+import importlib.util
+import itertools
+import functools
+import contextlib
 import traceback
+import signal
+import queue
+import hashlib
+from collections import OrderedDict, deque
 from dataclasses import dataclass, field
 from typing import List, Tuple, Optional, Dict, Any
 
-# --- UI / System ---
-from PySide6 import QtCore, QtGui, QtWidgets
-from PySide6.QtCore import Qt, Signal, QRect
-from PySide6.QtGui import QColor, QCursor
-from PySide6.QtWidgets import (
-    QApplication, QWidget, QMainWindow, QLabel, QPushButton, QVBoxLayout, QHBoxLayout,
-    QGridLayout, QLineEdit, QFileDialog, QTextEdit, QSpinBox, QColorDialog, QTabWidget,
-    QMessageBox, QCheckBox
-)
-
 # --- Screen / Input / Imaging ---
-import mss
-import pyautogui
-from pynput import mouse, keyboard
-from pynput.keyboard import GlobalHotKeys
+class _LazyModule:
+    """
+    延迟导入：首次访问属性时才真正 import，窗口出现前不加载 cv2 / mss / pyautogui / pynput。
+    """
+    _lock = threading.Lock()
+
+    def __init__(self, name: str, on_load=None):
+        self.__dict__["_name"] = name
+        self.__dict__["_on_load"] = on_load
+        self.__dict__["_mod"] = None
+
+    def _load(self):
+        mod = self.__dict__["_mod"]
+        if mod is None:
+            with self._lock:
+                mod = self.__dict__["_mod"]
+                if mod is None:
+                    mod = importlib.import_module(self.__dict__["_name"])
+                    if self.__dict__["_on_load"]:
+                        self.__dict__["_on_load"](mod)
+                    self.__dict__["_mod"] = mod
+        return mod
+
+    def __getattr__(self, item):
+        return getattr(self._load(), item)
+
+    def __setattr__(self, item, value):
+        setattr(self._load(), item, value)
+
+def _pyautogui_loaded(mod):
+    mod.FAILSAFE = True  # 鼠标移到左上角可紧急终止
+
+mss = _LazyModule("mss")
+pyautogui = _LazyModule("pyautogui", on_load=_pyautogui_loaded)
+mouse = _LazyModule("pynput.mouse")
+keyboard = _LazyModule("pynput.keyboard")
+cv2 = _LazyModule("cv2")
 import numpy as np
-import cv2
+
+# ============================= Startup timing =============================
+class StartupTimer:
+    """
+    启动各阶段耗时，用于追踪冷启动回归：mark() 记录距上一个标记的耗时，add() 记录独立测得的阶段。
+    """
+    def __init__(self, t0: float):
+        self.t0 = t0
+        self._last = t0
+        self.phases: List[Tuple[str, float]] = []
+        self._lock = threading.Lock()
+
+    def mark(self, phase: str):
+        with self._lock:
+            now = time.perf_counter()
+            self.phases.append((phase, (now - self._last) * 1000))
+            self._last = now
+
+    def add(self, phase: str, ms: float):
+        with self._lock:
+            self.phases.append((phase, ms))
+
+    def report(self) -> str:
+        with self._lock:
+            parts = [f"{p} {ms:.0f}ms" for p, ms in self.phases]
+            total = (time.perf_counter() - self.t0) * 1000
+        return "启动耗时：" + " | ".join(parts) + f" | 总计 {total:.0f}ms"
+
+STARTUP = StartupTimer(_T_PROCESS_START)
+STARTUP.mark("imports")
+
+# ============================= Hot-path tracing =============================
+class _Span:
+    __slots__ = ("tracer", "sid", "t0")
+
+    def __init__(self, tracer: 'Tracer', sid: int):
+        self.tracer = tracer
+        self.sid = sid
+
+    def __enter__(self):
+        self.t0 = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.sid, self.t0, time.perf_counter_ns())
+        return False
+
+class Tracer:
+    """
+    热路径阶段追踪：span 写入预分配的 NumPy 环形缓冲区（结构化数组，满了覆盖最旧记录）。
+    - 关闭时 span() 直接返回共享的空上下文，开销接近零
+    - export_chrome() 导出 Chrome trace-event JSON（chrome://tracing / Perfetto 可直接打开）
+    - summary() 给出最近若干秒各阶段的分位数与耗时直方图（UI 面板用）
+    """
+    DTYPE = np.dtype([("stage", np.int16), ("tid", np.int64), ("t0", np.int64), ("dur", np.int64)])
+    HIST_EDGES_MS = [0.0, 0.1, 1.0, 10.0, 100.0, 1000.0, float("inf")]
+    _NULL = contextlib.nullcontext()
+
+    def __init__(self, capacity: int = 1 << 16, enabled: bool = False):
+        self.enabled = enabled
+        self.buf = np.zeros(capacity, self.DTYPE)
+        self._counter = itertools.count()
+        self.count = 0
+        self.stages: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def stage_id(self, name: str) -> int:
+        sid = self._ids.get(name)
+        if sid is None:
+            with self._lock:
+                sid = self._ids.setdefault(name, len(self.stages))
+                if sid == len(self.stages):
+                    self.stages.append(name)
+        return sid
+
+    def span(self, name: str):
+        if not self.enabled:
+            return self._NULL
+        return _Span(self, self.stage_id(name))
+
+    def record(self, sid: int, t0_ns: int, t1_ns: int):
+        i = next(self._counter)  # itertools.count 在 GIL 下是原子的
+        self.buf[i % len(self.buf)] = (sid, threading.get_ident(), t0_ns, t1_ns - t0_ns)
+        self.count = i + 1
+
+    def clear(self):
+        self._counter = itertools.count()
+        self.count = 0
+
+    def records(self) -> np.ndarray:
+        """按时间顺序返回缓冲区内的记录（拷贝）"""
+        n, cap = self.count, len(self.buf)
+        if n <= cap:
+            return self.buf[:n].copy()
+        i = n % cap
+        return np.concatenate([self.buf[i:], self.buf[:i]])
+
+    def summary(self, window_s: float = 5.0) -> List[Dict[str, Any]]:
+        rec = self.records()
+        if not len(rec):
+            return []
+        rec = rec[rec["t0"] >= time.perf_counter_ns() - int(window_s * 1e9)]
+        out = []
+        for sid in np.unique(rec["stage"]):
+            d = rec["dur"][rec["stage"] == sid] / 1e6
+            out.append({"stage": self.stages[sid], "n": len(d),
+                        "p50": float(np.percentile(d, 50)), "p95": float(np.percentile(d, 95)),
+                        "p99": float(np.percentile(d, 99)), "max": float(d.max()),
+                        "hist": np.histogram(d, bins=self.HIST_EDGES_MS)[0].tolist()})
+        out.sort(key=lambda r: -r["p50"] * r["n"])
+        return out
+
+    def export_chrome(self, path: str) -> int:
+        rec = self.records()
+        pid = os.getpid()
+        base = int(rec["t0"].min()) if len(rec) else 0
+        events = [{"name": self.stages[r["stage"]], "ph": "X", "pid": pid, "tid": int(r["tid"]),
+                   "ts": (int(r["t0"]) - base) / 1000.0, "dur": int(r["dur"]) / 1000.0} for r in rec]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return len(events)
+
+TRACER = Tracer()
+
+def traced(name: str):
+    """函数级 span 装饰器；追踪关闭时只多一次属性判断"""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return fn(*args, **kwargs)
+            with TRACER.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+# ============================= Log pipeline =============================
+LOG_FILE_PATH = "run_app.log"
+
+class RotatingLogWriter(threading.Thread):
+    """
+    后台线程批量写日志文件；超过 max_bytes 时轮转为 .1 .. .N（backups 个）。
+    待写队列有界（满时丢弃最旧行并计数），写盘永远不阻塞调用方。
+    """
+    def __init__(self, path: str = LOG_FILE_PATH, max_bytes: int = 5 << 20, backups: int = 3,
+                 capacity: int = 10000, flush_interval: float = 0.5):
+        super().__init__(name="log-writer", daemon=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self._q: deque = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closing = threading.Event()
+        self._f = None
+        self.dropped = 0
+
+    def write(self, line: str):
+        with self._lock:
+            if len(self._q) == self._q.maxlen:
+                self.dropped += 1
+            self._q.append(line)
+
+    def stop(self):
+        self._closing.set()
+        self._wake.set()
+        self.join(timeout=2.0)
+
+    def run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self._flush()
+            if self._closing.is_set():
+                break
+        if self._f:
+            self._f.close()
+
+    def _flush(self):
+        with self._lock:
+            if not self._q:
+                return
+            lines = list(self._q)
+            self._q.clear()
+        try:
+            if self._f is None:
+                self._f = open(self.path, "a", encoding="utf-8")
+            self._f.write("\n".join(lines) + "\n")
+            self._f.flush()
+            if self._f.tell() >= self.max_bytes:
+                self._rotate()
+        except OSError:
+            pass
+
+    def _rotate(self):
+        self._f.close()
+        self._f = None
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+
+class LogPipeline:
+    """
+    线程安全的日志入口：write() 可在任意线程调用，只做加时间戳 + 入环形缓冲。
+    GUI 端定时 drain() 批量取走；满时丢弃最旧行（dropped 计数），内存有界。
+    可选挂接 RotatingLogWriter 同步落盘。
+    """
+    def __init__(self, capacity: int = 2000):
+        self._buf: deque = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self.dropped = 0
+        self.writer: Optional[RotatingLogWriter] = None
+
+    def open_file(self, path: str, max_bytes: int, backups: int):
+        self.close_file()
+        self.writer = RotatingLogWriter(path, max_bytes, backups)
+        self.writer.start()
+
+    def close_file(self):
+        if self.writer:
+            self.writer.stop()
+            self.writer = None
+
+    def write(self, s: str):
+        line = f"[{time.strftime('%H:%M:%S')}] {s}"
+        with self._lock:
+            if len(self._buf) == self._buf.maxlen:
+                self.dropped += 1
+            self._buf.append(line)
+        w = self.writer
+        if w:
+            w.write(line)
+
+    def drain(self) -> Tuple[List[str], int]:
+        """取走全部待显示行 -> (行列表, 自上次 drain 以来丢弃的行数)"""
+        with self._lock:
+            lines = list(self._buf)
+            self._buf.clear()
+            dropped, self.dropped = self.dropped, 0
+        return lines, dropped
+
+# ============================= Glyph Digit Recognizer (fast path) =============================
+GLYPH_TEMPLATES_PATH = "glyph_templates.npz"
+
+@dataclass
+class OCRReading:
+    text: str                     # 清洗后的数字串
+    value: Optional[float]        # 解析出的价格（失败为 None）
+    confidence: float             # 整体置信度 0~1
+    char_confidences: List[float] = field(default_factory=list)
+    source: str = ""              # "glyph" / "paddle" / "easyocr"
+
+class GlyphDigitRecognizer:
+    """
+    字形模板数字识别（游戏内固定字体）：
+    - 由少量已标注的价格 ROI 学习 0-9 . , 的字形模板
+    - 对 OCRManager._preprocess 的二值图做连通域分割，逐字向量化模板匹配（NCC）
+    - 单次识别通常 < 1ms，置信度不足时由 OCRManager 回退到重型 OCR
+    """
+    CHARSET = "0123456789.,"
+    GLYPH_W, GLYPH_H = 12, 20
+    MAX_PER_LABEL = 8       # 每个字符最多保留的模板数
+    MIN_AREA = 6            # 小于该面积的连通域视为噪点（按预处理后像素计）
+
+    def __init__(self, path: Optional[str] = GLYPH_TEMPLATES_PATH, scale: float = 2.0):
+        self.path = path
+        self.scale = scale
+        self.templates = np.zeros((0, self.GLYPH_W * self.GLYPH_H), np.float32)
+        self.labels: List[str] = []
+        if path and os.path.exists(path):
+            self.load(path)
+
+    @property
+    def ready(self) -> bool:
+        return any(c.isdigit() for c in self.labels)
+
+    # ---------- persistence ----------
+    def load(self, path: str):
+        with np.load(path) as d:
+            self.templates = d["templates"].astype(np.float32)
+            self.labels = [str(c) for c in d["labels"]]
+
+    def save(self, path: Optional[str] = None):
+        path = path or self.path
+        if path:
+            np.savez(path, templates=self.templates, labels=np.array(self.labels))
+
+    # ---------- segmentation / features ----------
+    def _binarize(self, img: np.ndarray) -> np.ndarray:
+        th = OCRManager._preprocess(img, scale=self.scale, binarize=True)
+        # 前景（文字）统一为白色：文字像素应占少数
+        if cv2.countNonZero(th) * 2 > th.size:
+            th = cv2.bitwise_not(th)
+        return th
+
+    def _segment(self, th: np.ndarray) -> List[Tuple[int,int,int,int]]:
+        n, _, stats, _ = cv2.connectedComponentsWithStats(th, connectivity=8)
+        boxes = [tuple(int(v) for v in stats[i, :4]) for i in range(1, n)
+                 if stats[i, cv2.CC_STAT_AREA] >= self.MIN_AREA]
+        boxes.sort(key=lambda b: b[0])
+        # 同一字符被断开的笔画（x 方向大部分重叠）合并为一个框
+        merged: List[List[int]] = []
+        for x, y, w, h in boxes:
+            if merged:
+                mx, my, mw, mh = merged[-1]
+                overlap = min(mx + mw, x + w) - max(mx, x)
+                if overlap > 0.5 * min(mw, w):
+                    nx, ny = min(mx, x), min(my, y)
+                    merged[-1] = [nx, ny, max(mx + mw, x + w) - nx, max(my + mh, y + h) - ny]
+                    continue
+            merged.append([x, y, w, h])
+        return [tuple(b) for b in merged]
+
+    def _features(self, th: np.ndarray, boxes) -> np.ndarray:
+        """
+        每个字符按“整行高度”裁剪（保留 . , 的相对位置与大小），缩放后零均值单位化。
+        """
+        hs = np.array([b[3] for b in boxes])
+        tall = [b for b in boxes if b[3] >= 0.5 * hs.max()]
+        top = min(b[1] for b in tall)
+        bottom = max(b[1] + b[3] for b in tall)
+        bottom = min(th.shape[0], bottom + int(0.3 * (bottom - top)))  # 给逗号留下沿
+        feats = np.empty((len(boxes), self.GLYPH_W * self.GLYPH_H), np.float32)
+        for i, (x, y, w, h) in enumerate(boxes):
+            crop = th[min(top, y):max(bottom, y + h), x:x + w]
+            g = cv2.resize(crop, (self.GLYPH_W, self.GLYPH_H), interpolation=cv2.INTER_AREA)
+            feats[i] = g.reshape(-1)
+        feats -= feats.mean(axis=1, keepdims=True)
+        feats /= np.linalg.norm(feats, axis=1, keepdims=True) + 1e-6
+        return feats
+
+    # ---------- learn / read ----------
+    def learn(self, img_bgr: np.ndarray, label: str) -> bool:
+        chars = [c for c in label if c in self.CHARSET]
+        if img_bgr is None or img_bgr.size == 0 or not chars:
+            return False
+        th = self._binarize(img_bgr)
+        boxes = self._segment(th)
+        if len(boxes) != len(chars):
+            return False
+        feats = self._features(th, boxes)
+        templates, labels = list(self.templates), list(self.labels)
+        for c, f in zip(chars, feats):
+            idx = [i for i, l in enumerate(labels) if l == c]
+            if len(idx) >= self.MAX_PER_LABEL:
+                templates.pop(idx[0]); labels.pop(idx[0])
+            templates.append(f); labels.append(c)
+        self.templates = np.asarray(templates, np.float32)
+        self.labels = labels
+        return True
+
+    @traced("glyph")
+    def read(self, img_bgr: np.ndarray) -> OCRReading:
+        if img_bgr is None or img_bgr.size == 0 or not self.ready:
+            return OCRReading("", None, 0.0, [], "glyph")
+        th = self._binarize(img_bgr)
+        boxes = self._segment(th)
+        if not boxes:
+            return OCRReading("", None, 0.0, [], "glyph")
+        scores = self._features(th, boxes) @ self.templates.T      # (k, m) NCC
+        best = scores.argmax(axis=1)
+        confs = np.clip(scores[np.arange(len(boxes)), best], 0.0, 1.0)
+        raw = "".join(self.labels[i] for i in best)
+        s = OCRManager._clean_digits(raw)
+        return OCRReading(s, OCRManager._parse_price(s), float(confs.min()),
+                          [float(c) for c in confs], "glyph")
+
+# ============================= OCR Result Cache =============================
+class OCRResultCache:
+    """
+    按 ROI 像素内容寻址的 LRU 缓存（线程安全）：
+    - key_mode="raw"  : 原始像素字节的 blake2b 指纹（像素完全一致才命中）
+    - key_mode="phash": 二值化后降采样的感知哈希（容忍轻微噪点）
+    """
+    PHASH_SIZE = (64, 16)  # (w, h)
+
+    def __init__(self, maxsize: int = 256, key_mode: str = "raw"):
+        self.maxsize = max(0, int(maxsize))
+        self.key_mode = key_mode
+        self._d: "OrderedDict[bytes, OCRReading]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def key(self, img: np.ndarray) -> bytes:
+        if self.key_mode == "phash":
+            th = OCRManager._preprocess(img, scale=1.0, binarize=True)
+            small = cv2.resize(th, self.PHASH_SIZE, interpolation=cv2.INTER_AREA) > 127
+            return b"p" + np.packbits(small).tobytes()
+        buf = img if img.flags.c_contiguous else np.ascontiguousarray(img)
+        h = hashlib.blake2b(buf.data, digest_size=16)
+        h.update(repr(img.shape).encode())
+        return b"r" + h.digest()
+
+    def get(self, key: bytes) -> Optional[OCRReading]:
+        with self._lock:
+            r = self._d.get(key)
+            if r is None:
+                self.misses += 1
+                return None
+            self._d.move_to_end(key)
+            self.hits += 1
+            return r
+
+    def put(self, key: bytes, reading: OCRReading):
+        with self._lock:
+            self._d[key] = reading
+            self._d.move_to_end(key)
+            while len(self._d) > self.maxsize:
+                self._d.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._d.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._d), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+# ============================= Preprocessing profiles =============================
+@dataclass
+class PreprocessProfile:
+    """
+    单个价格区域的预处理参数（送重型引擎前）。默认值等同原先固定流程：
+    灰度 -> 放大 2 倍 -> Otsu -> 2x2 开运算。
+    """
+    scale: float = 2.0
+    threshold: str = "otsu"     # otsu / adaptive / none
+    morph: str = "open"         # open / close / none（threshold=none 时忽略）
+    channel: str = "gray"       # gray / max（各通道最大值）/ b / g / r
+
+    THRESHOLDS = ("otsu", "adaptive", "none")
+    MORPHS = ("open", "close", "none")
+    CHANNELS = ("gray", "max", "b", "g", "r")
+
+    @staticmethod
+    def from_json(d: Dict[str,Any]) -> 'PreprocessProfile':
+        return PreprocessProfile(scale=float(d.get("scale", 2.0)), threshold=str(d.get("threshold", "otsu")),
+                                 morph=str(d.get("morph", "open")), channel=str(d.get("channel", "gray")))
+
+    def to_json(self) -> Dict[str,Any]:
+        return {"scale": self.scale, "threshold": self.threshold, "morph": self.morph, "channel": self.channel}
+
+    def __str__(self):
+        m = self.morph if self.threshold != "none" else "-"
+        return f"{self.channel}/x{self.scale:g}/{self.threshold}/{m}"
+
+    @traced("preprocess")
+    def apply(self, img: np.ndarray) -> np.ndarray:
+        if img is None or img.size == 0:
+            return img
+        if img.ndim == 2:
+            g = img
+        elif self.channel == "gray":
+            g = OCRManager._to_gray(img)
+        elif self.channel == "max":
+            g = img[:, :, :3].max(axis=2)
+        else:
+            g = img[:, :, "bgr".index(self.channel)]
+        if self.scale != 1.0:
+            h, w = g.shape[:2]
+            interp = cv2.INTER_LINEAR if self.scale > 1.0 else cv2.INTER_AREA
+            g = cv2.resize(g, (max(1, int(w * self.scale)), max(1, int(h * self.scale))), interpolation=interp)
+        elif not g.flags.c_contiguous:
+            g = np.ascontiguousarray(g)
+        if self.threshold == "none":
+            return g
+        if self.threshold == "adaptive":
+            th = cv2.adaptiveThreshold(g, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 15, -5)
+        else:
+            _, th = cv2.threshold(g, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        if self.morph != "none":
+            op = cv2.MORPH_OPEN if self.morph == "open" else cv2.MORPH_CLOSE
+            th = cv2.morphologyEx(th, op, np.ones((2, 2), np.uint8), iterations=1)
+        return th
+
+
+class PreprocessTuner:
+    """
+    在一组已标注的 ROI 上搜索 通道 × 缩放 × 阈值方法 × 形态学，
+    选出准确率 ≥ target 的组合中（预处理 + 推理）中位延迟最低的一个。
+    - 推理直接调用重型引擎（不经过缓存 / 字形通道），与实际慢路径一致
+    - 某组合的错误数一旦超过允许值即提前放弃，不再跑完整个样本集
+    """
+    SCALES = (1.0, 1.5, 2.0)
+
+    def __init__(self, ocr: 'OCRManager', target_acc: float = 0.98, logger=lambda s: None):
+        self.ocr = ocr
+        self.target_acc = target_acc
+        self.logger = logger
+
+    def candidates(self) -> List[PreprocessProfile]:
+        out = []
+        for ch in PreprocessProfile.CHANNELS:
+            for sc in self.SCALES:
+                out.append(PreprocessProfile(sc, "none", "none", ch))
+                for th in ("otsu", "adaptive"):
+                    for m in PreprocessProfile.MORPHS:
+                        out.append(PreprocessProfile(sc, th, m, ch))
+        return out
+
+    def evaluate(self, prof: PreprocessProfile, samples: List[Tuple[np.ndarray, str]]) -> Dict[str, Any]:
+        allowed = int(len(samples) * (1.0 - self.target_acc))
+        errors, lat = 0, []
+        for img, label in samples:
+            t0 = time.perf_counter()
+            text, _ = self.ocr._engine_text(prof.apply(img))
+            lat.append((time.perf_counter() - t0) * 1000.0)
+            if OCRManager._clean_digits(text) != OCRManager._clean_digits(label):
+                errors += 1
+                if errors > allowed:
+                    break
+        n = len(lat)
+        return {"profile": prof.to_json(), "name": str(prof), "evaluated": n,
+                "accuracy": round(1.0 - errors / max(1, n), 4), "passed": errors <= allowed and n == len(samples),
+                "p50_ms": round(float(np.median(lat)), 3) if lat else None}
+
+    def tune(self, samples: List[Tuple[np.ndarray, str]]) -> Tuple[Optional[PreprocessProfile], List[Dict[str, Any]]]:
+        # 先用一张样本预热，避免首个组合吃到引擎的初始化开销
+        if samples:
+            self.ocr._engine_text(PreprocessProfile().apply(samples[0][0]))
+        results = []
+        for prof in self.candidates():
+            r = self.evaluate(prof, samples)
+            results.append(r)
+            self.logger(f"{r['name']:<26} 准确率={r['accuracy']:.3f} p50={r['p50_ms']}ms {'✓' if r['passed'] else ''}")
+        passed = [r for r in results if r["passed"]]
+        if not passed:
+            return None, results
+        best = min(passed, key=lambda r: r["p50_ms"])
+        return PreprocessProfile.from_json(best["profile"]), results
 
 # ============================= OCR Manager (GPU first) =============================
 class OCRManager:
-    """Try PaddleOCR (GPU) -> EasyOCR (GPU). Fallback to CPU (not recommended)."""
-    def __init__(self, logger):
+    """Glyph fast path -> PaddleOCR (GPU) -> EasyOCR (GPU). Fallback to CPU (not recommended)."""
+    def __init__(self, logger, glyph_min_conf: float = 0.85, glyph_path: Optional[str] = GLYPH_TEMPLATES_PATH,
+                 cache_size: int = 256, cache_key: str = "raw", defer: bool = False, rec_only: bool = True,
+                 profiles: Optional[Dict[str, PreprocessProfile]] = None):
+        """
+        defer=True 时不加载模型，由调用方 start_background() 在后台线程加载。
+        rec_only=True 时跳过文字检测网络，ROI 直接送识别器（价格 ROI 已是紧贴的单行文字）。
+        profiles：区域名 -> 自动调优得到的预处理参数；未配置的区域使用 pre_scale / pre_binarize。
+        """
         self.logger = logger
         self.backend = None  # "paddle" | "easyocr"
         self.paddle = None
         self.easy = None
-        self._init_ocr()
+        self.glyph = GlyphDigitRecognizer(glyph_path)
+        self.glyph_min_conf = glyph_min_conf
+        self.rec_only = rec_only
+        self.pre_scale = 2.0       # 送重型引擎前的预处理参数
+        self.pre_binarize = True
+        self.profiles: Dict[str, PreprocessProfile] = dict(profiles or {})
+        self.cache = OCRResultCache(cache_size, cache_key)
+        self.ready = threading.Event()
+        self.init_error: Optional[Exception] = None
+        if self.glyph.ready:
+            self.logger(f"OCR: 字形模板快速通道已加载（{len(self.glyph.labels)} 个字形）")
+        if not defer:
+            self._init_ocr()
+            self.ready.set()
+
+    @classmethod
+    def from_config(cls, cfg: 'AppConfig', logger, defer: bool = False) -> 'OCRManager':
+        return cls(logger=logger, glyph_min_conf=cfg.glyph_min_confidence, cache_size=cfg.ocr_cache_size,
+                   cache_key=cfg.ocr_cache_key, defer=defer, rec_only=cfg.ocr_recognition_only,
+                   profiles=cfg.ocr_profiles)
+
+    def start_background(self, on_ready=None, timer: Optional[StartupTimer] = None):
+        """
+        后台线程：加载 OCR 模型 -> 用假 ROI 预热一次推理 -> 置 ready；完成后回调 on_ready(ok)。
+        """
+        def work():
+            ok = True
+            try:
+                t0 = time.perf_counter()
+                self._init_ocr()
+                t1 = time.perf_counter()
+                self.warm_up()
+                t2 = time.perf_counter()
+                if timer is not None:
+                    timer.add("ocr_load", (t1 - t0) * 1000)
+                    timer.add("ocr_warmup", (t2 - t1) * 1000)
+            except Exception as e:
+                ok = False
+                self.init_error = e
+                self.logger(f"OCR 后台初始化失败：{e}")
+            finally:
+                self.ready.set()
+                if on_ready is not None:
+                    on_ready(ok)
+        threading.Thread(target=work, name="ocr-init", daemon=True).start()
+
+    def warm_up(self):
+        """用一张合成的数字 ROI 跑一遍完整识别，把首次推理的初始化开销挪到启动阶段。"""
+        img = np.full((32, 160, 3), 30, np.uint8)
+        cv2.putText(img, "1234567.89", (4, 24), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (230, 230, 230), 2)
+        self._engine_text(self._preprocess(img, scale=self.pre_scale, binarize=self.pre_binarize))
+        if self.glyph.ready:
+            self.glyph.read(img)
+
+    def _load_backend(self, name: str, gpu: bool):
+        """加载指定引擎（"paddle" | "easyocr"），失败时抛出异常"""
+        if name == "paddle":
+            from paddleocr import PaddleOCR
+            self.paddle = PaddleOCR(use_angle_cls=False, lang='en', use_gpu=gpu)
+        elif name == "easyocr":
+            import easyocr
+            self.easy = easyocr.Reader(['en'], gpu=gpu)  # loads model once
+        else:
+            raise ValueError(f"unknown OCR backend: {name}")
+        self.backend = name
 
     def _init_ocr(self):
         # Try PaddleOCR GPU
         try:
-            from paddleocr import PaddleOCR
-            self.paddle = PaddleOCR(use_angle_cls=False, lang='en', use_gpu=True)
-            self.backend = "paddle"
+            self._load_backend("paddle", gpu=True)
             self.logger("OCR: PaddleOCR(GPU) 已启用")
             return
         except Exception as e:
@@ -48,9 +695,7 @@ class OCRManager:
 
         # Try EasyOCR GPU
         try:
-            import easyocr
-            self.easy = easyocr.Reader(['en'], gpu=True)  # loads model once
-            self.backend = "easyocr"
+            self._load_backend("easyocr", gpu=True)
             self.logger("OCR: EasyOCR(GPU) 已启用")
             return
         except Exception as e:
@@ -58,28 +703,32 @@ class OCRManager:
 
         # Fallback CPU
         try:
-            from paddleocr import PaddleOCR
-            self.paddle = PaddleOCR(use_angle_cls=False, lang='en', use_gpu=False)
-            self.backend = "paddle"
+            self._load_backend("paddle", gpu=False)
             self.logger("⚠️ OCR: GPU 不可用，暂用 PaddleOCR(CPU)")
         except Exception:
             try:
-                import easyocr
-                self.easy = easyocr.Reader(['en'], gpu=False)
-                self.backend = "easyocr"
+                self._load_backend("easyocr", gpu=False)
                 self.logger("⚠️ OCR: GPU 不可用，暂用 EasyOCR(CPU)")
             except Exception as e:
                 self.logger("❌ OCR 初始化失败，请安装 PaddleOCR 或 EasyOCR（含 GPU 支持）")
                 raise e
 
     @staticmethod
+    def _to_gray(img: np.ndarray) -> np.ndarray:
+        if img.ndim == 2:
+            return img
+        return cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+
+    @staticmethod
+    @traced("preprocess")
     def _preprocess(img: np.ndarray, scale: float = 2.0, binarize: bool = True) -> np.ndarray:
         """
         Preprocess ROI: grayscale -> resize -> (optional) threshold -> morphology
+        Accepts BGR, BGRA (zero-copy capture views) or single-channel input.
         """
         if img is None or img.size == 0:
             return img
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        gray = OCRManager._to_gray(img)
         if scale != 1.0:
             h, w = gray.shape[:2]
             gray = cv2.resize(gray, (int(w*scale), int(h*scale)), interpolation=cv2.INTER_LINEAR)
@@ -90,46 +739,361 @@ class OCRManager:
             return th
         return gray
 
-    def read_text(self, img_bgr: np.ndarray, digits_only: bool = True) -> str:
+    @traced("infer")
+    def _engine_detect(self, roi: np.ndarray) -> List[Tuple[float, str, float]]:
         """
-        Return best numeric text detected in the image.
+        Run the heavy OCR engine (det + rec) -> [(box center y, text, confidence)]
         """
-        roi = self._preprocess(img_bgr, scale=2.0, binarize=True)
+        out: List[Tuple[float, str, float]] = []
         if self.backend == "paddle" and self.paddle is not None:
             result = self.paddle.ocr(roi, cls=False, det=True, rec=True)
-            text_candidates = []
-            for line in result:
-                for item in line:
-                    txt, conf = item[1]
-                    text_candidates.append((txt, conf))
-            text_candidates.sort(key=lambda x: x[1], reverse=True)
-            text = text_candidates[0][0] if text_candidates else ""
+            for line in result or []:
+                for item in line or []:
+                    box, (txt, conf) = item[0], item[1]
+                    out.append((float(np.mean([p[1] for p in box])), txt, float(conf)))
         elif self.backend == "easyocr" and self.easy is not None:
-            result = self.easy.readtext(roi)
-            result.sort(key=lambda x: x[2], reverse=True)
-            text = result[0][1] if result else ""
-        else:
-            text = ""
+            for box, txt, conf in self.easy.readtext(roi):
+                out.append((float(np.mean([p[1] for p in box])), txt, float(conf)))
+        return out
 
-        if digits_only:
-            cleaned = "".join(ch for ch in text if (ch.isdigit() or ch in ".,")) \
-                      .replace(",", "")
-            return cleaned
-        return text
+    def _engine_read(self, roi: np.ndarray) -> Tuple[str, float]:
+        """
+        Run the heavy OCR engine on a preprocessed ROI -> (best text, confidence)
+        """
+        cands = self._engine_detect(roi)
+        if not cands:
+            return "", 0.0
+        _, txt, conf = max(cands, key=lambda c: c[2])
+        return txt, conf
 
-    def read_price_value(self, img_bgr: np.ndarray) -> Optional[float]:
-        s = self.read_text(img_bgr, digits_only=True)
+    ALLOWLIST = "0123456789.,"
+
+    @traced("infer")
+    def _engine_recognize(self, rois: List[np.ndarray]) -> List[Tuple[str, float]]:
+        """
+        Recognition only (no text detection): each preprocessed ROI is one text line.
+        Returns (text, confidence) per ROI; all ROIs go through the recognizer in one batch.
+        """
+        if not rois:
+            return []
+        if self.backend == "paddle" and self.paddle is not None:
+            imgs = [cv2.cvtColor(r, cv2.COLOR_GRAY2BGR) if r.ndim == 2 else r for r in rois]
+            rec = getattr(self.paddle, "text_recognizer", None)
+            if rec is not None:
+                rec_res, _ = rec(imgs)
+                return [(txt, float(conf)) for txt, conf in rec_res]
+            out = []
+            for img in imgs:
+                res = self.paddle.ocr(img, cls=False, det=False, rec=True)
+                txt, conf = (res[0][0] if res and res[0] else ("", 0.0))
+                out.append((txt, float(conf)))
+            return out
+        elif self.backend == "easyocr" and self.easy is not None:
+            canvas, spans = self._tile_vertical(rois)
+            w = canvas.shape[1]
+            boxes = [[0, w, y0, y1] for y0, y1 in spans]
+            result = self.easy.recognize(canvas, horizontal_list=boxes, free_list=[],
+                                         allowlist=self.ALLOWLIST, batch_size=len(boxes), detail=1)
+            # recognize() 按输入框顺序返回；保险起见仍按框中心 y 归位
+            out: List[Tuple[str, float]] = [("", 0.0)] * len(rois)
+            for box, txt, conf in result:
+                cy = float(np.mean([p[1] for p in box]))
+                for k, (y0, y1) in enumerate(spans):
+                    if y0 <= cy < y1:
+                        out[k] = (txt, float(conf))
+                        break
+            return out
+        return [("", 0.0)] * len(rois)
+
+    def _engine_text(self, roi: np.ndarray) -> Tuple[str, float]:
+        if self.rec_only:
+            return self._engine_recognize([roi])[0]
+        return self._engine_read(roi)
+
+    @staticmethod
+    def _clean_digits(text: str) -> str:
+        return "".join(ch for ch in text if (ch.isdigit() or ch in ".,")).replace(",", "")
+
+    @staticmethod
+    def _parse_price(s: str) -> Optional[float]:
         if not s:
             return None
         try:
             parts = s.split(".")
             if len(parts) > 2:
                 s = parts[0] + "." + "".join(parts[1:])
-            val = float(s)
-            return val
+            return float(s)
         except Exception:
             return None
 
+    def read_text(self, img_bgr: np.ndarray, digits_only: bool = True) -> str:
+        """
+        Return best numeric text detected in the image.
+        """
+        roi = self._preprocess(img_bgr, scale=self.pre_scale, binarize=self.pre_binarize)
+        text, _ = self._engine_text(roi)
+        if digits_only:
+            return self._clean_digits(text)
+        return text
+
+    def _prep(self, img_bgr: np.ndarray, region: Optional[str] = None) -> np.ndarray:
+        """按区域的调优参数预处理；无调优参数时走默认流程"""
+        prof = self.profiles.get(region) if region else None
+        if prof is not None:
+            return prof.apply(img_bgr)
+        return self._preprocess(img_bgr, scale=self.pre_scale, binarize=self.pre_binarize)
+
+    def _cache_key(self, img_bgr: np.ndarray, region: Optional[str]) -> bytes:
+        key = self.cache.key(img_bgr)
+        # 不同预处理参数可能读出不同结果：有调优参数的区域单独占一组键
+        return (region.encode() + b"|" + key) if region and region in self.profiles else key
+
+    @traced("ocr")
+    def read_price(self, img_bgr: np.ndarray, region: Optional[str] = None) -> OCRReading:
+        """
+        像素缓存 -> 字形模板快速通道 -> PaddleOCR / EasyOCR（置信度不足时）。
+        region：区域名，用于选择该区域的预处理参数。
+        """
+        if img_bgr is None or img_bgr.size == 0:
+            return OCRReading("", None, 0.0, [], "")
+        key = None
+        if self.cache.enabled:
+            key = self._cache_key(img_bgr, region)
+            hit = self.cache.get(key)
+            if hit is not None:
+                return hit
+        r = self._read_price_uncached(img_bgr, region)
+        if key is not None:
+            self.cache.put(key, r)
+        return r
+
+    def _read_price_uncached(self, img_bgr: np.ndarray, region: Optional[str] = None) -> OCRReading:
+        if self.glyph.ready:
+            r = self.glyph.read(img_bgr)
+            if r.value is not None and r.confidence >= self.glyph_min_conf:
+                return r
+        roi = self._prep(img_bgr, region)
+        text, conf = self._engine_text(roi)
+        s = self._clean_digits(text)
+        return OCRReading(s, self._parse_price(s), float(conf), [float(conf)] * len(s), self.backend or "")
+
+    def cache_report(self) -> str:
+        st = self.cache.stats()
+        return f"OCR缓存：命中 {st['hits']} / 未命中 {st['misses']} / 淘汰 {st['evictions']} / 当前 {st['size']}"
+
+    def read_price_value(self, img_bgr: np.ndarray) -> Optional[float]:
+        return self.read_price(img_bgr).value
+
+    BATCH_GAP = 16  # 拼图时各 ROI 之间的空白行（预处理后像素）
+
+    def read_prices_batch(self, rois: List[np.ndarray],
+                          regions: Optional[List[Optional[str]]] = None) -> List[OCRReading]:
+        """
+        多个价格 ROI 一次识别：缓存/字形命中的直接返回，其余预处理后
+        - rec_only：整批直接送识别器（一次 batch）
+        - 否则纵向拼成一张图只跑一次 PaddleOCR / EasyOCR，再按检测框中心 y 坐标分回各 ROI
+        """
+        regions = regions or [None] * len(rois)
+        results: List[Optional[OCRReading]] = [None] * len(rois)
+        keys: List[Optional[bytes]] = [None] * len(rois)
+        pending: List[int] = []
+        for i, img in enumerate(rois):
+            if img is None or img.size == 0:
+                results[i] = OCRReading("", None, 0.0, [], "")
+                continue
+            if self.cache.enabled:
+                keys[i] = self._cache_key(img, regions[i])
+                hit = self.cache.get(keys[i])
+                if hit is not None:
+                    results[i] = hit
+                    continue
+            if self.glyph.ready:
+                r = self.glyph.read(img)
+                if r.value is not None and r.confidence >= self.glyph_min_conf:
+                    results[i] = r
+                    if keys[i] is not None:
+                        self.cache.put(keys[i], r)
+                    continue
+            pending.append(i)
+
+        if pending:
+            tiles = [self._prep(rois[i], regions[i]) for i in pending]
+            best: Dict[int, Tuple[str, float]] = {}
+            if self.rec_only:
+                best = dict(enumerate(self._engine_recognize(tiles)))
+            else:
+                canvas, spans = self._tile_vertical(tiles)
+                for cy, txt, conf in self._engine_detect(canvas):
+                    for k, (y0, y1) in enumerate(spans):
+                        if y0 <= cy < y1:
+                            if k not in best or conf > best[k][1]:
+                                best[k] = (txt, conf)
+                            break
+            for k, i in enumerate(pending):
+                txt, conf = best.get(k, ("", 0.0))
+                s = self._clean_digits(txt)
+                r = OCRReading(s, self._parse_price(s), float(conf), [float(conf)] * len(s), self.backend or "")
+                results[i] = r
+                if keys[i] is not None:
+                    self.cache.put(keys[i], r)
+        return results
+
+    @classmethod
+    def _tile_vertical(cls, tiles: List[np.ndarray]) -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+        """
+        将若干单通道图纵向拼接（右侧与间隔用各自的背景色填充） -> (canvas, 每块的 [y0, y1))
+        """
+        width = max(t.shape[1] for t in tiles)
+        blocks, spans, y = [], [], 0
+        for t in tiles:
+            bg = int(np.median(np.concatenate([t[0], t[-1], t[:, 0], t[:, -1]])))
+            block = np.full((t.shape[0] + cls.BATCH_GAP, width), bg, np.uint8)
+            block[cls.BATCH_GAP // 2:cls.BATCH_GAP // 2 + t.shape[0], :t.shape[1]] = t
+            blocks.append(block)
+            spans.append((y, y + block.shape[0]))
+            y += block.shape[0]
+        return np.vstack(blocks), spans
+
+    def learn_glyphs(self, img_bgr: np.ndarray, label: str) -> bool:
+        """
+        用一张已标注的价格 ROI 学习字形模板，并保存到磁盘。
+        """
+        ok = self.glyph.learn(img_bgr, label)
+        if ok:
+            self.glyph.save()
+            self.cache.clear()  # 模板变化后旧结果可能不再成立
+            self.logger(f"字形学习：'{label}' 已加入模板（共 {len(self.glyph.labels)} 个字形）")
+        else:
+            self.logger(f"字形学习失败：分割出的字符数与标注 '{label}' 不一致")
+        return ok
+
+# ============================= Frame Change Gate =============================
+class FrameChangeGate:
+    """
+    ROI 变化检测：保留上一次送 OCR 的帧（降采样灰度），按“变化像素数”打分：
+    灰度差超过 PIXEL_DIFF 的像素个数。不用全图平均差——价格只变一位数字时，
+    平均差会被大片不变的背景摊薄到阈值以下。
+    - changed(img): 与参考帧差异超过阈值则更新参考帧并返回 True
+    - wait_change(grab, timeout): 阻塞直到区域变化或超时（只比较，不更新参考帧）
+    threshold <= 0 时关闭门控（每帧都视为变化）。
+    """
+    DOWNSAMPLE = 2
+    PIXEL_DIFF = 24  # 灰度差超过该值才算变化像素（滤掉抗锯齿 / 压缩噪点）
+
+    def __init__(self, threshold: float = 1.0):
+        self.threshold = float(threshold)
+        self._ref: Optional[np.ndarray] = None
+
+    def _small(self, img: np.ndarray) -> np.ndarray:
+        gray = OCRManager._to_gray(img)
+        h, w = gray.shape[:2]
+        return cv2.resize(gray, (max(1, w // self.DOWNSAMPLE), max(1, h // self.DOWNSAMPLE)),
+                          interpolation=cv2.INTER_AREA)
+
+    def reset(self):
+        self._ref = None
+
+    def score(self, img: np.ndarray) -> float:
+        if self._ref is None or img is None or img.size == 0:
+            return float("inf")
+        small = self._small(img)
+        if small.shape != self._ref.shape:
+            return float("inf")
+        return float(np.count_nonzero(cv2.absdiff(small, self._ref) > self.PIXEL_DIFF))
+
+    def changed(self, img: np.ndarray) -> bool:
+        if self.threshold <= 0:
+            return True
+        if self.score(img) < self.threshold:
+            return False
+        self._ref = self._small(img)
+        return True
+
+    def wait_change(self, grab, timeout: float, stop_flag: threading.Event,
+                    poll: float = 0.01) -> Tuple[Optional[np.ndarray], bool]:
+        """
+        反复 grab() 直到画面相对参考帧发生变化 / 超时 / 停止；返回 (最后一帧, 是否变化)。
+        """
+        if self.threshold <= 0 or self._ref is None:
+            # 门控关闭 / 尚无参考帧：退化为普通定时等待
+            stop_flag.wait(timeout)
+            return (None if stop_flag.is_set() else grab()), True
+        deadline = time.perf_counter() + timeout
+        img = None
+        while not stop_flag.is_set():
+            img = grab()
+            if self.score(img) >= self.threshold:
+                return img, True
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            stop_flag.wait(min(poll, remaining))
+        return img, False
+
+class GatedPriceReader:
+    """
+    每个区域一个 FrameChangeGate：画面与上次识别时相比未变化 -> 沿用上次结果，不送 OCR。
+    """
+    def __init__(self, ocr: 'OCRManager', threshold: float):
+        self.ocr = ocr
+        self.threshold = threshold
+        self.gates: Dict[str, FrameChangeGate] = {}
+        self.last: Dict[str, Optional[float]] = {}
+        self.conf: Dict[str, float] = {}
+        self.ocr_calls = 0
+        self.gated_skips = 0
+        self.recorder: Optional['FlightRecorder'] = None  # 每次读数连同帧写入飞行记录
+
+    def gate(self, name: str) -> FrameChangeGate:
+        if name not in self.gates:
+            self.gates[name] = FrameChangeGate(self.threshold)
+        return self.gates[name]
+
+    def read(self, name: str, img: Optional[np.ndarray]) -> Optional[float]:
+        return self.read_many({name: img})[name]
+
+    def read_many(self, frames: Dict[str, Optional[np.ndarray]]) -> Dict[str, Optional[float]]:
+        """
+        多个区域一起读：未变化的沿用上次结果；变化的区域若不止一个且 OCR 支持，
+        合成一次 read_prices_batch 调用（一次引擎识别），否则逐个 read_price。
+        """
+        out: Dict[str, Optional[float]] = {}
+        todo: List[str] = []
+        for name, img in frames.items():
+            if img is None:
+                out[name] = None
+                continue
+            if not self.gate(name).changed(img) and name in self.last:
+                self.gated_skips += 1
+                if self.recorder is not None:
+                    self.recorder.add(name, img, self.last[name], self.conf.get(name, 0.0), 0.0, True)
+                out[name] = self.last[name]
+                continue
+            todo.append(name)
+        if not todo:
+            return out
+        self.ocr_calls += len(todo)
+        batch = getattr(self.ocr, "read_prices_batch", None)
+        t0 = time.perf_counter()
+        if len(todo) > 1 and batch is not None:
+            readings = batch([frames[n] for n in todo], todo)
+        else:
+            readings = [self.ocr.read_price(frames[n], n) for n in todo]
+        dt = (time.perf_counter() - t0) / len(todo)
+        for name, r in zip(todo, readings):
+            p = r.value
+            if p is None:
+                self.gate(name).reset()  # 识别失败时下一帧必须重新识别
+            self.last[name] = p
+            self.conf[name] = r.confidence
+            if self.recorder is not None:
+                self.recorder.add(name, frames[name], p, r.confidence, dt)
+            out[name] = p
+        return out
+
+    def report(self) -> str:
+        return f"变化门控：OCR {self.ocr_calls} 次，跳过未变化帧 {self.gated_skips} 次"
+
 # ============================= Screen capture (thread-safe) =============================
 class Screen:
     """
@@ -142,6 +1106,7 @@ class Screen:
         if not hasattr(self._tls, "sct"):
             self._tls.sct = mss.mss()
 
+    @traced("grab")
     def grab_region(self, region: Tuple[int,int,int,int]) -> np.ndarray:
         """
         region: (x, y, w, h)  -> BGR image
@@ -153,88 +1118,631 @@ class Screen:
         bgr = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)      # -> BGR
         return bgr
 
-    @staticmethod
-    def click(x: int, y: int, button="left"):
-        pyautogui.moveTo(x, y)
-        pyautogui.click(button=button)
-
-    @staticmethod
-    def press_esc():
-        pyautogui.press('esc')
+    @traced("grab")
+    def grab_raw(self, region: Tuple[int,int,int,int]) -> np.ndarray:
+        """
+        region: (x, y, w, h)  -> BGRA 视图（直接包裹 mss 的像素缓冲，不拷贝、不转色）
+        """
+        self._ensure_ctx()
+        x, y, w, h = region
+        monitor = {"left": int(x), "top": int(y), "width": int(w), "height": int(h)}
+        return np.asarray(self._tls.sct.grab(monitor))
 
     @staticmethod
     def get_pixel(x: int, y: int) -> Tuple[int,int,int]:
-        return pyautogui.screenshot().getpixel((x, y))
-
-# ============================= Macro Recorder =============================
-@dataclass
-class MacroEvent:
-    t: float          # timestamp relative to start
-    kind: str         # "mouse_click" / "mouse_move" / "key_down" / "key_up"
-    data: dict
+        """1x1 mss 抓取（不再整屏截图）-> (R, G, B)"""
+        b, g, r = Screen().grab_raw((x, y, 1, 1))[0, 0, :3]
+        return (int(r), int(g), int(b))
 
-class MacroRecorder:
-    def __init__(self, logger):
-        self.logger = logger
-        self.events: List[MacroEvent] = []
-        self._recording = False
-        self._start_time = 0.0
-        self.mouse_listener = None
-        self.keyboard_listener = None
+class FrameCapture:
+    """
+    单次抓取：每个 tick 只对所有区域的外接矩形做一次 mss 抓取，拷入预分配的 BGRA 缓冲区，
+    各区域以该缓冲区上的 NumPy 视图返回（零拷贝）。
+    注意：视图在下一次 grab() 时会被覆盖，需要保留的数据请自行 copy。
+    """
+    def __init__(self, screen: Screen, regions: Dict[str, Tuple[int,int,int,int]]):
+        self.screen = screen
+        self.set_regions(regions)
 
-    def start(self):
-        if self._recording:
+    def set_regions(self, regions: Dict[str, Tuple[int,int,int,int]]):
+        regions = {k: tuple(int(v) for v in r) for k, r in regions.items() if r[2] > 0 and r[3] > 0}
+        self.regions = regions
+        if not regions:
+            self.bbox = (0, 0, 0, 0)
+            self._buf = np.empty((0, 0, 4), np.uint8)
+            self._views: Dict[str, np.ndarray] = {}
             return
-        self.logger("开始录制（再次点击停止）...")
-        self.events.clear()
-        self._recording = True
-        self._start_time = time.time()
+        x0 = min(r[0] for r in regions.values())
+        y0 = min(r[1] for r in regions.values())
+        x1 = max(r[0] + r[2] for r in regions.values())
+        y1 = max(r[1] + r[3] for r in regions.values())
+        self.bbox = (x0, y0, x1 - x0, y1 - y0)
+        self._buf = np.empty((y1 - y0, x1 - x0, 4), np.uint8)
+        self._views = {k: self._buf[y - y0:y - y0 + h, x - x0:x - x0 + w]
+                       for k, (x, y, w, h) in regions.items()}
 
-        def on_click(x, y, button, pressed):
-            if not self._recording:
-                return False
-            t = time.time() - self._start_time
-            if pressed:
-                self.events.append(MacroEvent(t, "mouse_click", {"x": x, "y": y, "button": str(button), "action": "down"}))
-            else:
-                self.events.append(MacroEvent(t, "mouse_click", {"x": x, "y": y, "button": str(button), "action": "up"}))
-            return True
+    def grab(self) -> Dict[str, np.ndarray]:
+        if self._buf.size:
+            np.copyto(self._buf, self.screen.grab_raw(self.bbox))
+        return self._views
 
-        def on_move(x, y):
-            if not self._recording:
-                return False
-            t = time.time() - self._start_time
-            self.events.append(MacroEvent(t, "mouse_move", {"x": x, "y": y}))
-            return True
+# ============================= Input backends =============================
+class InputBackend:
+    """
+    输入注入接口：worker / 宏回放只通过它点击、按键。
+    子类实现 move / button / key 三个原语；click / press / run 在其上组合。
+    run() 一次执行一串动作（如“最大额度点 N 次”），动作之间不经过调用方：
+        ("click", x, y[, n])  ("press", key)  ("move", x, y)  ("sleep", 秒)
+    """
+    name = "base"
+    REPEAT_GAP_S = 0.02  # 同一位置连点时两次点击的间隔，避免被当成双击
 
-        def on_press(key):
-            if not self._recording:
-                return False
-            t = time.time() - self._start_time
-            try:
-                k = key.char if hasattr(key, 'char') and key.char else str(key)
-            except:
-                k = str(key)
-            self.events.append(MacroEvent(t, "key_down", {"key": k}))
-            return True
+    def move(self, x: int, y: int):
+        raise NotImplementedError
 
-        def on_release(key):
-            if not self._recording:
-                return False
-            t = time.time() - self._start_time
-            try:
-                k = key.char if hasattr(key, 'char') and key.char else str(key)
-            except:
-                k = str(key)
-            self.events.append(MacroEvent(t, "key_up", {"key": k}))
-            return True
+    def button(self, x: int, y: int, button: str, down: bool):
+        raise NotImplementedError
 
-        self.mouse_listener = mouse.Listener(on_click=on_click, on_move=on_move)
-        self.keyboard_listener = keyboard.Listener(on_press=on_press, on_release=on_release)
-        self.mouse_listener.start()
-        self.keyboard_listener.start()
+    def key(self, key: str, down: bool):
+        raise NotImplementedError
 
-    def stop(self):
+    @traced("click")
+    def click(self, x: int, y: int, button: str = "left", n: int = 1):
+        self.move(x, y)
+        for i in range(n):
+            if i:
+                time.sleep(self.REPEAT_GAP_S)
+            self.button(x, y, button, True)
+            self.button(x, y, button, False)
+
+    @traced("key")
+    def press(self, key: str):
+        self.key(key, True)
+        self.key(key, False)
+
+    def exclusive(self):
+        """一整段动作（如宏回放）期间独占输入，别的实例的动作不会插进来；单实例时什么也不做"""
+        return contextlib.nullcontext()
+
+    def run(self, actions):
+        for a in actions:
+            op = a[0]
+            if op == "click":
+                self.click(a[1], a[2], n=a[3] if len(a) > 3 else 1)
+            elif op == "press":
+                self.press(a[1])
+            elif op == "move":
+                self.move(a[1], a[2])
+            elif op == "sleep":
+                time.sleep(a[1])
+            else:
+                raise ValueError(f"未知输入动作：{op}")
+
+
+class InputFailSafe(RuntimeError):
+    """鼠标被移到屏幕左上角：紧急停止（与 pyautogui.FAILSAFE 行为一致）"""
+
+
+class PynputInput(InputBackend):
+    """pynput Controller 直接注入：无 pyautogui 的每次调用 PAUSE，单次点击亚毫秒级"""
+    name = "pynput"
+
+    def __init__(self):
+        self._mouse = None
+        self._kb = None
+
+    @property
+    def m(self):
+        if self._mouse is None:
+            self._mouse = mouse.Controller()
+        return self._mouse
+
+    @property
+    def kb(self):
+        if self._kb is None:
+            self._kb = keyboard.Controller()
+        return self._kb
+
+    @staticmethod
+    def _button(name: str):
+        return getattr(mouse.Button, name if name in MOUSE_BUTTONS else "left")
+
+    @staticmethod
+    def _key(name: str):
+        """'a' / 'esc' / 录制得到的 'Key.esc' -> pynput 键"""
+        if len(name) == 1:
+            return name
+        if name.startswith("Key."):
+            name = name[4:]
+        k = getattr(keyboard.Key, name, None)
+        return k if k is not None else name
+
+    def _check_failsafe(self):
+        px, py = self.m.position
+        if px <= 0 and py <= 0:
+            raise InputFailSafe("鼠标位于屏幕左上角，已紧急停止输入")
+
+    def move(self, x: int, y: int):
+        self._check_failsafe()
+        self.m.position = (x, y)
+
+    def button(self, x: int, y: int, button: str, down: bool):
+        self._check_failsafe()
+        self.m.position = (x, y)
+        (self.m.press if down else self.m.release)(self._button(button))
+
+    def key(self, key: str, down: bool):
+        (self.kb.press if down else self.kb.release)(self._key(key))
+
+    @traced("click")
+    def click(self, x: int, y: int, button: str = "left", n: int = 1):
+        self._check_failsafe()
+        self.m.position = (x, y)
+        btn = self._button(button)
+        for i in range(n):
+            if i:
+                time.sleep(self.REPEAT_GAP_S)
+            self.m.click(btn)
+
+
+class PyautoguiInput(InputBackend):
+    """原 pyautogui 路径（关闭每次调用后的 PAUSE），pynput 不可用时的后备"""
+    name = "pyautogui"
+
+    @staticmethod
+    def _key(name: str) -> str:
+        return name[4:] if name.startswith("Key.") else name
+
+    def move(self, x: int, y: int):
+        pyautogui.moveTo(x, y, _pause=False)
+
+    def button(self, x: int, y: int, button: str, down: bool):
+        (pyautogui.mouseDown if down else pyautogui.mouseUp)(x=x, y=y, button=button, _pause=False)
+
+    def key(self, key: str, down: bool):
+        (pyautogui.keyDown if down else pyautogui.keyUp)(self._key(key), _pause=False)
+
+
+class RecordingInput(InputBackend):
+    """
+    测试 / 离线回放用：不注入任何输入，只记录 (perf_counter, 动作, 参数)。
+    latency 可模拟每个原语的耗时。
+    """
+    name = "recording"
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: List[Tuple[float, str, tuple]] = []
+        self._lock = threading.Lock()
+
+    def _rec(self, op: str, *args):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls.append((time.perf_counter(), op, args))
+
+    def move(self, x: int, y: int):
+        self._rec("move", x, y)
+
+    def button(self, x: int, y: int, button: str, down: bool):
+        self._rec("down" if down else "up", x, y, button)
+
+    def key(self, key: str, down: bool):
+        self._rec("key_down" if down else "key_up", key)
+
+    def clicks(self) -> List[Tuple[int, int]]:
+        """已记录的完整点击位置（按下事件）"""
+        return [(a[0], a[1]) for _, op, a in self.calls if op == "down"]
+
+    def clear(self):
+        with self._lock:
+            self.calls.clear()
+
+
+INPUT_BACKENDS = {"pynput": PynputInput, "pyautogui": PyautoguiInput, "recording": RecordingInput}
+
+def make_input_backend(name: str = "pynput", logger=lambda s: None) -> InputBackend:
+    """按名称创建输入后端；pynput 未安装时退回 pyautogui（只查找不导入，不拖慢启动）"""
+    if name == "pynput" and importlib.util.find_spec("pynput") is None:
+        logger("⚠️ 未安装 pynput，输入改用 pyautogui")
+        name = "pyautogui"
+    return INPUT_BACKENDS.get(name, PynputInput)()
+
+# ============================= Pixel Probe =============================
+@dataclass
+class PixelCondition:
+    """一组像素点颜色条件：mode="all" 全部满足 / "any" 任一满足"""
+    points: List[Tuple[int, int, Tuple[int,int,int], int]]   # (x, y, rgb, tol)
+    mode: str = "all"
+
+class PixelProbe:
+    """
+    像素探针：多个颜色条件共用一次小范围抓取（所有点的外接矩形），
+    在线程本地的 mss 上下文中完成，用 NumPy 向量化判定。
+    """
+    def __init__(self, screen: Screen, conditions: Dict[str, PixelCondition]):
+        self.screen = screen
+        self.conditions = conditions
+        xs, ys = [], []
+        for c in conditions.values():
+            xs += [p[0] for p in c.points]; ys += [p[1] for p in c.points]
+        x0, y0 = min(xs), min(ys)
+        self.bbox = (x0, y0, max(xs) - x0 + 1, max(ys) - y0 + 1)
+        # 点条件展开为平铺数组，一次索引完成全部比较
+        self._pt_slices: Dict[str, slice] = {}
+        px, py, tgt, tol = [], [], [], []
+        for name, c in conditions.items():
+            start = len(px)
+            for x, y, rgb, t in c.points:
+                px.append(x - x0); py.append(y - y0)
+                tgt.append(rgb[::-1]); tol.append(t)   # 目标色转为 BGR 与帧对齐
+            self._pt_slices[name] = slice(start, len(px))
+        self._px = np.array(px, np.intp)
+        self._py = np.array(py, np.intp)
+        self._tgt = np.array(tgt, np.int16).reshape(-1, 3)
+        self._tol = np.array(tol, np.int16).reshape(-1, 1)
+        self.last_frame: Optional[np.ndarray] = None
+
+    def sample(self) -> np.ndarray:
+        self.last_frame = self.screen.grab_raw(self.bbox)
+        return self.last_frame
+
+    def rgb_at(self, x: int, y: int) -> Tuple[int,int,int]:
+        """上一次采样中 (x, y) 的颜色"""
+        b, g, r = self.last_frame[y - self.bbox[1], x - self.bbox[0], :3]
+        return (int(r), int(g), int(b))
+
+    @traced("probe")
+    def evaluate(self, frame: Optional[np.ndarray] = None) -> Dict[str, bool]:
+        frame = self.sample() if frame is None else frame
+        out: Dict[str, bool] = {}
+        bgr = frame[self._py, self._px, :3].astype(np.int16)
+        ok = (np.abs(bgr - self._tgt) <= self._tol).all(axis=1)
+        for name, c in self.conditions.items():
+            hits = ok[self._pt_slices[name]]
+            out[name] = bool(hits.all() if c.mode == "all" else hits.any())
+        return out
+
+# ============================= UI-state waits =============================
+def wait_until(predicate, timeout: float, stop_flag: Optional[threading.Event] = None,
+               poll: float = 0.005) -> Tuple[bool, float]:
+    """
+    轮询 predicate() 直到为真 / 超时 / 停止 -> (是否满足, 实际等待秒数)。
+    用来代替固定 sleep：界面一到达预期状态就返回。
+    """
+    t0 = time.perf_counter()
+    deadline = t0 + timeout
+    while True:
+        if predicate():
+            return True, time.perf_counter() - t0
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0 or (stop_flag is not None and stop_flag.is_set()):
+            return False, time.perf_counter() - t0
+        if stop_flag is not None:
+            stop_flag.wait(min(poll, remaining))
+        else:
+            time.sleep(min(poll, remaining))
+
+class RoiChanged:
+    """
+    条件：ROI 相对“创建时刻”的画面发生了变化，且已稳定（连续两次采样无变化，避免读到过渡动画）。
+    应在触发界面变化的操作（点击 / 按键）之前创建。
+    """
+    def __init__(self, screen: Screen, region: Tuple[int,int,int,int], threshold: float = 1.0):
+        self.screen = screen
+        self.region = region
+        self.ref = FrameChangeGate(threshold)
+        self.ref.changed(screen.grab_raw(region))
+        self.prev = FrameChangeGate(threshold)
+        self._moved = False
+
+    def __call__(self) -> bool:
+        img = self.screen.grab_raw(self.region)
+        if not self._moved:
+            self._moved = self.ref.score(img) >= self.ref.threshold
+            self.prev.changed(img)
+            return False
+        return not self.prev.changed(img)
+
+class StageStats:
+    """单个阶段最近 N 次耗时（毫秒）"""
+    def __init__(self, name: str, window: int = 512):
+        self.name = name
+        self.samples: deque = deque(maxlen=window)
+
+    def add(self, ms: float):
+        self.samples.append(ms)
+
+    def summary(self) -> str:
+        if not self.samples:
+            return f"{self.name}: -"
+        a = np.fromiter(self.samples, np.float64)
+        return f"{self.name}: p50={np.percentile(a, 50):.1f}ms p95={np.percentile(a, 95):.1f}ms n={len(a)}"
+
+class WaitStats:
+    """记录每类等待的实际耗时、次数与超时次数"""
+    def __init__(self):
+        self.stats: Dict[str, StageStats] = {}
+        self.counts: Dict[str, int] = {}
+        self.timeouts: Dict[str, int] = {}
+
+    def add(self, label: str, secs: float, ok: bool):
+        if label not in self.stats:
+            self.stats[label] = StageStats(label)
+            self.counts[label] = 0
+            self.timeouts[label] = 0
+        self.stats[label].add(secs * 1000)
+        self.counts[label] += 1
+        if not ok:
+            self.timeouts[label] += 1
+
+    def report(self) -> str:
+        if not self.stats:
+            return "界面等待：-"
+        return "界面等待：" + "；".join(f"{st.summary()} 超时={self.timeouts[k]}" for k, st in self.stats.items())
+
+# ============================= Macro Recorder =============================
+MACRO1_PATH = "macro1.npz"
+MACRO2_PATH = "macro2.npz"
+
+# 事件类型（MacroTrack.kind 列）
+EV_MOVE, EV_MOUSE_DOWN, EV_MOUSE_UP, EV_KEY_DOWN, EV_KEY_UP = range(5)
+MOUSE_BUTTONS = ("left", "right", "middle")
+
+def simplify_path(xy: np.ndarray, tol: float) -> np.ndarray:
+    """
+    Ramer–Douglas–Peucker：返回需保留的点的布尔掩码，保证被删点到折线的距离 ≤ tol（像素）。
+    首尾点必定保留；用显式栈代替递归，每段距离计算向量化。
+    """
+    n = len(xy)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    if n < 3 or tol <= 0:
+        keep[:] = True
+        return keep
+    p = xy.astype(np.float64)
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        a, b = p[i], p[j]
+        seg = p[i + 1:j]
+        d = b - a
+        L = float(np.hypot(d[0], d[1]))
+        if L == 0.0:
+            dist = np.hypot(seg[:, 0] - a[0], seg[:, 1] - a[1])
+        else:
+            dist = np.abs(d[0] * (seg[:, 1] - a[1]) - d[1] * (seg[:, 0] - a[0])) / L
+        k = int(np.argmax(dist))
+        if dist[k] > tol:
+            m = i + 1 + k
+            keep[m] = True
+            stack.append((i, m))
+            stack.append((m, j))
+    return keep
+
+
+class MacroTrack:
+    """
+    列式宏事件：t（相对开始秒）、kind、x、y、code 各一列 numpy 数组。
+    code：鼠标事件为 MOUSE_BUTTONS 下标，按键事件为 keys 字符串表下标。
+    录制时按容量倍增追加；保存/读取为压缩 npz。
+    鼠标 / 键盘监听各在自己的线程里追加，所有读写都在 _lock 下进行。
+    """
+    def __init__(self, capacity: int = 1024):
+        self._lock = threading.Lock()
+        self.t = np.zeros(capacity, np.float64)
+        self.kind = np.zeros(capacity, np.uint8)
+        self.x = np.zeros(capacity, np.int32)
+        self.y = np.zeros(capacity, np.int32)
+        self.code = np.zeros(capacity, np.int16)
+        self.keys: List[str] = []
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def clear(self):
+        with self._lock:
+            self.n = 0
+            self.keys = []
+
+    def key_code(self, key: str) -> int:
+        with self._lock:
+            try:
+                return self.keys.index(key)
+            except ValueError:
+                self.keys.append(key)
+                return len(self.keys) - 1
+
+    def append(self, t: float, kind: int, x: int = 0, y: int = 0, code: int = 0):
+        with self._lock:
+            if self.n == len(self.t):
+                cap = 2 * len(self.t)
+                for name in ("t", "kind", "x", "y", "code"):
+                    arr = getattr(self, name)
+                    grown = np.zeros(cap, arr.dtype)
+                    grown[:self.n] = arr[:self.n]
+                    setattr(self, name, grown)
+            i = self.n
+            self.t[i], self.kind[i], self.x[i], self.y[i], self.code[i] = t, kind, x, y, code
+            self.n += 1
+
+    def _columns(self) -> Tuple[np.ndarray, ...]:
+        n = self.n
+        return self.t[:n], self.kind[:n], self.x[:n], self.y[:n], self.code[:n]
+
+    def columns(self) -> Tuple[np.ndarray, ...]:
+        with self._lock:
+            return self._columns()
+
+    def simplify(self, tol: float) -> int:
+        """简化鼠标移动轨迹：对两个非移动事件之间的每段连续 move 做 RDP；返回删除的事件数"""
+        with self._lock:
+            return self._simplify(tol)
+
+    def _simplify(self, tol: float) -> int:
+        t, kind, x, y, code = self._columns()
+        keep = np.ones(self.n, dtype=bool)
+        is_move = kind == EV_MOVE
+        # 连续 move 段的起止下标
+        edges = np.flatnonzero(np.diff(np.r_[0, is_move.view(np.int8), 0]))
+        for s, e in zip(edges[::2], edges[1::2]):
+            if e - s >= 3:
+                keep[s:e] = simplify_path(np.stack([x[s:e], y[s:e]], axis=1), tol)
+        removed = int(self.n - keep.sum())
+        if removed:
+            m = int(keep.sum())
+            for name in ("t", "kind", "x", "y", "code"):
+                arr = getattr(self, name)
+                arr[:m] = arr[:self.n][keep]
+            self.n = m
+        return removed
+
+    def save(self, path: str):
+        with self._lock:
+            t, kind, x, y, code = (c.copy() for c in self._columns())
+            keys = list(self.keys)
+        np.savez_compressed(path, t=t, kind=kind, x=x, y=y, code=code,
+                            keys=np.array(keys, dtype=np.str_))
+
+    @classmethod
+    def load(cls, path: str) -> 'MacroTrack':
+        with np.load(path) as d:
+            n = len(d["t"])
+            tr = cls(max(1024, n))
+            tr.t[:n], tr.kind[:n], tr.x[:n], tr.y[:n], tr.code[:n] = d["t"], d["kind"], d["x"], d["y"], d["code"]
+            tr.keys = [str(k) for k in d["keys"]]
+            tr.n = n
+        return tr
+
+
+# 回放等待：剩余时间大于 SPIN_S 时在停止事件上等待（stop 立即唤醒），最后一段自旋
+SPIN_S = 0.0015
+_NEVER = threading.Event()
+
+def sleep_until(deadline: float, stop: Optional[threading.Event] = None) -> bool:
+    """等到 perf_counter() >= deadline；期间收到停止返回 False"""
+    stop = stop or _NEVER
+    while True:
+        remaining = deadline - time.perf_counter()
+        if remaining <= SPIN_S:
+            break
+        if stop.wait(remaining - SPIN_S):
+            return False
+    while time.perf_counter() < deadline:
+        pass
+    return not stop.is_set()
+
+def replay_schedule(t: np.ndarray, speed: float = 1.0, max_gap: float = 0.0) -> np.ndarray:
+    """
+    录制时间戳 -> 相对回放开始的目标时刻：先压缩超过 max_gap 的空闲间隔，再按倍速缩放。
+    首个事件前的等待（录制开始到第一个事件）同样保留，设了 max_gap 时一并压缩。
+    """
+    if len(t) == 0:
+        return t.astype(np.float64)
+    gaps = np.diff(t, prepend=0.0)
+    if max_gap and max_gap > 0:
+        gaps = np.minimum(gaps, max_gap)
+    return np.cumsum(gaps) / max(speed, 1e-6)
+
+@dataclass
+class ReplayStats:
+    late: np.ndarray      # 每个事件实际发出时刻 - 目标时刻（秒）
+    planned: float        # 计划时长（秒）
+    actual: float         # 实际时长（秒）
+
+    def summary(self) -> Dict[str, float]:
+        ms = self.late * 1000.0
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99]) if len(ms) else (0.0, 0.0, 0.0)
+        return {"events": int(len(ms)), "planned_s": round(self.planned, 3), "actual_s": round(self.actual, 3),
+                "late_mean_ms": round(float(ms.mean()), 3) if len(ms) else 0.0,
+                "late_p50_ms": round(float(p50), 3), "late_p95_ms": round(float(p95), 3),
+                "late_p99_ms": round(float(p99), 3), "late_max_ms": round(float(ms.max()), 3) if len(ms) else 0.0}
+
+    def report(self) -> str:
+        d = self.summary()
+        return (f"{d['events']} 个事件，计划 {d['planned_s']}s / 实际 {d['actual_s']}s，"
+                f"迟到 p50={d['late_p50_ms']}ms p95={d['late_p95_ms']}ms p99={d['late_p99_ms']}ms max={d['late_max_ms']}ms")
+
+
+class MacroRecorder:
+    def __init__(self, logger, path: Optional[str] = None, simplify_px: float = 2.0,
+                 speed: float = 1.0, max_gap: float = 0.0, inp: Optional[InputBackend] = None):
+        self.logger = logger
+        self.input = inp or PynputInput()
+        self.path = path
+        self.simplify_px = simplify_px
+        self.speed = speed
+        self.max_gap = max_gap
+        self.last_stats: Optional[ReplayStats] = None
+        self.track = MacroTrack()
+        self._recording = False
+        self._start_time = 0.0
+        self.mouse_listener = None
+        self.keyboard_listener = None
+        if path and os.path.exists(path):
+            try:
+                self.track = MacroTrack.load(path)
+                logger(f"宏已载入：{path}（{len(self.track)} 个事件）")
+            except Exception as e:
+                logger(f"宏文件读取失败：{path}：{e}")
+
+    def start(self):
+        if self._recording:
+            return
+        self.logger("开始录制（再次点击停止）...")
+        self.track.clear()
+        self._recording = True
+        self._start_time = time.perf_counter()
+        track = self.track
+
+        def button_code(button) -> int:
+            name = str(button)
+            return 1 if "right" in name else 2 if "middle" in name else 0
+
+        def key_name(key) -> str:
+            try:
+                return key.char if hasattr(key, 'char') and key.char else str(key)
+            except:
+                return str(key)
+
+        def on_click(x, y, button, pressed):
+            if not self._recording:
+                return False
+            t = time.perf_counter() - self._start_time
+            track.append(t, EV_MOUSE_DOWN if pressed else EV_MOUSE_UP, x, y, button_code(button))
+            return True
+
+        def on_move(x, y):
+            if not self._recording:
+                return False
+            track.append(time.perf_counter() - self._start_time, EV_MOVE, x, y)
+            return True
+
+        def on_press(key):
+            if not self._recording:
+                return False
+            t = time.perf_counter() - self._start_time
+            track.append(t, EV_KEY_DOWN, code=track.key_code(key_name(key)))
+            return True
+
+        def on_release(key):
+            if not self._recording:
+                return False
+            t = time.perf_counter() - self._start_time
+            track.append(t, EV_KEY_UP, code=track.key_code(key_name(key)))
+            return True
+
+        self.mouse_listener = mouse.Listener(on_click=on_click, on_move=on_move)
+        self.keyboard_listener = keyboard.Listener(on_press=on_press, on_release=on_release)
+        self.mouse_listener.start()
+        self.keyboard_listener.start()
+
+    def stop(self):
         if not self._recording:
             return
         self._recording = False
@@ -242,45 +1750,74 @@ class MacroRecorder:
             self.mouse_listener.stop()
         if self.keyboard_listener:
             self.keyboard_listener.stop()
-        self.logger(f"录制结束，共 {len(self.events)} 个事件。")
+        raw = len(self.track)
+        if self.simplify_px > 0:
+            self.track.simplify(self.simplify_px)
+        self.logger(f"录制结束，共 {raw} 个事件，轨迹简化后 {len(self.track)} 个。")
+        self.save()
+
+    def simplify(self, tol: Optional[float] = None):
+        removed = self.track.simplify(self.simplify_px if tol is None else tol)
+        self.logger(f"轨迹简化：删除 {removed} 个移动事件，剩余 {len(self.track)} 个。")
+        self.save()
 
-    def replay(self, stop_flag_callable=lambda: False):
+    def save(self):
+        if self.path:
+            self.track.save(self.path)
+            self.logger(f"宏已保存：{self.path}")
+
+    @traced("replay")
+    def replay(self, stop: Optional[threading.Event] = None, speed: Optional[float] = None,
+               max_gap: Optional[float] = None) -> Optional['ReplayStats']:
         """
-        Replay recorded events. Respect timing intervals.
+        按录制时序回放（perf_counter 绝对时刻调度，混合 sleep/自旋等待，不累积漂移）。
+        speed：倍速（2.0 = 两倍速）；max_gap：事件间空闲超过该秒数的压缩到该值（0/None=不压缩）。
+        返回每个事件的迟到统计。
         """
-        if not self.events:
+        if not len(self.track):
             self.logger("无可回放的事件")
-            return
+            return None
+        speed = self.speed if speed is None else speed
+        max_gap = self.max_gap if max_gap is None else max_gap
         self.logger("开始回放宏...")
-        base = time.time()
-        for ev in self.events:
-            if stop_flag_callable():
-                self.logger("检测到停止，终止回放。")
-                return
-            now = time.time()
-            delay = (base + ev.t) - now
-            if delay > 0:
-                time.sleep(delay)
-            kind = ev.kind
-            data = ev.data
-            if kind == "mouse_move":
-                pyautogui.moveTo(data["x"], data["y"])
-            elif kind == "mouse_click":
-                btn = "left"
-                if "Button.right" in data.get("button",""):
-                    btn = "right"
-                if data.get("action") == "down":
-                    pyautogui.mouseDown(x=data["x"], y=data["y"], button=btn)
-                else:
-                    pyautogui.mouseUp(x=data["x"], y=data["y"], button=btn)
-            elif kind == "key_down":
-                pyautogui.keyDown(data["key"])
-            elif kind == "key_up":
-                pyautogui.keyUp(data["key"])
-        self.logger("回放完成。")
+        t, kind, x, y, code = self.track.columns()
+        offsets = replay_schedule(t, speed, max_gap).tolist()
+        # 各列一次性转为 Python 标量，循环内不再逐个访问 numpy 元素
+        kind, x, y, code = kind.tolist(), x.tolist(), y.tolist(), code.tolist()
+        keys = self.track.keys
+        inp = self.input
+        late = np.zeros(len(offsets), np.float64)
+        # 整段回放独占输入：按下 / 抬起、拖拽、组合键之间不会混入其它实例的动作
+        with inp.exclusive():
+            base = time.perf_counter()
+            for i in range(len(offsets)):
+                deadline = base + offsets[i]
+                if deadline - time.perf_counter() > 0:
+                    with TRACER.span("replay:sleep"):
+                        if not sleep_until(deadline, stop):
+                            self.logger("检测到停止，终止回放。")
+                            return None
+                elif stop is not None and stop.is_set():
+                    self.logger("检测到停止，终止回放。")
+                    return None
+                late[i] = time.perf_counter() - deadline
+                k = kind[i]
+                if k == EV_MOVE:
+                    inp.move(x[i], y[i])
+                elif k == EV_MOUSE_DOWN or k == EV_MOUSE_UP:
+                    inp.button(x[i], y[i], MOUSE_BUTTONS[code[i]], k == EV_MOUSE_DOWN)
+                elif k == EV_KEY_DOWN or k == EV_KEY_UP:
+                    inp.key(keys[code[i]], k == EV_KEY_DOWN)
+        stats = ReplayStats(late, offsets[-1], time.perf_counter() - base)
+        self.last_stats = stats
+        self.logger("回放完成。" + stats.report())
+        return stats
 
 # ============================= Config =============================
 DEFAULT_CONFIG_PATH = "config.json"
+PRICE_HISTORY_PATH = "price_history.bin"
+WATCHLIST_STATS_PATH = "watchlist_stats.json"
+FLIGHT_DIR = "flight"
 
 @dataclass
 class Region:
@@ -289,6 +1826,28 @@ class Region:
     w: int
     h: int
 
+@dataclass
+class WatchItem:
+    """模式1 监控清单中的一个商品"""
+    name: str
+    click_coord: Tuple[int,int] = (0,0)
+    threshold: float = 0.0
+    max_amount_clicks: int = 2
+    priority: float = 1.0
+    enabled: bool = True
+
+    @staticmethod
+    def from_json(d: Dict[str,Any]) -> 'WatchItem':
+        c = d.get("click_coord", [0, 0])
+        return WatchItem(name=str(d.get("name", "")), click_coord=(int(c[0]), int(c[1])),
+                         threshold=float(d.get("threshold", 0.0)),
+                         max_amount_clicks=int(d.get("max_amount_clicks", 2)),
+                         priority=float(d.get("priority", 1.0)), enabled=bool(d.get("enabled", True)))
+
+    def to_json(self) -> Dict[str,Any]:
+        return {"name": self.name, "click_coord": list(self.click_coord), "threshold": self.threshold,
+                "max_amount_clicks": self.max_amount_clicks, "priority": self.priority, "enabled": self.enabled}
+
 @dataclass
 class AppConfig:
     trade_button: Tuple[int,int] = (0,0)
@@ -304,6 +1863,10 @@ class AppConfig:
     mode1_item_click_coord: Tuple[int,int] = (0,0)   # 每轮先点击该货物
     mode1_refresh_immediate: bool = True             # 不符合后 立即 Esc+再点货物，立刻下一轮
     max_amount_clicks: int = 2                       # 购买前点击“最大额度”按钮的次数
+    mode1_adaptive_waits: bool = True                # 点击后等待价格区域变化并稳定（原固定等待作为超时上限）
+    mode1_watchlist: List[WatchItem] = field(default_factory=list)  # 多商品监控清单（非空时覆盖单商品设置）
+    watchlist_stats_path: str = WATCHLIST_STATS_PATH  # 监控清单调度统计（空=不持久化）
+    ocr_profiles: Dict[str, PreprocessProfile] = field(default_factory=dict)  # 区域名 -> 预处理参数（tune-ocr 生成）
 
     # 模式2 configuration
     mode2_price_coord: Tuple[int,int] = (0,0)
@@ -312,6 +1875,47 @@ class AppConfig:
     mode2_target_color_rgb: Tuple[int,int,int] = (0,255,0)
 
     scan_interval_ms: int = 150  # OCR 周期（毫秒）
+    change_gate_threshold: float = 1.0  # ROI 变化门控阈值（降采样后变化像素数，0=关闭）
+    ocr_recognition_only: bool = True   # 跳过文字检测，ROI 直接送识别器（数字白名单）
+    ocr_service: bool = False           # OCR 放到独立进程（共享内存传帧，崩溃自动重启）
+    ocr_service_slots: int = 8          # 共享内存帧槽数（同时在途的识别请求上限）
+    trace_enabled: bool = False         # 热路径阶段追踪（性能面板 / Chrome trace 导出）
+    log_max_lines: int = 2000           # 日志面板最多保留行数
+    input_backend: str = "pynput"       # 输入注入：pynput（直接注入）/ pyautogui
+    macro_simplify_px: float = 2.0      # 宏鼠标轨迹简化容差（像素，0=保留全部移动事件）
+    macro_speed: float = 1.0            # 宏回放倍速
+    macro_max_gap_s: float = 0.0        # 回放时事件间空闲超过该秒数的压缩到该值（0=不压缩）
+    price_history_enabled: bool = True  # 每次价格读数写入历史库（price-stats 子命令查询）
+    price_history_path: str = PRICE_HISTORY_PATH
+    log_file: str = LOG_FILE_PATH       # 日志文件（空=不落盘）
+    log_file_max_mb: float = 5.0        # 单个日志文件上限，超过即轮转
+    log_file_backups: int = 3           # 轮转保留份数
+    glyph_min_confidence: float = 0.85  # 字形快速通道最低置信度，低于则回退重型 OCR
+    ocr_cache_size: int = 256           # OCR 结果缓存条数（0=关闭）
+    ocr_cache_key: str = "raw"          # "raw"=原始像素哈希 | "phash"=二值化感知哈希
+    flight_recorder_s: float = 10.0     # 飞行记录：买入 / 识别失败 / 异常 / F10 时转储最近 N 秒的 ROI 帧（0=关闭）
+    flight_recorder_frames: int = 512   # 每个区域环形缓冲的帧数上限
+    flight_recorder_dir: str = FLIGHT_DIR
+    flight_recorder_keep: int = 50      # 目录内最多保留的转储数，超出从最旧的删起
+    flight_recorder_max_mb: float = 200.0  # 目录内转储总大小上限（MB）
+
+    # 屏幕点坐标字段（shifted() 平移用）；(0,0) 表示未设置
+    POINT_FIELDS = ("trade_button", "main_menu_button", "category_button", "buy_button", "max_amount_button",
+                    "mode1_item_click_coord", "mode2_price_coord", "mode2_target_color_coord")
+
+    def shifted(self, dx: int, dy: int) -> 'AppConfig':
+        """返回所有屏幕坐标 / 区域平移 (dx, dy) 后的副本（多开：同一套配置套用到偏移后的窗口）；未设置的保持不变"""
+        cfg = AppConfig.from_json(self.to_json())
+        mv = lambda p: (p[0] + dx, p[1] + dy) if (p[0] or p[1]) else tuple(p)
+        for name in self.POINT_FIELDS:
+            setattr(cfg, name, mv(getattr(cfg, name)))
+        for name in ("price1_region", "price2_region"):
+            r = getattr(cfg, name)
+            if r.w > 0 and r.h > 0:
+                setattr(cfg, name, Region(r.x + dx, r.y + dy, r.w, r.h))
+        for it in cfg.mode1_watchlist:
+            it.click_coord = mv(it.click_coord)
+        return cfg
 
     @staticmethod
     def from_json(d: Dict[str,Any]):
@@ -337,12 +1941,39 @@ class AppConfig:
         cfg.mode1_item_click_coord = _tuple("mode1_item_click_coord")
         cfg.mode1_refresh_immediate = bool(d.get("mode1_refresh_immediate", True))
         cfg.max_amount_clicks = int(d.get("max_amount_clicks", 2))
+        cfg.mode1_adaptive_waits = bool(d.get("mode1_adaptive_waits", True))
+        cfg.mode1_watchlist = [WatchItem.from_json(x) for x in d.get("mode1_watchlist", [])]
+        cfg.watchlist_stats_path = str(d.get("watchlist_stats_path", WATCHLIST_STATS_PATH))
+        cfg.ocr_profiles = {k: PreprocessProfile.from_json(v) for k, v in d.get("ocr_profiles", {}).items()}
 
         cfg.mode2_price_coord = _tuple("mode2_price_coord")
         cfg.mode2_threshold = float(d.get("mode2_threshold", 0.0))
         cfg.mode2_target_color_coord = _tuple("mode2_target_color_coord")
         cfg.mode2_target_color_rgb = _color_tuple("mode2_target_color_rgb")
         cfg.scan_interval_ms = int(d.get("scan_interval_ms", 150))
+        cfg.change_gate_threshold = float(d.get("change_gate_threshold", 1.0))
+        cfg.ocr_recognition_only = bool(d.get("ocr_recognition_only", True))
+        cfg.ocr_service = bool(d.get("ocr_service", False))
+        cfg.ocr_service_slots = int(d.get("ocr_service_slots", 8))
+        cfg.trace_enabled = bool(d.get("trace_enabled", False))
+        cfg.log_max_lines = int(d.get("log_max_lines", 2000))
+        cfg.input_backend = str(d.get("input_backend", "pynput"))
+        cfg.macro_simplify_px = float(d.get("macro_simplify_px", 2.0))
+        cfg.macro_speed = float(d.get("macro_speed", 1.0))
+        cfg.macro_max_gap_s = float(d.get("macro_max_gap_s", 0.0))
+        cfg.price_history_enabled = bool(d.get("price_history_enabled", True))
+        cfg.price_history_path = str(d.get("price_history_path", PRICE_HISTORY_PATH))
+        cfg.log_file = str(d.get("log_file", LOG_FILE_PATH))
+        cfg.log_file_max_mb = float(d.get("log_file_max_mb", 5.0))
+        cfg.log_file_backups = int(d.get("log_file_backups", 3))
+        cfg.glyph_min_confidence = float(d.get("glyph_min_confidence", 0.85))
+        cfg.ocr_cache_size = int(d.get("ocr_cache_size", 256))
+        cfg.ocr_cache_key = str(d.get("ocr_cache_key", "raw"))
+        cfg.flight_recorder_s = float(d.get("flight_recorder_s", 10.0))
+        cfg.flight_recorder_frames = int(d.get("flight_recorder_frames", 512))
+        cfg.flight_recorder_dir = str(d.get("flight_recorder_dir", FLIGHT_DIR))
+        cfg.flight_recorder_keep = int(d.get("flight_recorder_keep", 50))
+        cfg.flight_recorder_max_mb = float(d.get("flight_recorder_max_mb", 200.0))
         return cfg
 
     def to_json(self) -> Dict[str,Any]:
@@ -359,14 +1990,120 @@ class AppConfig:
             "mode1_item_click_coord": list(self.mode1_item_click_coord),
             "mode1_refresh_immediate": self.mode1_refresh_immediate,
             "max_amount_clicks": self.max_amount_clicks,
+            "mode1_adaptive_waits": self.mode1_adaptive_waits,
+            "mode1_watchlist": [it.to_json() for it in self.mode1_watchlist],
+            "watchlist_stats_path": self.watchlist_stats_path,
+            "ocr_profiles": {k: p.to_json() for k, p in self.ocr_profiles.items()},
 
             "mode2_price_coord": list(self.mode2_price_coord),
             "mode2_threshold": self.mode2_threshold,
             "mode2_target_color_coord": list(self.mode2_target_color_coord),
             "mode2_target_color_rgb": list(self.mode2_target_color_rgb),
             "scan_interval_ms": self.scan_interval_ms,
+            "change_gate_threshold": self.change_gate_threshold,
+            "ocr_recognition_only": self.ocr_recognition_only,
+            "ocr_service": self.ocr_service,
+            "ocr_service_slots": self.ocr_service_slots,
+            "trace_enabled": self.trace_enabled,
+            "log_max_lines": self.log_max_lines,
+            "input_backend": self.input_backend,
+            "macro_simplify_px": self.macro_simplify_px,
+            "macro_speed": self.macro_speed,
+            "macro_max_gap_s": self.macro_max_gap_s,
+            "price_history_enabled": self.price_history_enabled,
+            "price_history_path": self.price_history_path,
+            "log_file": self.log_file,
+            "log_file_max_mb": self.log_file_max_mb,
+            "log_file_backups": self.log_file_backups,
+            "glyph_min_confidence": self.glyph_min_confidence,
+            "ocr_cache_size": self.ocr_cache_size,
+            "ocr_cache_key": self.ocr_cache_key,
+            "flight_recorder_s": self.flight_recorder_s,
+            "flight_recorder_frames": self.flight_recorder_frames,
+            "flight_recorder_dir": self.flight_recorder_dir,
+            "flight_recorder_keep": self.flight_recorder_keep,
+            "flight_recorder_max_mb": self.flight_recorder_max_mb,
         }
 
+# ============================= Watchlist Scheduler =============================
+@dataclass
+class WatchStats:
+    checks: int = 0
+    below: int = 0                        # 读到低于阈值的次数
+    last_price: Optional[float] = None
+    mean: float = 0.0                     # 价格 EWMA
+    vol: float = 0.0                      # 相邻两次价格变化幅度的 EWMA
+    last_check: float = 0.0               # perf_counter，不持久化
+
+class WatchlistScheduler:
+    """
+    多商品调度：每轮挑选得分最高的商品刷新。
+        score = priority × 距上次检查秒数 × (FLOOR + chance)
+        chance = 1 / (1 + 距阈值的相对差 / 相对波动率)   —— 越接近阈值、波动越大，越可能跌破
+    从未检查过的商品优先；FLOOR 保证冷门商品不会被饿死。统计信息持久化到 JSON。
+    """
+    ALPHA = 0.2
+    FLOOR = 0.25
+    MIN_VOL = 0.005
+
+    def __init__(self, items: List[WatchItem], path: Optional[str] = WATCHLIST_STATS_PATH):
+        self.items = [it for it in items if it.enabled]
+        self.path = path
+        self.stats: Dict[str, WatchStats] = {it.name: WatchStats() for it in self.items}
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+                for name, d in saved.items():
+                    if name in self.stats:
+                        self.stats[name] = WatchStats(int(d.get("checks", 0)), int(d.get("below", 0)),
+                                                      d.get("last_price"), float(d.get("mean", 0.0)),
+                                                      float(d.get("vol", 0.0)))
+            except Exception:
+                pass  # 统计损坏不影响扫货
+
+    def score(self, it: WatchItem, now: float) -> float:
+        st = self.stats[it.name]
+        if st.last_check == 0.0:
+            return float("inf")
+        since = now - st.last_check
+        chance = 1.0
+        if st.last_price:
+            rel_vol = max(self.MIN_VOL, st.vol / max(st.mean, 1e-6))
+            gap = max(0.0, (st.last_price - it.threshold) / st.last_price)
+            chance = 1.0 / (1.0 + gap / rel_vol)
+        return it.priority * since * (self.FLOOR + chance)
+
+    def next(self) -> WatchItem:
+        now = time.perf_counter()
+        return max(self.items, key=lambda it: self.score(it, now))
+
+    def update(self, it: WatchItem, price: Optional[float]):
+        st = self.stats[it.name]
+        st.last_check = time.perf_counter()
+        st.checks += 1
+        if price is None:
+            return
+        if st.last_price is not None:
+            st.vol += self.ALPHA * (abs(price - st.last_price) - st.vol)
+            st.mean += self.ALPHA * (price - st.mean)
+        else:
+            st.mean = price
+        st.last_price = price
+        if price < it.threshold:
+            st.below += 1
+
+    def save(self):
+        if not self.path:
+            return
+        d = {name: {"checks": st.checks, "below": st.below, "last_price": st.last_price,
+                    "mean": st.mean, "vol": st.vol} for name, st in self.stats.items()}
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(d, f, indent=2, ensure_ascii=False)
+
+    def report(self) -> str:
+        return "调度统计：" + "；".join(f"{n} 检查{st.checks}次 低于阈值{st.below}次" for n, st in self.stats.items())
+
 class ConfigManager:
     def __init__(self, path=DEFAULT_CONFIG_PATH, logger=lambda s: None):
         self.path = path
@@ -387,655 +2124,1992 @@ class ConfigManager:
             json.dump(self.config.to_json(), f, indent=2, ensure_ascii=False)
         self.logger(f"配置已保存：{self.path}")
 
+# ============================= Price history store =============================
+class PriceHistoryStore:
+    """
+    仅追加的价格时间序列：定长二进制记录 (t, item, region, value, conf)，读取时 np.memmap 映射。
+    - append() 只写入预分配的内存块（一次结构化赋值），块满或超过 FLUSH_S 秒才追加到文件
+    - 商品名 / 区域名编码为小整数，映射表存放在同名 .json 旁车文件
+    - 识别失败记为 value=NaN、conf=0，便于统计失败率
+    - 查询在映射数组上做 searchsorted + 掩码，百万行不生成 Python 对象
+    - 同一文件在进程内只能有一个实例（各自的 id 映射会互相覆盖旁车文件），用 shared(path) 获取
+    """
+    DTYPE = np.dtype([("t", "<f8"), ("item", "<u2"), ("region", "u1"), ("_pad", "u1"),
+                      ("conf", "<f4"), ("value", "<f8")])
+    BLOCK = 4096
+    FLUSH_S = 2.0
+
+    _shared: Dict[str, 'PriceHistoryStore'] = {}
+    _shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, path: str = PRICE_HISTORY_PATH) -> 'PriceHistoryStore':
+        """进程内按路径共享的实例：模式1 / 模式2 同时运行时写同一个库"""
+        key = os.path.abspath(path)
+        with cls._shared_lock:
+            store = cls._shared.get(key)
+            if store is None:
+                store = cls._shared[key] = cls(path)
+            return store
+
+    def __init__(self, path: str = PRICE_HISTORY_PATH):
+        self.path = path
+        self.meta_path = os.path.splitext(path)[0] + ".json"
+        self.items: List[str] = []
+        self.regions: List[str] = []
+        if os.path.exists(self.meta_path):
+            try:
+                with open(self.meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                self.items, self.regions = list(meta.get("items", [])), list(meta.get("regions", []))
+            except Exception:
+                pass
+        self._ids = {("item", n): i for i, n in enumerate(self.items)}
+        self._ids.update({("region", n): i for i, n in enumerate(self.regions)})
+        self._buf = np.zeros(self.BLOCK, self.DTYPE)
+        self._n = 0
+        self._last_t = 0.0
+        self._last_flush = time.time()
+        self._lock = threading.Lock()
+
+    def _id(self, kind: str, name: str) -> int:
+        key = (kind, name)
+        i = self._ids.get(key)
+        if i is None:
+            names = self.items if kind == "item" else self.regions
+            i = self._ids[key] = len(names)
+            names.append(name)
+            self._save_meta()
+        return i
+
+    def _save_meta(self):
+        with open(self.meta_path, "w", encoding="utf-8") as f:
+            json.dump({"items": self.items, "regions": self.regions}, f, ensure_ascii=False)
+
+    def append(self, item: str, region: str, value: Optional[float], conf: float = 1.0,
+               t: Optional[float] = None):
+        with self._lock:
+            # 在锁内取时间并保证单调：多个 worker 交替写入时 t 列仍然有序（query 依赖 searchsorted）
+            now = max(time.time() if t is None else t, self._last_t)
+            self._last_t = now
+            self._buf[self._n] = (now, self._id("item", item), self._id("region", region), 0,
+                                  conf if value is not None else 0.0,
+                                  value if value is not None else np.nan)
+            self._n += 1
+            if self._n == self.BLOCK or now - self._last_flush >= self.FLUSH_S:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._n:
+            with open(self.path, "ab") as f:
+                f.write(self._buf[:self._n].tobytes())
+            self._n = 0
+        self._last_flush = time.time()
+
+    close = flush
+
+    def records(self) -> np.ndarray:
+        """全部记录（只读 memmap；尚未落盘的会先刷入文件）"""
+        self.flush()
+        if not os.path.exists(self.path):
+            return np.zeros(0, self.DTYPE)
+        n = os.path.getsize(self.path) // self.DTYPE.itemsize
+        if n == 0:
+            return np.zeros(0, self.DTYPE)
+        return np.memmap(self.path, self.DTYPE, mode="r", shape=(n,))
+
+    def query(self, t0: Optional[float] = None, t1: Optional[float] = None,
+              item: Optional[str] = None, region: Optional[str] = None) -> np.ndarray:
+        """时间范围 [t0, t1) + 商品 / 区域过滤；时间范围部分是零拷贝切片"""
+        rec = self.records()
+        t = rec["t"]
+        lo = 0 if t0 is None else int(np.searchsorted(t, t0, "left"))
+        hi = len(rec) if t1 is None else int(np.searchsorted(t, t1, "left"))
+        rec = rec[lo:hi]
+        mask = None
+        for kind, name in (("item", item), ("region", region)):
+            if name is None:
+                continue
+            i = self._ids.get((kind, name))
+            if i is None:
+                return rec[:0]
+            m = rec[kind] == i
+            mask = m if mask is None else (mask & m)
+        return rec if mask is None else rec[mask]
+
+    def stats(self, **filters) -> Dict[str, Any]:
+        """
+        聚合：样本数、失败率、min/max/mean、p5/p50/p95、价格变动次数及每分钟变动频率。
+        filters 同 query()。变动按 (商品, 区域) 分组后比较相邻有效读数。
+        """
+        rec = self.query(**filters)
+        n = len(rec)
+        out: Dict[str, Any] = {"n": n}
+        if n == 0:
+            return out
+        v = rec["value"]
+        ok = np.isfinite(v)
+        out["fail_rate"] = round(1.0 - float(ok.mean()), 4)
+        span = float(rec["t"][-1] - rec["t"][0])
+        out["span_s"] = round(span, 1)
+        good = rec[ok]
+        if len(good) == 0:
+            return out
+        gv = good["value"]
+        p5, p50, p95 = np.percentile(gv, [5, 50, 95])
+        out.update(min=float(gv.min()), max=float(gv.max()), mean=round(float(gv.mean()), 2),
+                   p5=float(p5), p50=float(p50), p95=float(p95))
+        key = good["item"].astype(np.int32) << 8 | good["region"]
+        order = np.argsort(key, kind="stable")
+        k, gvs = key[order], gv[order]
+        changes = int(np.count_nonzero((k[1:] == k[:-1]) & (gvs[1:] != gvs[:-1])))
+        out["changes"] = changes
+        out["changes_per_min"] = round(changes / span * 60.0, 3) if span > 0 else 0.0
+        return out
+
+# ============================= Flight recorder =============================
+class FlightRing:
+    """单个区域的环形缓冲：帧按首帧的形状一次性分配，之后每帧只做一次 np.copyto"""
+    META = np.dtype([("t", "<f8"), ("value", "<f8"), ("conf", "<f4"), ("ocr_ms", "<f4"), ("gated", "u1")])
+
+    def __init__(self, shape: Tuple[int, ...], dtype, capacity: int):
+        self.frames = np.zeros((capacity,) + tuple(shape), dtype)
+        self.meta = np.zeros(capacity, self.META)
+        self.capacity = capacity
+        self.n = 0  # 累计写入帧数
+
+    def add(self, img: np.ndarray, t: float, value: Optional[float], conf: float, ocr_ms: float, gated: bool):
+        i = self.n % self.capacity
+        np.copyto(self.frames[i], img)
+        self.meta[i] = (t, np.nan if value is None else value, conf, ocr_ms, gated)
+        self.n += 1
+
+    def order(self) -> np.ndarray:
+        """按时间先后排列的有效槽位下标"""
+        if self.n <= self.capacity:
+            return np.arange(self.n)
+        return (np.arange(self.capacity) + self.n) % self.capacity
+
+
+class FlightRecorder:
+    """
+    飞行记录仪：保留最近的 ROI 帧及其识别结果 / 耗时，出事时转储，平时不落盘。
+    - add()：写入预分配的环形缓冲（FlightRing），每帧一次内存拷贝
+    - trigger(reason)：在调用线程里拷出最近 seconds 秒的快照，交给后台线程 savez_compressed，
+      不在热路径上压缩 / 写盘；同一原因 MIN_GAP_S 秒内只转储一次（热键除外）
+    - 每次写完按 keep（个数）/ max_mb（总大小）从最旧的转储删起，长时间运行目录不会无限增长
+    - 每个转储一个 npz：<区域>_frames / <区域>_meta，以及 meta（JSON：原因、时刻、附加信息）
+    """
+    MIN_GAP_S = 2.0
+
+    def __init__(self, seconds: float = 10.0, capacity: int = 512, out_dir: str = FLIGHT_DIR,
+                 logger=lambda s: None, keep: int = 50, max_mb: float = 200.0):
+        self.seconds = seconds
+        self.capacity = max(1, int(capacity))
+        self.out_dir = out_dir
+        self.keep = max(1, int(keep))
+        self.max_bytes = int(max_mb * (1 << 20))
+        self.log = logger
+        self.rings: Dict[str, FlightRing] = {}
+        self._lock = threading.Lock()
+        self._last: Dict[str, float] = {}
+        self._seq = itertools.count()
+        self._queue: "queue.Queue[Optional[Tuple[str, Dict[str, np.ndarray]]]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self.dumps = 0
+
+    @classmethod
+    def from_config(cls, cfg: 'AppConfig', logger=lambda s: None) -> Optional['FlightRecorder']:
+        if cfg.flight_recorder_s <= 0 or cfg.flight_recorder_frames <= 0:
+            return None
+        return cls(cfg.flight_recorder_s, cfg.flight_recorder_frames, cfg.flight_recorder_dir, logger,
+                   cfg.flight_recorder_keep, cfg.flight_recorder_max_mb)
+
+    def add(self, name: str, img: np.ndarray, value: Optional[float], conf: float = 0.0,
+            ocr_s: float = 0.0, gated: bool = False):
+        t = time.time()
+        with self._lock:
+            ring = self.rings.get(name)
+            if ring is None or ring.frames.shape[1:] != img.shape or ring.frames.dtype != img.dtype:
+                ring = self.rings[name] = FlightRing(img.shape, img.dtype, self.capacity)
+            ring.add(img, t, value, conf, ocr_s * 1000, gated)
+
+    def trigger(self, reason: str, tag: str = "", **info) -> bool:
+        """请求一次转储；返回 False 表示被限频或没有内容"""
+        now = time.time()
+        with self._lock:
+            if reason != "hotkey" and now - self._last.get(reason, 0.0) < self.MIN_GAP_S:
+                return False
+            self._last[reason] = now
+            arrays: Dict[str, np.ndarray] = {}
+            for name, ring in self.rings.items():
+                idx = ring.order()
+                idx = idx[ring.meta["t"][idx] >= now - self.seconds]
+                arrays[f"{name}_frames"] = ring.frames[idx]  # 花式索引：拷贝，之后环形缓冲可继续覆盖
+                arrays[f"{name}_meta"] = ring.meta[idx]
+        if not arrays:
+            return False
+        meta = {"reason": reason, "tag": tag, "t": now, "seconds": self.seconds,
+                "regions": sorted({k.rsplit("_", 1)[0] for k in arrays}), "info": info}
+        arrays["meta"] = np.array(json.dumps(meta, ensure_ascii=False, default=str))
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"-{int(now * 1000) % 1000:03d}"
+        name = "_".join(x for x in (stamp, tag, reason, str(next(self._seq))) if x)
+        self._queue.put((os.path.join(self.out_dir, name + ".npz"), arrays))
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._write_loop, name="flight-writer", daemon=True)
+            self._writer.start()
+        return True
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            path, arrays = item
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                np.savez_compressed(path, **arrays)
+                self.dumps += 1
+                n = sum(len(v) for k, v in arrays.items() if k.endswith("_meta"))
+                self.log(f"飞行记录已保存：{path}（{n} 帧）")
+                self._prune(path)
+            except Exception as e:
+                self.log(f"飞行记录保存失败：{path}：{e}")
+
+    def _prune(self, newest: str):
+        """按修改时间从旧到新删除，直到个数 ≤ keep 且总大小 ≤ max_bytes（刚写的这个不删）"""
+        d = os.path.dirname(newest) or "."
+        files = []
+        for fn in os.listdir(d):
+            if fn.endswith(".npz"):
+                st = os.stat(os.path.join(d, fn))
+                files.append((st.st_mtime, st.st_size, os.path.join(d, fn)))
+        files.sort()
+        total = sum(f[1] for f in files)
+        removed = 0
+        for _, size, path in files[:-1]:
+            if len(files) - removed <= self.keep and total <= self.max_bytes:
+                break
+            if os.path.abspath(path) == os.path.abspath(newest):
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            self.log(f"飞行记录：已清理最旧的 {removed} 个转储")
+
+    def close(self, timeout: float = 10.0):
+        """等待已触发的转储写完"""
+        w = self._writer
+        if w is not None and w.is_alive():
+            self._queue.put(None)
+            w.join(timeout)
+        self._writer = None
+
+    @staticmethod
+    def load(path: str) -> Tuple[Dict[str, Any], Dict[str, Tuple[np.ndarray, np.ndarray]]]:
+        """读取转储：(meta, {区域: (frames, meta 记录数组)})"""
+        with np.load(path) as z:
+            meta = json.loads(str(z["meta"]))
+            return meta, {r: (z[f"{r}_frames"], z[f"{r}_meta"]) for r in meta["regions"]}
+
+
+def flight_show_main(argv: List[str]) -> int:
+    """python run_app.py flight-show dump.npz [--png 目录]：打印转储的时间线，可导出各帧 PNG"""
+    import argparse
+    ap = argparse.ArgumentParser(prog="run_app.py flight-show", description="查看飞行记录转储")
+    ap.add_argument("path")
+    ap.add_argument("--png", default=None, help="把每一帧导出为 PNG（文件名含区域、序号与识别结果）")
+    args = ap.parse_args(argv)
+    meta, regions = FlightRecorder.load(args.path)
+    print(json.dumps(meta, indent=2, ensure_ascii=False))
+    rows = []
+    for r, (frames, m) in regions.items():
+        for i, rec in enumerate(m):
+            rows.append((float(rec["t"]), r, i, rec))
+            if args.png:
+                os.makedirs(args.png, exist_ok=True)
+                v = "fail" if np.isnan(rec["value"]) else f"{rec['value']:g}"
+                img = frames[i]
+                if img.ndim == 3 and img.shape[2] == 4:
+                    img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+                cv2.imwrite(os.path.join(args.png, f"{r}_{i:04d}_{v}.png"), img)
+    t_end = meta["t"]
+    for t, r, i, rec in sorted(rows, key=lambda x: x[0]):
+        v = "识别失败" if np.isnan(rec["value"]) else f"{rec['value']:g}"
+        how = "门控沿用" if rec["gated"] else f"OCR {rec['ocr_ms']:.1f}ms"
+        print(f"{t - t_end:+8.3f}s  {r:<8} #{i:<4} {v:<10} conf={rec['conf']:.2f}  {how}")
+    return 0
+
+# ============================= OCR service process =============================
+def _attach_shm(name: str):
+    """
+    子进程挂接共享内存（由主进程负责 unlink）。spawn 出的子进程与主进程共用同一个
+    resource_tracker，重复登记无害；3.13+ 直接关闭登记。
+    """
+    from multiprocessing import shared_memory
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        return shared_memory.SharedMemory(name=name)
+
+def _ocr_server_main(shm_name: str, slot_bytes: int, conn, cfg_json: Dict[str, Any]):
+    """
+    OCR 服务进程入口：加载一次模型，循环处理请求。
+      ("ocr", rid, slot, shape, dtype, region) -> ("ocr", rid, text, value, conf, char_confs, source)
+      ("stats", rid)                           -> ("stats", rid, cache_report)
+      ("reload_glyphs",) / ("stop",)
+    帧数据不经过管道：直接从共享内存的 slot 读取。
+    """
+    cfg = AppConfig.from_json(cfg_json)
+    ocr = OCRManager.from_config(cfg, logger=lambda s: conn.send(("log", s)), defer=True)
+    try:
+        ocr._init_ocr()
+    except Exception:
+        pass  # 无重型引擎时仍可只用字形模板通道；backend=None 告知客户端
+    conn.send(("hello", ocr.backend, ocr.glyph.ready))
+    shm = _attach_shm(shm_name)
+    try:
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                break
+            op = msg[0]
+            if op == "ocr":
+                _, rid, slot, shape, dtype, region = msg
+                img = np.ndarray(shape, dtype, buffer=shm.buf, offset=slot * slot_bytes)
+                r = ocr.read_price(img, region)
+                del img
+                conn.send(("ocr", rid, r.text, r.value, r.confidence, r.char_confidences, r.source))
+            elif op == "stats":
+                conn.send(("stats", msg[1], ocr.cache_report()))
+            elif op == "reload_glyphs":
+                if ocr.glyph.path and os.path.exists(ocr.glyph.path):
+                    ocr.glyph.load(ocr.glyph.path)
+                    ocr.cache.clear()
+            elif op == "stop":
+                break
+    finally:
+        shm.close()
+
+
+class OCRService:
+    """
+    独立进程中的 OCR（与 GUI / 抓屏 / 输入监听不再争抢 GIL）。
+    - 帧通过 multiprocessing.shared_memory 的环形 slot 传递，管道里只有几十字节的请求头
+    - 多个 worker 线程共用同一个客户端 / 同一份已加载的模型；slot 用完时调用方阻塞（背压）
+    - 服务进程崩溃时自动重启，期间的请求以识别失败返回
+    对外接口与 OCRManager 的识别部分一致（read_price / read_price_value / cache_report / ready / backend）。
+    """
+    SLOTS = 8
+    SLOT_BYTES = 1 << 20   # 每个 slot 1MB，足够 512x512 BGRA
+    TIMEOUT = 5.0
+    MAX_BACKOFF = 30.0
+
+    def __init__(self, cfg: 'AppConfig', logger, slots: int = SLOTS, slot_bytes: int = SLOT_BYTES):
+        self.cfg = cfg
+        self.logger = logger
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.ready = threading.Event()
+        self.init_error: Optional[Exception] = None
+        self.backend: Optional[str] = None
+        self.glyph_ready = False
+        self.restarts = 0
+        self.requests = 0
+        self.failures = 0
+        self._ctx = None
+        self._shm = None
+        self._proc = None
+        self._conn = None
+        self._send_lock = threading.Lock()
+        self._free: "queue.Queue[int]" = queue.Queue()
+        self._pending: Dict[int, list] = {}   # rid -> [Event, 结果, slot, 连接代数]
+        self._gen = 0                          # 每拉起一次服务进程 +1
+        self._pending_lock = threading.Lock()
+        self._rid = itertools.count(1)
+        self._stopping = False
+        self._crash_streak = 0
+        self._on_ready = None
+
+    # ---------- lifecycle ----------
+    def start(self, on_ready=None):
+        """创建共享内存并拉起服务进程；模型加载完成后回调 on_ready(ok)（在接收线程中）"""
+        import multiprocessing as mp
+        from multiprocessing import shared_memory
+        self._ctx = mp.get_context("spawn")
+        self._shm = shared_memory.SharedMemory(create=True, size=self.slots * self.slot_bytes)
+        for i in range(self.slots):
+            self._free.put(i)
+        self._on_ready = on_ready
+        self._spawn()
+        threading.Thread(target=self._recv_loop, name="ocr-service", daemon=True).start()
+
+    def _spawn(self):
+        parent, child = self._ctx.Pipe(duplex=True)
+        self._proc = self._ctx.Process(target=_ocr_server_main, name="ocr-server", daemon=True,
+                                       args=(self._shm.name, self.slot_bytes, child, self.cfg.to_json()))
+        self._proc.start()
+        child.close()
+        with self._send_lock:
+            self._conn = parent
+            self._gen += 1
+        # 重启窗口内发到旧管道的请求永远不会有回复：让它们失败并归还 slot
+        self._fail_pending(self._gen)
+
+    def stop(self):
+        self._stopping = True
+        try:
+            with self._send_lock:
+                self._conn.send(("stop",))
+        except Exception:
+            pass
+        if self._proc is not None:
+            self._proc.join(2.0)
+            if self._proc.is_alive():
+                self._proc.kill()
+        self._fail_pending()
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    # ---------- receiver / supervisor ----------
+    def _recv_loop(self):
+        while not self._stopping:
+            try:
+                if not self._conn.poll(0.5):
+                    if not self._proc.is_alive():
+                        raise EOFError
+                    continue
+                msg = self._conn.recv()
+            except (EOFError, OSError):
+                if self._stopping:
+                    break
+                self._restart()
+                continue
+            op = msg[0]
+            if op == "ocr" or op == "stats":
+                self._complete(msg[1], msg[2:])
+            elif op == "hello":
+                self._crash_streak = 0
+                self.backend, self.glyph_ready = msg[1], bool(msg[2])
+                first = not self.ready.is_set() and self.restarts == 0
+                self.ready.set()
+                if first and self._on_ready is not None:
+                    self._on_ready(bool(msg[1]))
+            elif op == "log":
+                self.logger("[OCR服务] " + msg[1])
+
+    def _restart(self):
+        self.ready.clear()
+        self.restarts += 1
+        self._proc.join(0.5)
+        self.logger(f"⚠️ OCR 服务进程退出（exitcode={self._proc.exitcode}），第 {self.restarts} 次重启 ...")
+        self._fail_pending()
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+        # 连续崩溃时退避，避免模型加载失败导致的重启风暴
+        backoff = min(self.MAX_BACKOFF, 0.5 * (2 ** min(self._crash_streak, 6)))
+        self._crash_streak += 1
+        time.sleep(backoff if self._crash_streak > 1 else 0.0)
+        if not self._stopping:
+            self._spawn()
+
+    def _complete(self, rid: int, payload):
+        with self._pending_lock:
+            p = self._pending.pop(rid, None)
+        if p is None:
+            return
+        ev, slot = p[0], p[2]
+        p[1] = payload
+        if slot is not None:
+            self._free.put(slot)  # 服务端已处理完，slot 才能复用（即使调用方已超时）
+        ev.set()
+
+    def _fail_pending(self, before_gen: Optional[int] = None):
+        """让在途请求失败并归还 slot；before_gen 给定时只处理发往更早连接的请求"""
+        with self._pending_lock:
+            if before_gen is None:
+                pend, self._pending = self._pending, {}
+            else:
+                pend = {rid: p for rid, p in self._pending.items() if p[3] < before_gen}
+                for rid in pend:
+                    del self._pending[rid]
+        for ev, _, slot, _ in pend.values():
+            if slot is not None:
+                self._free.put(slot)
+            ev.set()
+
+    # ---------- requests ----------
+    def _request(self, head: tuple, slot: Optional[int], timeout: float = TIMEOUT):
+        """发送请求并等待回复内容；超时 / 服务重启返回 None"""
+        rid = next(self._rid)
+        p = [threading.Event(), None, slot, 0]
+        try:
+            # 登记与发送在同一把锁内：请求的代数必定等于它实际发往的连接
+            with self._send_lock:
+                p[3] = self._gen
+                with self._pending_lock:
+                    self._pending[rid] = p
+                self._conn.send((head[0], rid) + tuple(head[1:]))
+        except (OSError, ValueError):
+            # 管道已断：若条目还没被重启流程回收，自己撤回并归还 slot
+            with self._pending_lock:
+                mine = self._pending.pop(rid, None) is not None
+            if mine and slot is not None:
+                self._free.put(slot)
+            return None
+        if not p[0].wait(timeout):
+            return None  # 超时：条目保留，迟到的回复到达时再归还 slot
+        return p[1]
+
+    def read_price(self, img_bgr: np.ndarray, region: Optional[str] = None) -> OCRReading:
+        fail = OCRReading("", None, 0.0, [], "service")
+        if img_bgr is None or img_bgr.size == 0:
+            return fail
+        self.requests += 1
+        if img_bgr.nbytes > self.slot_bytes or not self.ready.wait(self.TIMEOUT):
+            self.failures += 1
+            return fail
+        try:
+            slot = self._free.get(timeout=self.TIMEOUT)
+        except queue.Empty:
+            self.failures += 1
+            return fail
+        dst = np.ndarray(img_bgr.shape, img_bgr.dtype, buffer=self._shm.buf, offset=slot * self.slot_bytes)
+        dst[...] = img_bgr
+        del dst
+        res = self._request(("ocr", slot, img_bgr.shape, img_bgr.dtype.str, region), slot)
+        if res is None:
+            self.failures += 1
+            return fail
+        text, value, conf, char_confs, source = res
+        return OCRReading(text, value, conf, list(char_confs), source)
+
+    def read_price_value(self, img_bgr: np.ndarray) -> Optional[float]:
+        return self.read_price(img_bgr).value
+
+    def reload_glyphs(self):
+        try:
+            with self._send_lock:
+                self._conn.send(("reload_glyphs",))
+        except Exception:
+            pass
+
+    def cache_report(self) -> str:
+        res = self._request(("stats",), None) if self.ready.is_set() else None
+        head = f"OCR服务：请求 {self.requests} / 失败 {self.failures} / 重启 {self.restarts}"
+        return head + ("；" + res[0] if res else "")
+
 # ============================= Worker Threads =============================
-class Mode1Worker(QtCore.QThread):
-    log = Signal(str)
-    finished = Signal()
-    price_signal = Signal(float, float)  # price1, price2 (last)
-
-    def __init__(self, config: AppConfig, ocr: OCRManager, stop_flag: threading.Event,
-                 threshold: float, logger, parent=None):
-        super().__init__(parent)
+class WorkerStopped(Exception):
+    """checkpoint() 检测到停止请求"""
+
+
+class Worker:
+    """
+    统一的后台工作线程：start() / stop() / restart() / running。
+    - 每个 worker 自带 stop_flag；所有等待都用 stop_flag.wait(timeout)，stop() 立即唤醒，不靠轮询
+    - 子类实现 work()，在会产生副作用的步骤（点击 / 按键 / 回放）前调用 checkpoint()，
+      停止后抛 WorkerStopped 直接退出；收尾统一放在 cleanup()
+    - log / on_finished 为普通回调，在工作线程中调用，须线程安全
+    """
+    name = "worker"
+
+    def __init__(self, logger=lambda s: None, on_finished=None):
+        self.log = logger
+        self.on_finished = on_finished
+        self.stop_flag = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> bool:
+        if self.running:
+            return False
+        self.stop_flag.clear()
+        self._thread = threading.Thread(target=self._main, name=self.name, daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self, wait: float = 0.0):
+        self.stop_flag.set()
+        if wait > 0:
+            self.join(wait)
+
+    def restart(self, wait: float = 2.0) -> bool:
+        self.stop(wait)
+        return self.start()
+
+    def join(self, timeout: Optional[float] = None):
+        t = self._thread
+        if t is not None and t is not threading.current_thread():
+            t.join(timeout)
+
+    def sleep(self, seconds: float) -> bool:
+        """可被 stop() 立即打断的等待；返回 False 表示已停止"""
+        return not self.stop_flag.wait(seconds)
+
+    def checkpoint(self):
+        if self.stop_flag.is_set():
+            raise WorkerStopped()
+
+    def work(self):
+        raise NotImplementedError
+
+    def cleanup(self):
+        pass
+
+    def on_error(self, e: Exception):
+        """work() 抛出未处理异常后、cleanup() 之前调用"""
+        self.dump_flight("exception", error=repr(e))
+
+    def dump_flight(self, reason: str, **info) -> bool:
+        """触发飞行记录转储（买入 / 识别失败 / 异常 / 热键）；未启用时什么也不做"""
+        flight = getattr(self, "flight", None)
+        return flight is not None and flight.trigger(reason, self.name, **info)
+
+    def _main(self):
+        try:
+            self.work()
+        except WorkerStopped:
+            pass
+        except Exception as e:
+            self.log(f"{self.name} 线程异常：{e}")
+            self.log(traceback.format_exc())
+            self.on_error(e)
+        finally:
+            try:
+                self.cleanup()
+            finally:
+                if self.on_finished:
+                    self.on_finished()
+
+
+class MacroReplayWorker(Worker):
+    """界面上的“回放操作”按钮：在后台回放，F9 可立即中断"""
+    name = "宏回放"
+
+    def __init__(self, macro: 'MacroRecorder', logger=lambda s: None, on_finished=None):
+        super().__init__(logger, on_finished)
+        self.macro = macro
+
+    def work(self):
+        self.macro.replay(self.stop_flag)
+
+
+class Mode1Worker(Worker):
+    name = "模式1"
+    history_tag = "mode1"  # 价格历史中的商品名（无监控清单时）；多开时改为实例名
+
+
+    def __init__(self, config: AppConfig, ocr: OCRManager, threshold: float, logger,
+                 inp: Optional[InputBackend] = None, on_price=None, on_finished=None,
+                 screen: Optional[Screen] = None, history: Optional['PriceHistoryStore'] = None):
+        super().__init__(logger, on_finished)
         self.cfg = config
         self.ocr = ocr
-        self.stop_flag = stop_flag
         self.threshold = threshold
-        self.logger = logger
-        self.screen = Screen()
+        self.on_price = on_price or (lambda p1, p2: None)  # (price1, price2)，-1 表示无
+        self.inp = inp or make_input_backend(config.input_backend, logger)
+        self.screen = screen or Screen()
+        self.cycles = 0
+        self.reader = GatedPriceReader(ocr, config.change_gate_threshold)
+        self.flight = FlightRecorder.from_config(config, logger)
+        self.reader.recorder = self.flight
+        self.capture: Optional[FrameCapture] = None
+        r1, r2 = config.price1_region, config.price2_region
+        self.regions = {"price1": (r1.x, r1.y, r1.w, r1.h), "price2": (r2.x, r2.y, r2.w, r2.h)}
+        self.waits = WaitStats()
+        if history is None and config.price_history_enabled:
+            history = PriceHistoryStore.shared(config.price_history_path)
+        self.history = history
+        # 监控清单（非空时每轮由调度器挑选商品；否则沿用单商品设置）
+        self.scheduler = WatchlistScheduler(config.mode1_watchlist, config.watchlist_stats_path or None) \
+            if any(it.enabled for it in config.mode1_watchlist) else None
+        self.item: Optional[WatchItem] = None
+        self.item_coord = config.mode1_item_click_coord
+        self.item_clicks = config.max_amount_clicks
+
+    def _select_item(self):
+        """由调度器挑选下一轮要刷新的商品，切换点击坐标 / 阈值 / 最大额度次数"""
+        if self.scheduler is None:
+            return
+        it = self.scheduler.next()
+        if it is not self.item:
+            self.log(f"[商品] {it.name} 阈值={it.threshold}")
+        self.item = it
+        self.item_coord = it.click_coord
+        self.threshold = it.threshold
+        self.item_clicks = it.max_amount_clicks
+
+    # 原先的固定等待（秒），现作为界面等待的超时上限
+    WAIT_ITEM = 0.12
+    WAIT_MAX = 0.12
+    WAIT_ESC = 0.10
+    WAIT_BUY = 0.5
+
+    def _act_and_wait(self, action, label: str, watch: str, timeout: float):
+        """
+        执行 action（点击 / 按键），然后等待 watch 区域变化并稳定（最多 timeout 秒）。
+        mode1_adaptive_waits 关闭或区域未配置时退化为固定等待。实际等待时间记录在 self.waits。
+        """
+        region = self.regions.get(watch)
+        cond = None
+        if self.cfg.mode1_adaptive_waits and region and region[2] > 0 and region[3] > 0:
+            cond = RoiChanged(self.screen, region, self.cfg.change_gate_threshold or 1.0)
+        self.checkpoint()  # 停止后不再发出任何输入
+        action()
+        with TRACER.span("wait:" + label):
+            if cond is None:
+                t0 = time.perf_counter()
+                ok = self.sleep(timeout)
+                dt = time.perf_counter() - t0
+            else:
+                ok, dt = wait_until(cond, timeout, self.stop_flag)
+        self.waits.add(label, dt, ok)
+
+    def _read_many(self, names: Tuple[str, ...]) -> Dict[str, Optional[float]]:
+        """同一帧读取多个区域（变化的区域一次批量送 OCR）"""
+        views = self.capture.grab()
+        got = self.reader.read_many({n: views.get(n) for n in names})
+        if self.history is not None:
+            item = self.item.name if self.item is not None else self.history_tag
+            for n in names:
+                self.history.append(item, n, got[n], self.reader.conf.get(n, 0.0))
+        return got
+
+    def _read(self, name: str) -> Optional[float]:
+        return self._read_many((name,))[name]
 
     def _refresh_item(self):
-        ix, iy = self.cfg.mode1_item_click_coord
+        ix, iy = self.item_coord
         if ix or iy:
-            Screen.click(ix, iy)
-            time.sleep(0.12)
+            self._act_and_wait(lambda: self.inp.click(ix, iy), "item", "price1", self.WAIT_ITEM)
 
     def _click_max_amount(self):
         x, y = self.cfg.max_amount_button
-        clicks = max(1, int(self.cfg.max_amount_clicks))
-        for _ in range(clicks):
-            Screen.click(x, y)
-            time.sleep(0.12)
+        clicks = max(1, int(self.item_clicks))
+        # N 次点击作为一个批次发出，之后只等一次价格2区域稳定（原先每次点击后各等一次）
+        self._act_and_wait(lambda: self.inp.run([("click", x, y, clicks)]), "max", "price2", self.WAIT_MAX)
 
-    def run(self):
-        try:
-            self.log.emit("模式1：开始监控...")
-            interval = max(30, int(self.cfg.scan_interval_ms)) / 1000.0
-            while not self.stop_flag.is_set():
-                bought = False
-
-                # 1) 点货物（始终先点）
+    def work(self):
+        self.log("模式1：开始监控...")
+        interval = max(30, int(self.cfg.scan_interval_ms)) / 1000.0
+        self.capture = FrameCapture(self.screen, self.regions)
+        selected = False
+        t_cycle = 0
+        while not self.stop_flag.is_set():
+            # 整轮耗时：在下一轮开头补记上一轮（兼容 continue 分支）
+            if TRACER.enabled:
+                now = time.perf_counter_ns()
+                if t_cycle:
+                    TRACER.record(TRACER.stage_id("cycle"), t_cycle, now)
+                t_cycle = now
+            self.cycles += 1
+            bought = False
+            # 1) 点货物（上一轮末尾已立即刷新过则不再重复点击：第二次点击界面不变，只会等满超时）
+            if selected:
+                selected = False
+            else:
+                self._select_item()
                 self._refresh_item()
 
-                # 2) OCR 价格1
-                r1 = self.cfg.price1_region
-                img1 = self.screen.grab_region((r1.x, r1.y, r1.w, r1.h))
-                p1 = self.ocr.read_price_value(img1)
-                if p1 is not None:
-                    self.price_signal.emit(p1, -1.0)
-                    self.log.emit(f"[价格1] {p1}")
+            # 2) OCR 价格1
+            p1 = self._read("price1")
+            if self.scheduler is not None:
+                self.scheduler.update(self.item, p1)
+            if p1 is not None:
+                self.on_price(p1, -1.0)
+                self.log(f"[价格1] {p1}")
+            else:
+                self.log("[价格1] 识别失败")
+                self.dump_flight("ocr_fail", region="price1")
+
+            # 3) 判定 & 购买流程
+            if p1 is not None and p1 < self.threshold:
+                # 最大额度（多次点击）
+                self._click_max_amount()
+
+                # OCR 价格2（与价格1同帧一次批量识别，价格1 顺带刷新）
+                got = self._read_many(("price1", "price2"))
+                p1 = got["price1"] if got["price1"] is not None else p1
+                p2 = got["price2"]
+                if p2 is not None:
+                    self.on_price(p1, p2)
+                    self.log(f"[价格2] {p2}")
                 else:
-                    self.log.emit("[价格1] 识别失败")
-
-                # 3) 判定 & 购买流程
-                if p1 is not None and p1 < self.threshold:
-                    # 最大额度（多次点击）
-                    self._click_max_amount()
-
-                    # OCR 价格2
-                    r2 = self.cfg.price2_region
-                    img2 = self.screen.grab_region((r2.x, r2.y, r2.w, r2.h))
-                    p2 = self.ocr.read_price_value(img2)
-                    if p2 is not None:
-                        self.price_signal.emit(p1, p2)
-                        self.log.emit(f"[价格2] {p2}")
-                    else:
-                        self.log.emit("[价格2] 识别失败")
-
-                    if p2 is not None and p2 < self.threshold:
-                        bx, by = self.cfg.buy_button
-                        Screen.click(bx, by)
-                        self.log.emit(f"✅ 触发购买！价格2={p2} 阈值={self.threshold}")
-                        bought = True
-                        time.sleep(0.5)
-
-                # 4) 若本轮未买成：按 Esc → 再点货物（立即刷新到下一轮）
-                if not bought:
-                    Screen.press_esc()
-                    time.sleep(0.10)
-                    if self.cfg.mode1_refresh_immediate:
-                        # 立即刷新，不等间隔
-                        self._refresh_item()
-                        # 直接继续下一轮
-                        continue
-
-                # 5) 正常间隔
-                slept = 0.0
-                while slept < interval:
-                    if self.stop_flag.is_set():
-                        break
-                    t = min(0.02, interval - slept)
-                    time.sleep(t)
-                    slept += t
+                    self.log("[价格2] 识别失败")
+                    self.dump_flight("ocr_fail", region="price2")
 
-            self.log.emit("模式1：已停止。")
-        except Exception as e:
-            self.log.emit("模式1线程异常：" + str(e))
-            self.log.emit(traceback.format_exc())
-        finally:
-            self.finished.emit()
+                if p2 is not None and p2 < self.threshold:
+                    bx, by = self.cfg.buy_button
+                    self._act_and_wait(lambda: self.inp.click(bx, by), "buy", "price2", self.WAIT_BUY)
+                    self.log(f"✅ 触发购买！价格2={p2} 阈值={self.threshold}")
+                    self.dump_flight("buy", price1=p1, price2=p2, threshold=self.threshold,
+                                     item=self.item.name if self.item is not None else None)
+                    bought = True
+
+            # 4) 若本轮未买成：按 Esc → 再点货物（立即刷新到下一轮）
+            if not bought:
+                self._act_and_wait(lambda: self.inp.press("esc"), "esc", "price1", self.WAIT_ESC)
+                if self.cfg.mode1_refresh_immediate:
+                    # 立即刷新，不等间隔（监控清单模式下先选好下一个商品）
+                    self._select_item()
+                    selected = True
+                    self._refresh_item()
+                    # 直接继续下一轮
+                    continue
+
+            # 5) 正常间隔（stop() 立即唤醒）
+            with TRACER.span("interval"):
+                self.sleep(interval)
+
+    def cleanup(self):
+        if self.history is not None:
+            self.history.flush()
+        if self.flight is not None:
+            self.flight.close()
+        if self.scheduler is not None:
+            self.scheduler.save()
+            self.log(self.scheduler.report())
+        self.log(self.reader.report())
+        self.log(self.waits.report())
+        self.log(self.ocr.cache_report())
+        self.log("模式1：已停止。")
 
-class Mode2Worker(QtCore.QThread):
-    log = Signal(str)
-    finished = Signal()
+class Mode2Worker(Worker):
+    name = "模式2"
+    history_tag = "mode2"
 
-    def __init__(self, config: AppConfig, ocr: OCRManager, stop_flag: threading.Event,
-                 op1: MacroRecorder, op2: MacroRecorder, logger, parent=None):
-        super().__init__(parent)
+    def __init__(self, config: AppConfig, ocr: OCRManager, op1: MacroRecorder, op2: MacroRecorder,
+                 logger, on_finished=None, screen: Optional[Screen] = None,
+                 history: Optional['PriceHistoryStore'] = None):
+        super().__init__(logger, on_finished)
         self.cfg = config
         self.ocr = ocr
-        self.stop_flag = stop_flag
         self.op1 = op1
         self.op2 = op2
-        self.logger = logger
-        self.screen = Screen()
+        self.screen = screen or Screen()
+        self.cycles = 0
+        self.reader = GatedPriceReader(ocr, config.change_gate_threshold)
+        self.flight = FlightRecorder.from_config(config, logger)
+        self.reader.recorder = self.flight
+        if history is None and config.price_history_enabled:
+            history = PriceHistoryStore.shared(config.price_history_path)
+        self.history = history
+        tx, ty = config.mode2_target_color_coord
+        self.probe = PixelProbe(self.screen, {
+            "stop": PixelCondition([(tx, ty, tuple(config.mode2_target_color_rgb), 10)]),
+        })
 
-    def run(self):
-        try:
-            self.log.emit("模式2：开始循环...")
-            interval = max(30, int(self.cfg.scan_interval_ms)) / 1000.0
-            while not self.stop_flag.is_set():
-                x, y = self.cfg.mode2_price_coord
-                region = (x-40, y-20, 80, 40)
-                img = self.screen.grab_region(region)
-                price = self.ocr.read_price_value(img)
-                if price is None:
-                    self.log.emit("价格识别失败，跳过。")
-                else:
-                    self.log.emit(f"[监控价格] {price} vs 阈值 {self.cfg.mode2_threshold}")
-                    if price > self.cfg.mode2_threshold:
-                        self.log.emit("执行 录制操作1 ...")
-                        self.op1.replay(stop_flag_callable=lambda: self.stop_flag.is_set())
-                    else:
-                        self.log.emit("执行 录制操作2 ...")
-                        self.op2.replay(stop_flag_callable=lambda: self.stop_flag.is_set())
-                        # 检测终止条件：像素颜色
-                        tx, ty = self.cfg.mode2_target_color_coord
-                        target = self.cfg.mode2_target_color_rgb
-                        px = Screen.get_pixel(tx, ty)
-                        self.log.emit(f"颜色检测: 当前={px}, 目标={target}")
-                        def close(a,b, tol=10): return all(abs(a[i]-b[i])<=tol for i in range(3))
-                        if close(px, target, tol=10):
-                            self.log.emit("🎯 终止条件满足，退出模式2。")
-                            break
+    def _act_on_price(self, price: Optional[float]) -> bool:
+        """按价格执行录制操作；返回 True 表示终止条件满足"""
+        self.cycles += 1
+        if self.history is not None:
+            self.history.append(self.history_tag, "price", price, self.reader.conf.get("price", 0.0))
+        if price is None:
+            self.log("价格识别失败，跳过。")
+            self.dump_flight("ocr_fail", region="price")
+            return False
+        self.log(f"[监控价格] {price} vs 阈值 {self.cfg.mode2_threshold}")
+        if price > self.cfg.mode2_threshold:
+            self.checkpoint()
+            self.log("执行 录制操作1 ...")
+            self.op1.replay(self.stop_flag)
+            return False
+        self.checkpoint()
+        self.log("执行 录制操作2 ...")
+        self.op2.replay(self.stop_flag)
+        self.checkpoint()
+        # 检测终止条件：像素颜色
+        tx, ty = self.cfg.mode2_target_color_coord
+        hit = self.probe.evaluate()["stop"]
+        self.log(f"颜色检测: 当前={self.probe.rgb_at(tx, ty)}, 目标={self.cfg.mode2_target_color_rgb}")
+        if hit:
+            self.log("🎯 终止条件满足，退出模式2。")
+        return hit
 
-                # wait interval with stop check
-                slept = 0.0
-                while slept < interval:
-                    if self.stop_flag.is_set():
-                        break
-                    t = min(0.02, interval - slept)
-                    time.sleep(t)
-                    slept += t
-            self.log.emit("模式2：已停止。")
+    def work(self):
+        self.log("模式2：开始循环...")
+        interval = max(30, int(self.cfg.scan_interval_ms)) / 1000.0
+        x, y = self.cfg.mode2_price_coord
+        capture = FrameCapture(self.screen, {"price": (x-40, y-20, 80, 40)})
+        grab = lambda: capture.grab()["price"]
+        img = None
+        while not self.stop_flag.is_set():
+            with TRACER.span("cycle"):
+                if img is None:
+                    img = grab()
+                if self._act_on_price(self.reader.read("price", img)):
+                    break
+            # 等待价格区域变化（最多一个间隔），变化即提前进入下一轮
+            with TRACER.span("interval"):
+                img, _ = self.reader.gate("price").wait_change(grab, interval, self.stop_flag)
+
+    def cleanup(self):
+        if self.history is not None:
+            self.history.flush()
+        if self.flight is not None:
+            self.flight.close()
+        self.log(self.reader.report())
+        self.log(self.ocr.cache_report())
+        self.log("模式2：已停止。")
+
+# ============================= Offline OCR benchmark =============================
+BENCH_SCHEMA_VERSION = 1
+
+def load_roi_corpus(path: str) -> List[Tuple[str, np.ndarray, str]]:
+    """
+    读取已标注的价格 ROI 目录 -> [(文件名, BGR 图, 标注)]
+    - 若存在 labels.json（{文件名: 标注}）以其为准
+    - 否则取文件名第一个 "_" 之前的部分作为标注，如 "12,345_0001.png" -> "12,345"
+    """
+    labels: Dict[str, str] = {}
+    lp = os.path.join(path, "labels.json")
+    if os.path.exists(lp):
+        with open(lp, "r", encoding="utf-8") as f:
+            labels = {k: str(v) for k, v in json.load(f).items()}
+    out = []
+    for fn in sorted(os.listdir(path)):
+        if not fn.lower().endswith((".png", ".bmp", ".jpg", ".jpeg")):
+            continue
+        img = cv2.imread(os.path.join(path, fn), cv2.IMREAD_COLOR)
+        if img is None:
+            continue
+        out.append((fn, img, labels.get(fn, os.path.splitext(fn)[0].split("_")[0])))
+    return out
+
+def _rss_mb() -> float:
+    """当前常驻内存（Linux 读 /proc，其它平台退化为峰值）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except Exception:
+        return _peak_rss_mb()
+
+def _peak_rss_mb() -> float:
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0  # Linux: KB
+    except Exception:
+        return 0.0
+
+def _bench_one(read_fn, samples, repeat: int) -> Dict[str, Any]:
+    read_fn(samples[0][1])  # 预热，不计时
+    rss0 = _rss_mb()
+    lat, correct = [], 0
+    for _ in range(repeat):
+        for _, img, label in samples:
+            t0 = time.perf_counter()
+            r = read_fn(img)
+            lat.append(time.perf_counter() - t0)
+            expect = OCRManager._parse_price(OCRManager._clean_digits(label))
+            correct += int(r.value is not None and expect is not None and abs(r.value - expect) < 1e-9)
+    a = np.asarray(lat) * 1000
+    return {
+        "n": len(lat),
+        "p50_ms": round(float(np.percentile(a, 50)), 4),
+        "p95_ms": round(float(np.percentile(a, 95)), 4),
+        "p99_ms": round(float(np.percentile(a, 99)), 4),
+        "mean_ms": round(float(a.mean()), 4),
+        "reads_per_s": round(len(lat) / max(1e-9, float(np.sum(lat))), 2),
+        "accuracy": round(correct / len(lat), 4),
+        "rss_mb": round(_rss_mb(), 1),
+        "rss_delta_mb": round(_rss_mb() - rss0, 1),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+def run_ocr_benchmark(samples, backends=("glyph", "paddle", "easyocr"), scales=(1.0, 1.5, 2.0),
+                      binarize_opts=(True, False), rec_only_opts=(True, False), gpu: bool = False,
+                      glyph_path: Optional[str] = None, glyph_train: int = 5, repeat: int = 3,
+                      logger=lambda s: None) -> Dict[str, Any]:
+    """
+    对语料逐一跑 后端 × 预处理（scale / binarize）× 识别模式 组合，返回可 diff 的结果字典。
+    glyph 后端：有模板文件则直接加载，否则用语料前 glyph_train 张学习并从评测集中剔除。
+    """
+    import platform
+    results = []
+    for backend in backends:
+        if backend == "glyph":
+            train, evals = ([], samples) if glyph_path else (samples[:glyph_train], samples[glyph_train:])
+            if not evals:
+                logger("glyph: 语料不足，跳过")
+                continue
+            for sc in scales:
+                g = GlyphDigitRecognizer(glyph_path, scale=sc)
+                for _, img, label in train:
+                    g.learn(img, label)
+                if not g.ready:
+                    logger(f"glyph scale={sc}: 无可用模板，跳过")
+                    continue
+                row = {"backend": "glyph", "rec_only": None, "scale": sc, "binarize": True}
+                row.update(_bench_one(g.read, evals, repeat))
+                results.append(row)
+                logger(json.dumps(row, ensure_ascii=False))
+            continue
+        mgr = OCRManager(logger, glyph_path=None, cache_size=0, defer=True)
+        try:
+            mgr._load_backend(backend, gpu=gpu)
         except Exception as e:
-            self.log.emit("模式2线程异常：" + str(e))
-            self.log.emit(traceback.format_exc())
-        finally:
-            self.finished.emit()
+            logger(f"{backend}: 不可用（{e}），跳过")
+            continue
+        for rec_only in rec_only_opts:
+            for sc in scales:
+                for bz in binarize_opts:
+                    mgr.rec_only, mgr.pre_scale, mgr.pre_binarize = rec_only, sc, bz
+                    row = {"backend": backend, "rec_only": rec_only, "scale": sc, "binarize": bz}
+                    row.update(_bench_one(mgr._read_price_uncached, samples, repeat))
+                    results.append(row)
+                    logger(json.dumps(row, ensure_ascii=False))
+    return {
+        "schema": BENCH_SCHEMA_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "processor": platform.processor(), "cpus": os.cpu_count(), "gpu": gpu},
+        "corpus_size": len(samples),
+        "results": results,
+    }
+
+def bench_ocr_main(argv: List[str]) -> int:
+    """python run_app.py bench-ocr <语料目录> [...]：无界面 OCR 基准，结果为 JSON"""
+    import argparse
+    ap = argparse.ArgumentParser(prog="run_app.py bench-ocr", description="离线 OCR 基准（延迟 / 吞吐 / 准确率 / 内存）")
+    ap.add_argument("corpus", help="已标注价格 ROI 图片目录")
+    ap.add_argument("--backends", default="glyph,paddle,easyocr")
+    ap.add_argument("--scales", default="1.0,1.5,2.0")
+    ap.add_argument("--binarize", choices=["both", "on", "off"], default="both")
+    ap.add_argument("--rec-modes", choices=["both", "rec", "det"], default="both",
+                    help="rec=仅识别，det=检测+识别")
+    ap.add_argument("--gpu", action="store_true")
+    ap.add_argument("--glyphs", default=None, help="字形模板文件；不指定则用语料前 N 张学习")
+    ap.add_argument("--glyph-train", type=int, default=5)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--out", default=None, help="结果 JSON 输出路径（默认 stdout）")
+    args = ap.parse_args(argv)
+
+    log = lambda s: print(s, file=sys.stderr, flush=True)
+    samples = load_roi_corpus(args.corpus)
+    if not samples:
+        log(f"语料目录为空：{args.corpus}")
+        return 2
+    report = run_ocr_benchmark(
+        samples,
+        backends=[b.strip() for b in args.backends.split(",") if b.strip()],
+        scales=[float(x) for x in args.scales.split(",")],
+        binarize_opts={"both": (True, False), "on": (True,), "off": (False,)}[args.binarize],
+        rec_only_opts={"both": (True, False), "rec": (True,), "det": (False,)}[args.rec_modes],
+        gpu=args.gpu, glyph_path=args.glyphs, glyph_train=args.glyph_train,
+        repeat=max(1, args.repeat), logger=log)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+        log(f"结果已写入 {args.out}")
+    else:
+        print(text)
+    return 0
+
+def tune_ocr_main(argv: List[str]) -> int:
+    """python run_app.py tune-ocr <语料目录> --region price1 [...]：为区域搜索最省时且足够准确的预处理"""
+    import argparse
+    ap = argparse.ArgumentParser(prog="run_app.py tune-ocr", description="价格区域预处理自动调优")
+    ap.add_argument("corpus", help="该区域已标注的价格 ROI 图片目录（格式同 bench-ocr）")
+    ap.add_argument("--region", required=True, help="price1 / price2（模式1）或 price（模式2）")
+    ap.add_argument("--backend", choices=["paddle", "easyocr"], default="paddle")
+    ap.add_argument("--gpu", action="store_true")
+    ap.add_argument("--rec-only", choices=["on", "off"], default="on", help="与运行时 ocr_recognition_only 保持一致")
+    ap.add_argument("--target", type=float, default=0.98, help="最低准确率")
+    ap.add_argument("--config", default=DEFAULT_CONFIG_PATH, help="写入 ocr_profiles 的配置文件")
+    ap.add_argument("--dry-run", action="store_true", help="只输出结果，不写配置")
+    ap.add_argument("--out", default=None, help="全部组合的结果 JSON 输出路径")
+    args = ap.parse_args(argv)
+
+    log = lambda s: print(s, file=sys.stderr, flush=True)
+    samples = [(img, label) for _, img, label in load_roi_corpus(args.corpus)]
+    if not samples:
+        log(f"语料目录为空：{args.corpus}")
+        return 2
+    ocr = OCRManager(log, glyph_path=None, cache_size=0, defer=True, rec_only=args.rec_only == "on")
+    try:
+        ocr._load_backend(args.backend, gpu=args.gpu)
+    except Exception as e:
+        log(f"OCR 引擎 {args.backend} 不可用：{e}")
+        return 2
+    best, results = PreprocessTuner(ocr, args.target, log).tune(samples)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    if best is None:
+        log(f"没有组合达到准确率 {args.target}，配置未修改。")
+        return 1
+    base = next(r for r in results if r["name"] == str(PreprocessProfile()))
+    chosen = next(r for r in results if r["name"] == str(best))
+    log(f"区域 {args.region}：选用 {best}（p50 {chosen['p50_ms']}ms，默认流程 p50 {base['p50_ms']}ms）")
+    if not args.dry_run:
+        mgr = ConfigManager(args.config, logger=log)
+        mgr.load()
+        mgr.config.ocr_profiles[args.region] = best
+        mgr.save()
+    print(json.dumps({"region": args.region, "profile": best.to_json(), "p50_ms": chosen["p50_ms"],
+                      "default_p50_ms": base["p50_ms"]}, ensure_ascii=False))
+    return 0
+
+def price_stats_main(argv: List[str]) -> int:
+    """python run_app.py price-stats [...]：查询价格历史库，结果为 JSON"""
+    import argparse
+    ap = argparse.ArgumentParser(prog="run_app.py price-stats", description="价格历史统计（最低价 / 分位数 / 变动频率）")
+    ap.add_argument("--path", default=PRICE_HISTORY_PATH)
+    ap.add_argument("--item", default=None, help="商品名（模式2 为 mode2，单商品模式1 为 mode1）")
+    ap.add_argument("--region", default=None, help="price1 / price2 / price")
+    ap.add_argument("--since", type=float, default=None, help="只看最近 N 秒")
+    ap.add_argument("--by-item", action="store_true", help="按商品分别统计")
+    args = ap.parse_args(argv)
+
+    store = PriceHistoryStore(args.path)
+    t0 = time.time() - args.since if args.since else None
+    if args.by_item:
+        report = {name: store.stats(t0=t0, item=name, region=args.region) for name in store.items}
+    else:
+        report = store.stats(t0=t0, item=args.item, region=args.region)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 0
 
-# ============================= UI =============================
-class DragPickButton(QPushButton):
+# ============================= Offline replay harness =============================
+class FramePlayer(Screen):
     """
-    拖到屏幕任意位置松开以采集坐标；coordPicked(x, y)
+    离线 Screen：按时间线提供整屏 BGRA 帧，代替 mss 抓屏（worker 的 screen 参数）。
+    子类实现 frame_at(t)；on_input() 由 PlayerInput 调用，可让画面对点击 / 按键作出反应。
+    返回的帧应视为只读（grab_raw 直接返回其视图）。
     """
-    coordPicked = Signal(int, int)
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.t0 = clock()
+        self._lock = threading.Lock()
+        self.grabs = 0
+
+    def start(self):
+        self.t0 = self.clock()
+
+    def now(self) -> float:
+        return self.clock() - self.t0
+
+    def frame_at(self, t: float) -> np.ndarray:
+        raise NotImplementedError
+
+    def on_input(self, op: str, args: tuple):
+        pass
+
+    @traced("grab")
+    def grab_raw(self, region: Tuple[int,int,int,int]) -> np.ndarray:
+        x, y, w, h = (int(v) for v in region)
+        with self._lock:
+            self.grabs += 1
+            f = self.frame_at(self.now())
+        return f[y:y + h, x:x + w]
+
+    @traced("grab")
+    def grab_region(self, region: Tuple[int,int,int,int]) -> np.ndarray:
+        return np.ascontiguousarray(self.grab_raw(region)[..., :3])
 
-    def mousePressEvent(self, e: QtGui.QMouseEvent):
-        super().mousePressEvent(e)
-        self.setCursor(Qt.ClosedHandCursor)
 
-    def mouseReleaseEvent(self, e: QtGui.QMouseEvent):
-        super().mouseReleaseEvent(e)
-        self.setCursor(Qt.ArrowCursor)
-        pos = QCursor.pos()
-        self.coordPicked.emit(pos.x(), pos.y())
+class FrameSequence(FramePlayer):
+    """录制好的帧序列：npz（t: 秒 float64[N]，frames: uint8[N,H,W,4] BGRA）按时间线循环播放，不响应输入"""
+    def __init__(self, times: np.ndarray, frames: np.ndarray, loop: bool = True, clock=time.perf_counter):
+        super().__init__(clock)
+        self.times = np.asarray(times, np.float64)
+        self.frames = frames
+        self.loop = loop
+        self.span = float(self.times[-1]) + (float(np.diff(self.times).mean()) if len(self.times) > 1 else 1.0)
 
-class RegionPickerOverlay(QWidget):
+    @classmethod
+    def load(cls, path: str, loop: bool = True) -> 'FrameSequence':
+        with np.load(path) as z:
+            return cls(z["t"], z["frames"], loop)
+
+    def frame_at(self, t: float) -> np.ndarray:
+        if self.loop:
+            t = t % self.span
+        i = int(np.searchsorted(self.times, t, side="right")) - 1
+        return self.frames[min(max(i, 0), len(self.frames) - 1)]
+
+
+class SyntheticMarket(FramePlayer):
     """
-    全屏半透明覆盖层，框选矩形区域；regionSelected(x,y,w,h)
+    合成的模式1 交易界面（固定随机种子，每次运行画面与价格时间线完全相同）：
+    - 价格时间线：基准价每 tick 秒随机游走，每隔约 dip_every 秒出现一段低于阈值的低价（持续 dip_len 秒）
+    - 画面状态随输入切换：点货物 -> 显示价格1；点最大额度 -> 再显示价格2；点购买 -> 记一次成交并回到列表；Esc -> 列表
+    - 每个区域画面登记真值（像素哈希 -> 价格），供 OracleOCR 查询
+    - 记录每段低价的出现时刻、首次被画到屏幕上的时刻和第一次购买点击时刻
     """
-    regionSelected = Signal(int,int,int,int)
+    W, H = 360, 160
+    PRICE1 = (10, 10, 120, 30)
+    PRICE2 = (10, 60, 120, 30)
+    ITEM = (200, 10, 60, 30)
+    MAX = (200, 60, 60, 30)
+    BUY = (200, 110, 60, 30)
 
-    def __init__(self):
-        super().__init__(None, Qt.FramelessWindowHint | Qt.WindowStaysOnTopHint)
-        self.setAttribute(Qt.WA_TranslucentBackground, True)
-        self.start = None
-        self.end = None
-        self.setMouseTracking(True)
-        self.showFullScreen()
-
-    def paintEvent(self, e):
-        if self.start and self.end:
-            p = QtGui.QPainter(self)
-            p.setRenderHint(QtGui.QPainter.Antialiasing)
-            rect = QRect(self.start, self.end).normalized()
-            p.setPen(QtGui.QPen(QtGui.QColor(0, 255, 0, 200), 2))
-            p.setBrush(QtGui.QBrush(QtGui.QColor(0, 0, 0, 50)))
-            p.drawRect(rect)
-
-    def mousePressEvent(self, e: QtGui.QMouseEvent):
-        self.start = e.globalPosition().toPoint()
-        self.end = self.start
-        self.update()
-
-    def mouseMoveEvent(self, e: QtGui.QMouseEvent):
-        self.end = e.globalPosition().toPoint()
-        self.update()
-
-    def mouseReleaseEvent(self, e: QtGui.QMouseEvent):
-        self.end = e.globalPosition().toPoint()
-        rect = QRect(self.start, self.end).normalized()
-        self.regionSelected.emit(rect.x(), rect.y(), rect.width(), rect.height())
-        self.close()
-
-# ============================= Main Window =============================
-class MainWindow(QMainWindow):
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("游戏商城自动抢货工具（GPU OCR）")
-        self.resize(1024, 720)
+    def __init__(self, threshold: float = 100.0, duration: float = 10.0, seed: int = 0, tick: float = 0.5,
+                 dip_every: float = 2.0, dip_len: float = 0.6, clock=time.perf_counter):
+        super().__init__(clock)
+        self.threshold = threshold
+        rng = np.random.default_rng(seed)
+        # 价格时间线：分段常数 (起点秒, 价格)
+        starts, prices = [], []
+        t, base = 0.0, threshold * 1.2
+        next_dip = dip_every * rng.uniform(0.5, 1.0)
+        while t < duration:
+            if t >= next_dip:
+                starts.append(t)
+                prices.append(round(threshold * rng.uniform(0.7, 0.95)))
+                t += dip_len
+                next_dip = t + dip_every * rng.uniform(0.5, 1.5)
+                continue
+            base = float(np.clip(base + rng.normal(0, threshold * 0.03), threshold * 1.02, threshold * 1.5))
+            starts.append(t)
+            prices.append(round(base))
+            t += min(tick, next_dip - t) if next_dip > t else tick
+        starts.append(t)
+        prices.append(round(threshold * 1.2))
+        self.starts = np.asarray(starts, np.float64)
+        self.prices = np.asarray(prices, np.float64)
+        self.dips = [i for i, p in enumerate(prices) if p < threshold]
+        self.state = "list"
+        self._frames: Dict[Tuple[str, float], np.ndarray] = {}
+        self._key = OCRResultCache(0).key
+        self.truth: Dict[bytes, float] = {}
+        self.shown: Dict[int, float] = {}                 # 低价段 -> 首次出现在画面上的时刻
+        self.bought: Dict[int, float] = {}                # 低价段 -> 第一次购买点击时刻
+        self.buys: List[Tuple[float, float]] = []         # (时刻, 成交价)
+        self.stale_buys = 0                               # 点击购买时价格已回到阈值以上
+
+    def config(self) -> AppConfig:
+        """与画面布局对应的配置（输入走记录后端，不写价格历史 / 飞行记录）"""
+        cfg = AppConfig()
+        center = lambda r: (r[0] + r[2] // 2, r[1] + r[3] // 2)
+        cfg.price1_region = Region(*self.PRICE1)
+        cfg.price2_region = Region(*self.PRICE2)
+        cfg.mode1_item_click_coord = center(self.ITEM)
+        cfg.max_amount_button = center(self.MAX)
+        cfg.buy_button = center(self.BUY)
+        cfg.input_backend = "recording"
+        cfg.price_history_enabled = False
+        cfg.flight_recorder_s = 0.0
+        return cfg
 
-        self.log_box = QTextEdit(readOnly=True)
-        self.log_box.setLineWrapMode(QTextEdit.NoWrap)
+    def segment(self, t: float) -> int:
+        return max(0, int(np.searchsorted(self.starts, t, side="right")) - 1)
 
-        self.cfg_mgr = ConfigManager(logger=self._log)
-        self.cfg_mgr.load()
-        self.ocr = OCRManager(logger=self._log)
-        self.stop_flag = threading.Event()
+    def _render(self, state: str, price: float) -> np.ndarray:
+        f = np.zeros((self.H, self.W, 4), np.uint8)
+        f[..., 3] = 255
+        for (x, y, w, h) in (self.ITEM, self.MAX, self.BUY):
+            f[y:y + h, x:x + w, :3] = 90
+        shown = {"item": (self.PRICE1,), "confirm": (self.PRICE1, self.PRICE2)}.get(state, ())
+        for (x, y, w, h) in shown:
+            cv2.putText(f, f"{price:.0f}", (x + 6, y + h - 8), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255, 255), 2)
+            self.truth[self._key(np.ascontiguousarray(f[y:y + h, x:x + w]))] = price
+        return f
 
-        self.mode1_thread: Optional[Mode1Worker] = None
-        self.mode2_thread: Optional[Mode2Worker] = None
-
-        # Macros for Mode 2
-        self.macro1 = MacroRecorder(self._log)
-        self.macro2 = MacroRecorder(self._log)
-
-        # Global hotkeys
-        self._gh_listener = None
-        self._setup_global_hotkeys()
-
-        self._build_ui()
-        self._log("提示：窗口内 F2 捕捉点、F3 框选、F8 开始、F9 停止；同时支持**全局热键**：F8(模式1)、Shift+F8(模式2)、F9(停止)。")
-
-    # ---------- Global Hotkeys ----------
-    def _setup_global_hotkeys(self):
-        def start_mode1():
-            self._start_mode1()
-        def start_mode2():
-            self._start_mode2()
-        def stop_all():
-            self._stop_all()
-        # 全局监听（需要管理员权限）
-        try:
-            self._gh_listener = GlobalHotKeys({
-                '<f8>': start_mode1,
-                '<shift>+<f8>': start_mode2,
-                '<f9>': stop_all
-            })
-            self._gh_listener.start()
-            self._log("全局热键已注册：F8=模式1，Shift+F8=模式2，F9=停止。若无效请用管理员运行。")
-        except Exception as e:
-            self._log(f"⚠️ 全局热键注册失败：{e}（可用窗口内快捷键代替）")
+    def frame_at(self, t: float) -> np.ndarray:
+        i = self.segment(t)
+        price = float(self.prices[i])
+        if self.state != "list" and price < self.threshold and i not in self.shown:
+            self.shown[i] = t
+        k = (self.state, price if self.state != "list" else 0.0)
+        f = self._frames.get(k)
+        if f is None:
+            f = self._frames[k] = self._render(*k)
+        return f
 
-    def closeEvent(self, e: QtGui.QCloseEvent):
-        try:
-            if self._gh_listener:
-                self._gh_listener.stop()
-        except:
-            pass
-        return super().closeEvent(e)
-
-    # ---------- UI Tabs ----------
-    def _build_ui(self):
-        self.tabs = QTabWidget()
-
-        self.tabs.addTab(self._build_config_tab(), "配置/坐标")
-        self.tabs.addTab(self._build_mode1_tab(), "模式1：扫货")
-        self.tabs.addTab(self._build_mode2_tab(), "模式2：宏控制")
-        self.tabs.addTab(self._build_log_tab(), "日志")
-
-        # Global controls
-        topbar = QHBoxLayout()
-        self.btn_load = QPushButton("读取配置")
-        self.btn_save = QPushButton("保存配置")
-        self.btn_load.clicked.connect(self._on_load)
-        self.btn_save.clicked.connect(self._on_save)
-        topbar.addWidget(self.btn_load)
-        topbar.addWidget(self.btn_save)
-        topbar.addStretch()
-
-        container = QWidget()
-        layout = QVBoxLayout(container)
-        layout.addLayout(topbar)
-        layout.addWidget(self.tabs)
-        self.setCentralWidget(container)
-
-        self.installEventFilter(self)
-
-    def _build_log_tab(self):
-        w = QWidget()
-        v = QVBoxLayout(w)
-        v.addWidget(self.log_box)
-        return w
-
-    def _build_config_tab(self):
-        w = QWidget()
-        grid = QGridLayout(w)
-
-        def coord_row(label_text, getter, setter):
-            row = QWidget()
-            h = QHBoxLayout(row)
-            h.addWidget(QLabel(label_text))
-            x = QLineEdit(); x.setPlaceholderText("x")
-            y = QLineEdit(); y.setPlaceholderText("y")
-            pb = DragPickButton("拖我到目标地址（松开即记录）")
-            pb.setFixedWidth(220)
-            def on_pick(px, py):
-                x.setText(str(px)); y.setText(str(py))
-            pb.coordPicked.connect(on_pick)
-            def load_vals():
-                vx, vy = getter()
-                x.setText(str(vx)); y.setText(str(vy))
-            def save_vals():
-                try:
-                    setter((int(x.text()), int(y.text())))
-                    self._log(f"{label_text} 坐标设置为 {x.text()},{y.text()}")
-                except:
-                    pass
-            btn_load = QPushButton("读入")
-            btn_save = QPushButton("应用")
-            btn_load.clicked.connect(load_vals)
-            btn_save.clicked.connect(save_vals)
-            h.addWidget(x); h.addWidget(y); h.addWidget(pb); h.addWidget(btn_load); h.addWidget(btn_save)
-            return row
-
-        def region_row(label_text, getter, setter):
-            row = QWidget()
-            h = QHBoxLayout(row)
-            h.addWidget(QLabel(label_text))
-            ex = QLineEdit(); ex.setPlaceholderText("x")
-            ey = QLineEdit(); ey.setPlaceholderText("y")
-            ew = QLineEdit(); ew.setPlaceholderText("w")
-            eh = QLineEdit(); eh.setPlaceholderText("h")
-            btn_pick = QPushButton("框选区域(F3)")
-            def pick_region():
-                overlay = RegionPickerOverlay()
-                overlay.regionSelected.connect(lambda x,y,w,h: (
-                    ex.setText(str(x)), ey.setText(str(y)), ew.setText(str(w)), eh.setText(str(h))
-                ))
-                overlay.show()
-            btn_apply = QPushButton("应用")
-            def apply_region():
-                try:
-                    setter(Region(int(ex.text()), int(ey.text()), int(ew.text()), int(eh.text())))
-                    self._log(f"{label_text} 设置为 ({ex.text()},{ey.text()},{ew.text()},{eh.text()})")
-                except:
-                    pass
-            btn_load = QPushButton("读入")
-            def load_vals():
-                r = getter()
-                ex.setText(str(r.x)); ey.setText(str(r.y)); ew.setText(str(r.w)); eh.setText(str(r.h))
-            btn_pick.clicked.connect(pick_region)
-            btn_apply.clicked.connect(apply_region)
-            btn_load.clicked.connect(load_vals)
-            h.addWidget(ex); h.addWidget(ey); h.addWidget(ew); h.addWidget(eh)
-            h.addWidget(btn_pick); h.addWidget(btn_load); h.addWidget(btn_apply)
-            return row
-
-        # 基础坐标
-        grid.addWidget(coord_row("交易行按钮", lambda: self.cfg_mgr.config.trade_button, self._set_trade), 0, 0)
-        grid.addWidget(coord_row("主界面按钮", lambda: self.cfg_mgr.config.main_menu_button, self._set_main), 1, 0)
-        grid.addWidget(coord_row("装备分类按钮", lambda: self.cfg_mgr.config.category_button, self._set_category), 2, 0)
-        grid.addWidget(coord_row("购买按钮", lambda: self.cfg_mgr.config.buy_button, self._set_buy), 3, 0)
-        grid.addWidget(coord_row("最大额度按钮", lambda: self.cfg_mgr.config.max_amount_button, self._set_max), 4, 0)
-        grid.addWidget(region_row("价格1区域", lambda: self.cfg_mgr.config.price1_region, self._set_price1), 5, 0)
-        grid.addWidget(region_row("价格2区域", lambda: self.cfg_mgr.config.price2_region, self._set_price2), 6, 0)
-
-        # （模式1）货物点击坐标 + 立即刷新开关 + 最大额度点击次数
-        grid.addWidget(coord_row("（模式1）货物点击坐标",
-                                 lambda: self.cfg_mgr.config.mode1_item_click_coord,
-                                 lambda xy: setattr(self.cfg_mgr.config, "mode1_item_click_coord", xy)
-                                 ), 7, 0)
-
-        h2 = QHBoxLayout()
-        self.cb_refresh_immediate = QCheckBox("不符合立即 Esc+再点货物刷新（推荐）")
-        self.cb_refresh_immediate.setChecked(self.cfg_mgr.config.mode1_refresh_immediate)
-        self.cb_refresh_immediate.stateChanged.connect(lambda s: setattr(self.cfg_mgr.config, "mode1_refresh_immediate", bool(s)))
-        h2.addWidget(self.cb_refresh_immediate)
-
-        h2.addWidget(QLabel("最大额度点击次数："))
-        self.spin_max_clicks = QSpinBox()
-        self.spin_max_clicks.setRange(1, 5)
-        self.spin_max_clicks.setValue(self.cfg_mgr.config.max_amount_clicks)
-        self.spin_max_clicks.valueChanged.connect(lambda v: setattr(self.cfg_mgr.config, "max_amount_clicks", int(v)))
-        h2.addWidget(self.spin_max_clicks)
-        h2.addStretch()
-        grid.addLayout(h2, 8, 0)
-
-        # Interval
-        h = QHBoxLayout()
-        h.addWidget(QLabel("OCR间隔(ms)："))
-        self.spin_interval = QSpinBox()
-        self.spin_interval.setRange(30, 5000)
-        self.spin_interval.setValue(self.cfg_mgr.config.scan_interval_ms)
-        self.spin_interval.valueChanged.connect(lambda v: setattr(self.cfg_mgr.config, "scan_interval_ms", int(v)))
-        h.addWidget(self.spin_interval)
-        h.addStretch()
-        grid.addLayout(h, 9, 0)
-
-        tips = QLabel("提示：拖拽按钮到目标位置（松开即记录）；窗口内也支持 F2/F3/F8/F9。若切到游戏，用全局热键 F8/Shift+F8/F9。")
-        tips.setWordWrap(True)
-        grid.addWidget(tips, 10, 0)
-
-        return w
-
-    def _build_mode1_tab(self):
-        w = QWidget()
-        v = QVBoxLayout(w)
-
-        h = QHBoxLayout()
-        h.addWidget(QLabel("扫货最低价阈值："))
-        self.edit_threshold = QLineEdit()
-        self.edit_threshold.setPlaceholderText("例如 1234.56")
-        h.addWidget(self.edit_threshold)
-
-        self.btn_mode1_start = QPushButton("开始模式1（F8 / 全局F8）")
-        self.btn_mode1_stop = QPushButton("停止（F9 / 全局F9）")
-        self.btn_mode1_start.clicked.connect(self._start_mode1)
-        self.btn_mode1_stop.clicked.connect(self._stop_all)
-        h.addWidget(self.btn_mode1_start)
-        h.addWidget(self.btn_mode1_stop)
-        h.addStretch()
-        v.addLayout(h)
-
-        self.lbl_price1 = QLabel("价格1：-")
-        self.lbl_price2 = QLabel("价格2：-")
-        v.addWidget(self.lbl_price1)
-        v.addWidget(self.lbl_price2)
-
-        return w
-
-    def _build_mode2_tab(self):
-        w = QWidget()
-        grid = QGridLayout(w)
-
-        # price coord
-        self.btn_pick_price_coord = DragPickButton("拖到价格坐标处（松开记录）")
-        self.btn_pick_price_coord.coordPicked.connect(lambda x,y: self._set_mode2_price_coord((x,y)))
-        grid.addWidget(QLabel("价格坐标："), 0, 0)
-        self.mode2_x = QLineEdit(); self.mode2_x.setPlaceholderText("x")
-        self.mode2_y = QLineEdit(); self.mode2_y.setPlaceholderText("y")
-        grid.addWidget(self.mode2_x, 0, 1); grid.addWidget(self.mode2_y, 0, 2); grid.addWidget(self.btn_pick_price_coord, 0, 3)
-
-        # threshold
-        grid.addWidget(QLabel("价格阈值："), 1, 0)
-        self.mode2_threshold = QLineEdit(str(self.cfg_mgr.config.mode2_threshold))
-        grid.addWidget(self.mode2_threshold, 1, 1)
-
-        # target color
-        grid.addWidget(QLabel("终止条件颜色坐标："), 2, 0)
-        self.btn_pick_color_coord = DragPickButton("拖到像素位置")
-        self.btn_pick_color_coord.coordPicked.connect(lambda x,y: self._set_mode2_color_coord((x,y)))
-        self.mode2_color_x = QLineEdit(); self.mode2_color_x.setPlaceholderText("x")
-        self.mode2_color_y = QLineEdit(); self.mode2_color_y.setPlaceholderText("y")
-        grid.addWidget(self.mode2_color_x, 2, 1); grid.addWidget(self.mode2_color_y, 2, 2); grid.addWidget(self.btn_pick_color_coord, 2, 3)
-
-        grid.addWidget(QLabel("目标颜色(R,G,B)："), 3, 0)
-        self.mode2_color_r = QLineEdit(str(self.cfg_mgr.config.mode2_target_color_rgb[0]))
-        self.mode2_color_g = QLineEdit(str(self.cfg_mgr.config.mode2_target_color_rgb[1]))
-        self.mode2_color_b = QLineEdit(str(self.cfg_mgr.config.mode2_target_color_rgb[2]))
-        btn_pick_color = QPushButton("颜色选择器")
-        def pick_color():
-            c = QColorDialog.getColor()
-            if c.isValid():
-                self.mode2_color_r.setText(str(c.red()))
-                self.mode2_color_g.setText(str(c.green()))
-                self.mode2_color_b.setText(str(c.blue()))
-        grid.addWidget(self.mode2_color_r, 3, 1)
-        grid.addWidget(self.mode2_color_g, 3, 2)
-        grid.addWidget(self.mode2_color_b, 3, 3)
-        grid.addWidget(btn_pick_color, 3, 4)
-
-        # macro recorders
-        self.btn_rec1 = QPushButton("录制操作1（再点停止）")
-        self.btn_stop_rec1 = QPushButton("停止录制1")
-        self.btn_play1 = QPushButton("回放操作1")
-        self.btn_rec2 = QPushButton("录制操作2（再点停止）")
-        self.btn_stop_rec2 = QPushButton("停止录制2")
-        self.btn_play2 = QPushButton("回放操作2")
-        self.btn_rec1.clicked.connect(lambda: self.macro1.start())
-        self.btn_stop_rec1.clicked.connect(lambda: self.macro1.stop())
-        self.btn_play1.clicked.connect(lambda: self.macro1.replay(stop_flag_callable=lambda: self.stop_flag.is_set()))
-        self.btn_rec2.clicked.connect(lambda: self.macro2.start())
-        self.btn_stop_rec2.clicked.connect(lambda: self.macro2.stop())
-        self.btn_play2.clicked.connect(lambda: self.macro2.replay(stop_flag_callable=lambda: self.stop_flag.is_set()))
-        grid.addWidget(self.btn_rec1, 4, 0); grid.addWidget(self.btn_stop_rec1, 4, 1); grid.addWidget(self.btn_play1, 4, 2)
-        grid.addWidget(self.btn_rec2, 5, 0); grid.addWidget(self.btn_stop_rec2, 5, 1); grid.addWidget(self.btn_play2, 5, 2)
-
-        # controls
-        self.btn_mode2_start = QPushButton("开始模式2（Shift+F8 / 全局Shift+F8）")
-        self.btn_mode2_stop = QPushButton("停止（F9 / 全局F9）")
-        self.btn_mode2_start.clicked.connect(self._start_mode2)
-        self.btn_mode2_stop.clicked.connect(self._stop_all)
-        grid.addWidget(self.btn_mode2_start, 6, 0)
-        grid.addWidget(self.btn_mode2_stop, 6, 1)
-
-        return w
-
-    # ---------------- Event Filter for window-level hotkeys ----------------
-    def eventFilter(self, obj, event):
-        if event.type() == QtCore.QEvent.KeyPress:
-            key = event.key()
-            if key == Qt.Key_F2:
-                pos = QCursor.pos()
-                self._log(f"F2 捕捉坐标：{pos.x()},{pos.y()}")
-                self._fill_focused_coord(pos.x(), pos.y())
-                return True
-            elif key == Qt.Key_F3:
-                self._log("F3：框选区域")
-                overlay = RegionPickerOverlay()
-                overlay.regionSelected.connect(lambda x,y,w,h: self._log(f"区域：{x},{y},{w},{h}"))
-                overlay.show()
-                return True
-            elif key == Qt.Key_F8:
-                idx = self.tabs.currentIndex()
-                if idx == 1:
-                    self._start_mode1()
-                elif idx == 2:
-                    self._start_mode2()
+    @staticmethod
+    def _hit(r, x, y) -> bool:
+        return r[0] <= x < r[0] + r[2] and r[1] <= y < r[1] + r[3]
+
+    def on_input(self, op: str, args: tuple):
+        with self._lock:
+            if op == "key_down" and args[0] in ("esc", "Key.esc"):
+                self.state = "list"
+                return
+            if op != "down":
+                return
+            x, y = args[0], args[1]
+            if self._hit(self.ITEM, x, y):
+                self.state = "item"
+            elif self._hit(self.MAX, x, y) and self.state in ("item", "confirm"):
+                self.state = "confirm"
+            elif self._hit(self.BUY, x, y) and self.state == "confirm":
+                t = self.now()
+                i = self.segment(t)
+                price = float(self.prices[i])
+                self.buys.append((t, price))
+                if price < self.threshold:
+                    self.bought.setdefault(i, t)
                 else:
-                    self._start_mode1()
-                return True
-            elif key == Qt.Key_F9:
-                self._stop_all()
-                return True
-        return super().eventFilter(obj, event)
-
-    def _fill_focused_coord(self, x, y):
-        w = QApplication.focusWidget()
-        if isinstance(w, QLineEdit):
-            w.setText(str(x))
-            # 尝试给下一个焦点控件写入 y
-            QApplication.sendEvent(self, QtGui.QKeyEvent(QtCore.QEvent.KeyPress, Qt.Key_Tab, Qt.NoModifier))
-            w2 = QApplication.focusWidget()
-            if isinstance(w2, QLineEdit):
-                w2.setText(str(y))
-
-    # ---------------- Config setters ----------------
-    def _set_trade(self, xy): self.cfg_mgr.config.trade_button = xy
-    def _set_main(self, xy): self.cfg_mgr.config.main_menu_button = xy
-    def _set_category(self, xy): self.cfg_mgr.config.category_button = xy
-    def _set_buy(self, xy): self.cfg_mgr.config.buy_button = xy
-    def _set_max(self, xy): self.cfg_mgr.config.max_amount_button = xy
-    def _set_price1(self, r: 'Region'): self.cfg_mgr.config.price1_region = r
-    def _set_price2(self, r: 'Region'): self.cfg_mgr.config.price2_region = r
-    def _set_mode2_price_coord(self, xy):
-        self.cfg_mgr.config.mode2_price_coord = xy
-        self.mode2_x.setText(str(xy[0])); self.mode2_y.setText(str(xy[1]))
-
-    # ---------------- Buttons ----------------
-    def _on_load(self):
-        try:
-            path, _ = QFileDialog.getOpenFileName(self, "选择配置", ".", "JSON (*.json)")
-            if path:
-                self.cfg_mgr.path = path
-                self.cfg_mgr.load()
-                # refresh UI reflect critical fields
-                self.spin_interval.setValue(self.cfg_mgr.config.scan_interval_ms)
-                self.mode2_threshold.setText(str(self.cfg_mgr.config.mode2_threshold))
-                self.mode2_x.setText(str(self.cfg_mgr.config.mode2_price_coord[0]))
-                self.mode2_y.setText(str(self.cfg_mgr.config.mode2_price_coord[1]))
-                # 模式1新增字段
-                self.cb_refresh_immediate.setChecked(self.cfg_mgr.config.mode1_refresh_immediate)
-                self.spin_max_clicks.setValue(self.cfg_mgr.config.max_amount_clicks)
-        except Exception as e:
-            self._log("读取失败：" + str(e))
-            self._log(traceback.format_exc())
+                    self.stale_buys += 1
+                self.state = "list"
 
-    def _on_save(self):
-        try:
-            try:
-                self.cfg_mgr.config.mode2_threshold = float(self.mode2_threshold.text() or "0")
-            except:
-                pass
-            try:
-                self.cfg_mgr.config.scan_interval_ms = int(self.spin_interval.value())
-            except:
-                pass
-            self.cfg_mgr.save()
-        except Exception as e:
-            self._log("保存失败：" + str(e))
-            self._log(traceback.format_exc())
+    def report(self) -> Dict[str, Any]:
+        """只统计已经开始的低价段；延迟单位毫秒"""
+        now = self.now()
+        dips = [i for i in self.dips if self.starts[i] < now]
+        appear = [1000 * (self.bought[i] - self.starts[i]) for i in dips if i in self.bought]
+        shown = [1000 * (self.bought[i] - self.shown[i]) for i in dips if i in self.bought and i in self.shown]
+        return {"dips": len(dips), "dips_bought": len(appear), "missed": len(dips) - len(appear),
+                "buys": len(self.buys), "stale_buys": self.stale_buys,
+                "appear_to_buy_ms": _latency_summary(appear), "shown_to_buy_ms": _latency_summary(shown)}
 
-    def _start_mode1(self):
-        if self.mode1_thread and self.mode1_thread.isRunning():
-            self._log("模式1已在运行。")
-            return
-        try:
-            th = float(self.edit_threshold.text())
-        except:
-            QMessageBox.warning(self, "提示", "请先输入扫货最低价阈值。")
-            return
-        self.stop_flag.clear()
-        self.mode1_thread = Mode1Worker(self.cfg_mgr.config, self.ocr, self.stop_flag, th, logger=self._log)
-        self.mode1_thread.log.connect(self._log)
-        self.mode1_thread.price_signal.connect(self._on_price_update)
-        self.mode1_thread.finished.connect(lambda: self._log("模式1线程结束"))
-        self.mode1_thread.start()
-        self._log("模式1启动。")
-
-    def _start_mode2(self):
-        if self.mode2_thread and self.mode2_thread.isRunning():
-            self._log("模式2已在运行。")
-            return
+
+def _latency_summary(ms: List[float]) -> Dict[str, float]:
+    if not ms:
+        return {"n": 0}
+    a = np.asarray(ms, np.float64)
+    return {"n": len(a), "p50": round(float(np.percentile(a, 50)), 3), "p95": round(float(np.percentile(a, 95)), 3),
+            "max": round(float(a.max()), 3)}
+
+
+class PlayerInput(RecordingInput):
+    """离线输入接收端：照常记录带时间戳的动作，同时转给 FramePlayer 让画面作出反应"""
+    name = "player"
+
+    def __init__(self, player: FramePlayer, latency: float = 0.0):
+        super().__init__(latency)
+        self.player = player
+
+    def _rec(self, op: str, *args):
+        super()._rec(op, *args)
+        self.player.on_input(op, args)
+
+
+class OracleOCR:
+    """
+    离线基准用的 OCR：按像素哈希查 SyntheticMarket 登记的真值，不跑识别引擎，
+    结果与机器无关，只测调度 / 等待 / 输入路径本身。
+    """
+    backend = "oracle"
+
+    def __init__(self, market: SyntheticMarket):
+        self.market = market
+        self.ready = threading.Event()
+        self.ready.set()
+        self._key = OCRResultCache(0).key
+        self.calls = 0
+
+    def read_price(self, img_bgr: np.ndarray, region: Optional[str] = None) -> OCRReading:
+        self.calls += 1
+        v = self.market.truth.get(self._key(img_bgr))
+        if v is None:
+            return OCRReading("", None, 0.0, [], "oracle")
+        return OCRReading(f"{v:.0f}", v, 1.0, [], "oracle")
+
+    def read_price_value(self, img_bgr: np.ndarray) -> Optional[float]:
+        return self.read_price(img_bgr).value
+
+    def cache_report(self) -> str:
+        return f"OCR：离线真值，{self.calls} 次"
+
+
+def run_loop_benchmark(player: FramePlayer, ocr, cfg: AppConfig, threshold: float, duration: float,
+                       input_latency: float = 0.0, logger=lambda s: None) -> Dict[str, Any]:
+    """在离线画面上跑 duration 秒模式1 买入循环，返回轮次速率、动作数与（合成场景下的）买入延迟"""
+    inp = PlayerInput(player, input_latency)
+    worker = Mode1Worker(cfg, ocr, threshold, logger, inp=inp, screen=player)
+    player.start()
+    t0 = time.perf_counter()
+    worker.start()
+    worker.sleep(duration)
+    worker.stop(wait=5.0)
+    elapsed = time.perf_counter() - t0
+    out = {"duration_s": round(elapsed, 3), "cycles": worker.cycles,
+           "cycles_per_s": round(worker.cycles / max(elapsed, 1e-9), 3),
+           "grabs": player.grabs, "ocr_calls": worker.reader.ocr_calls, "gated_skips": worker.reader.gated_skips,
+           "actions": len(inp.calls), "clicks": len(inp.clicks()), "waits": worker.waits.report(),
+           "wait_counts": dict(worker.waits.counts),
+           "wait_timeouts": dict(worker.waits.timeouts)}
+    if isinstance(player, SyntheticMarket):
+        out.update(player.report())
+    return out
+
+
+def bench_loop_main(argv: List[str]) -> int:
+    """python run_app.py bench-loop [...]：不需要游戏 / 屏幕 / 键鼠，离线测模式1 买入循环的吞吐与延迟"""
+    import argparse
+    ap = argparse.ArgumentParser(prog="run_app.py bench-loop", description="离线回放基准（模式1 买入循环）")
+    ap.add_argument("--duration", type=float, default=10.0)
+    ap.add_argument("--threshold", type=float, default=100.0)
+    ap.add_argument("--seed", type=int, default=0, help="合成场景随机种子")
+    ap.add_argument("--frames", default=None, help="改为播放录制的帧序列 npz（t, frames），需配合 --config")
+    ap.add_argument("--config", default=None, help="区域 / 坐标 / 识别参数取自该配置（默认用合成场景布局）")
+    ap.add_argument("--ocr", choices=["oracle", "real"], default="oracle",
+                    help="oracle=按合成画面真值直接返回；real=按配置加载 OCR")
+    ap.add_argument("--input-latency", type=float, default=0.0, help="模拟每个输入原语的耗时（秒）")
+    ap.add_argument("--trace", default=None, help="导出 Chrome trace JSON")
+    ap.add_argument("--json", default=None, help="同时把结果写入该文件")
+    args = ap.parse_args(argv)
+
+    log = print if os.environ.get("BENCH_VERBOSE") else (lambda s: None)
+    if args.frames:
+        if not args.config:
+            print("播放录制帧需要 --config 指定区域与坐标")
+            return 2
+        player: FramePlayer = FrameSequence.load(args.frames)
+    else:
+        player = SyntheticMarket(args.threshold, args.duration, args.seed)
+    if args.config:
+        mgr = ConfigManager(args.config, logger=log)
+        mgr.load()
+        cfg = mgr.config
+        cfg.price_history_enabled = False
+    else:
+        cfg = player.config()
+    if args.ocr == "oracle":
+        if not isinstance(player, SyntheticMarket):
+            print("录制帧没有真值，请用 --ocr real")
+            return 2
+        ocr = OracleOCR(player)
+    else:
+        ocr = OCRManager.from_config(cfg, log, defer=True)
         try:
-            self.cfg_mgr.config.mode2_price_coord = (int(self.mode2_x.text()), int(self.mode2_y.text()))
-        except:
+            ocr._init_ocr()
+        except Exception:
             pass
+        ocr.ready.set()
+    TRACER.enabled = bool(args.trace)
+    res = run_loop_benchmark(player, ocr, cfg, args.threshold, args.duration, args.input_latency, log)
+    if args.trace:
+        res["trace_spans"] = TRACER.export_chrome(args.trace)
+    text = json.dumps(res, indent=2, ensure_ascii=False)
+    print(text)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(text)
+    return 0
+
+# ============================= Headless runner =============================
+class JsonLineLogger:
+    """
+    无界面运行的结构化日志：每条一行 JSON（{"t", "src", "msg"} 或 {"t", "src", "event", ...}），
+    写 stdout，可选同时交给 RotatingLogWriter 落盘。线程安全。
+    """
+    def __init__(self, src: str, path: Optional[str] = None, max_bytes: int = 5 << 20, backups: int = 3,
+                 stream=None):
+        self.src = src
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+        self.writer: Optional[RotatingLogWriter] = None
+        if path:
+            self.writer = RotatingLogWriter(path, max_bytes, backups)
+            self.writer.start()
+
+    def emit(self, **fields):
+        rec = {"t": round(time.time(), 3), "src": self.src}
+        rec.update(fields)
+        line = json.dumps(rec, ensure_ascii=False)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+        if self.writer:
+            self.writer.write(line)
+
+    def __call__(self, msg: str):
+        self.emit(msg=msg)
+
+    def close(self):
+        if self.writer:
+            self.writer.stop()
+            self.writer = None
+
+
+def _open_headless_ocr(cfg: AppConfig, log) -> Tuple[Any, Optional[OCRService], bool]:
+    """按配置同步准备 OCR（本进程或独立服务进程）；返回 (ocr, service 或 None, 是否可用)"""
+    if cfg.ocr_service:
+        service = OCRService(cfg, log, cfg.ocr_service_slots)
+        service.start()
+        service.ready.wait(120.0)
+        ok = service.ready.is_set() and (bool(service.backend) or service.glyph_ready)
+        STARTUP.mark("ocr")
+        return service, service, ok
+    ocr = OCRManager.from_config(cfg, log, defer=True)
+    try:
+        ocr._init_ocr()
+    except Exception:
+        pass  # 已记录；没有重型引擎时仍可只用字形模板
+    ocr.ready.set()
+    STARTUP.mark("ocr")
+    return ocr, None, bool(ocr.backend) or ocr.glyph.ready
+
+
+def run_headless_main(argv: List[str]) -> int:
+    """python run_app.py run mode1|mode2 [...]：不创建 Qt 窗口，直接按配置运行一个模式，Ctrl+C 停止"""
+    import argparse
+    ap = argparse.ArgumentParser(prog="run_app.py run", description="无界面运行模式1 / 模式2")
+    ap.add_argument("mode", choices=["mode1", "mode2"])
+    ap.add_argument("--config", default=DEFAULT_CONFIG_PATH)
+    ap.add_argument("--threshold", type=float, default=None,
+                    help="模式1：扫货最低价阈值（有监控清单时可省略）；模式2：覆盖 mode2_threshold")
+    ap.add_argument("--duration", type=float, default=0.0, help="运行 N 秒后自动停止（0=直到 Ctrl+C）")
+    ap.add_argument("--log-file", default=None, help="同时写入 JSON Lines 日志文件（按配置大小轮转）")
+    ap.add_argument("--trace", default=None, help="结束时把热路径追踪导出为 Chrome trace JSON")
+    args = ap.parse_args(argv)
+
+    src = "模式1" if args.mode == "mode1" else "模式2"
+    log = JsonLineLogger(src)
+    cfg_mgr = ConfigManager(args.config, logger=log)
+    cfg_mgr.load()
+    cfg = cfg_mgr.config
+    if args.log_file:
+        log.close()
+        log = JsonLineLogger(src, args.log_file, int(cfg.log_file_max_mb * (1 << 20)), cfg.log_file_backups)
+    TRACER.enabled = bool(args.trace) or cfg.trace_enabled
+    service: Optional[OCRService] = None
+    try:
+        ocr, service, ocr_ok = _open_headless_ocr(cfg, log)
+        if not ocr_ok:
+            log.emit(event="error", msg="没有可用的 OCR 引擎或字形模板")
+            return 2
+        inp = make_input_backend(cfg.input_backend, log)
+        if args.mode == "mode1":
+            if args.threshold is None and not any(it.enabled for it in cfg.mode1_watchlist):
+                log.emit(event="error", msg="模式1需要 --threshold（或在配置中设置监控清单）")
+                return 2
+            worker: Worker = Mode1Worker(cfg, ocr, args.threshold or 0.0, logger=log, inp=inp,
+                                         on_price=lambda p1, p2: log.emit(event="price", price1=p1,
+                                                                          price2=None if p2 < 0 else p2))
+        else:
+            if args.threshold is not None:
+                cfg.mode2_threshold = args.threshold
+            op1 = MacroRecorder(log, MACRO1_PATH, cfg.macro_simplify_px, cfg.macro_speed, cfg.macro_max_gap_s, inp)
+            op2 = MacroRecorder(log, MACRO2_PATH, cfg.macro_simplify_px, cfg.macro_speed, cfg.macro_max_gap_s, inp)
+            if not len(op1.track) or not len(op2.track):
+                log.emit(event="error", msg=f"模式2需要已录制的宏：{MACRO1_PATH} / {MACRO2_PATH}")
+                return 2
+            worker = Mode2Worker(cfg, ocr, op1, op2, logger=log)
+
+        def on_signal(signum, frame):
+            log.emit(event="signal", signum=int(signum))
+            worker.stop()
+        signal.signal(signal.SIGINT, on_signal)
+        if hasattr(signal, "SIGTERM"):
+            signal.signal(signal.SIGTERM, on_signal)
+
+        log.emit(event="start", mode=args.mode, startup=STARTUP.report())
+        worker.start()
+        deadline = time.monotonic() + args.duration if args.duration > 0 else None
+        # 主线程只负责接收信号：短超时 join，信号处理函数才有机会运行
+        while worker.running:
+            worker.join(0.2)
+            if deadline is not None and time.monotonic() >= deadline:
+                worker.stop()
+        worker.join()
+        if args.trace:
+            log.emit(event="trace", path=args.trace, spans=TRACER.export_chrome(args.trace))
+        log.emit(event="exit")
+        return 0
+    finally:
+        if service is not None:
+            service.stop()
+        log.close()
+
+# ============================= Multi-instance orchestrator =============================
+INSTANCES_PATH = "instances.json"
+
+
+class FairTurn:
+    """
+    FIFO 轮转（票号锁）：多个实例争用同一资源（鼠标键盘 / 本进程 OCR 引擎）时严格按到达顺序轮流，
+    不会有实例被持续插队饿死。记录每个持有者的排队等待，用于检查调度是否公平。
+    同一线程可重入（宏回放整段持有时，其中每个输入原语不再排队）。
+    """
+    def __init__(self):
+        self._cv = threading.Condition()
+        self._next = 0
+        self._serving = 0
+        self._thread: Optional[int] = None  # 当前持有线程
+        self._depth = 0
+        self.last: Optional[str] = None  # 最近一次的持有者
+        self._waits: Dict[str, List[float]] = {}  # owner -> [次数, 总等待秒, 最大等待秒]
+
+    @contextlib.contextmanager
+    def hold(self, owner: str):
+        me = threading.get_ident()
+        if self._thread == me:
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+            return
+        t0 = time.perf_counter()
+        with self._cv:
+            ticket = self._next
+            self._next += 1
+            while self._serving != ticket:
+                self._cv.wait()
+            w = time.perf_counter() - t0
+            st = self._waits.setdefault(owner, [0, 0.0, 0.0])
+            st[0] += 1
+            st[1] += w
+            st[2] = max(st[2], w)
+            self._thread = me
         try:
-            self.cfg_mgr.config.mode2_threshold = float(self.mode2_threshold.text())
-        except:
-            pass
+            yield
+        finally:
+            with self._cv:
+                self._thread = None
+                self.last = owner
+                self._serving += 1
+                self._cv.notify_all()
 
-        self.stop_flag.clear()
-        self.mode2_thread = Mode2Worker(self.cfg_mgr.config, self.ocr, self.stop_flag,
-                                        self.macro1, self.macro2, logger=self._log)
-        self.mode2_thread.log.connect(self._log)
-        self.mode2_thread.finished.connect(lambda: self._log("模式2线程结束"))
-        self.mode2_thread.start()
-        self._log("模式2启动。")
-
-    def _stop_all(self):
-        self.stop_flag.set()
-        self._log("已请求停止（F9 / 全局F9）。")
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._cv:
+            return {o: {"n": int(n), "mean_ms": round(tot / n * 1000, 3) if n else 0.0, "max_ms": round(mx * 1000, 3)}
+                    for o, (n, tot, mx) in self._waits.items()}
+
+
+class InstanceInput(InputBackend):
+    """
+    多开时单个实例的输入目标：
+    - 每个动作经共享的 FairTurn 串行发出；exclusive() 让宏回放整段持有，按下 / 抬起之间不会交错
+    - offset 平移鼠标坐标（模式2 的宏按录制窗口的绝对坐标保存）
+    - focus 为本窗口内一个无副作用的点击点（屏幕坐标）：上一个动作来自别的实例时，
+      按键前先点它把键盘焦点拿回本窗口（Esc 等按键只会发给前台窗口）
+    """
+    def __init__(self, inner: InputBackend, turn: FairTurn, owner: str,
+                 offset: Tuple[int, int] = (0, 0), focus: Optional[Tuple[int, int]] = None):
+        self.inner = inner
+        self.turn = turn
+        self.owner = owner
+        self.dx, self.dy = offset
+        self.focus = focus
+        self.name = f"{inner.name}@{owner}"
+        self.refocus = 0
+
+    def _ensure_focus(self):
+        if self.focus is not None and self.turn.last != self.owner:
+            self.inner.click(*self.focus)
+            self.refocus += 1
+
+    def _shift(self, a):
+        if a[0] in ("click", "move"):
+            return (a[0], a[1] + self.dx, a[2] + self.dy) + tuple(a[3:])
+        return a
+
+    def move(self, x: int, y: int):
+        with self.turn.hold(self.owner):
+            self.inner.move(x + self.dx, y + self.dy)
+
+    def button(self, x: int, y: int, button: str, down: bool):
+        with self.turn.hold(self.owner):
+            self.inner.button(x + self.dx, y + self.dy, button, down)
+
+    def key(self, key: str, down: bool):
+        with self.turn.hold(self.owner):
+            self._ensure_focus()
+            self.inner.key(key, down)
+
+    def click(self, x: int, y: int, button: str = "left", n: int = 1):
+        with self.turn.hold(self.owner):
+            self.inner.click(x + self.dx, y + self.dy, button, n)
+
+    def press(self, key: str):
+        with self.turn.hold(self.owner):
+            self._ensure_focus()
+            self.inner.press(key)
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        with self.turn.hold(self.owner):
+            self._ensure_focus()
+            yield
+
+    def run(self, actions):
+        actions = [self._shift(a) for a in actions]
+        with self.turn.hold(self.owner):
+            if actions and actions[0][0] == "press":
+                self._ensure_focus()
+            self.inner.run(actions)
+
+
+class SharedOCR:
+    """
+    多个实例共用一个本进程 OCRManager：识别经 FairTurn 轮流进入（引擎不是线程安全的），
+    结果缓存也因此跨实例共享。其余属性直接转给 OCRManager。
+    """
+    def __init__(self, ocr: OCRManager, turn: Optional[FairTurn] = None):
+        self.ocr = ocr
+        self.turn = turn or FairTurn()
+
+    def read_price(self, img_bgr: np.ndarray, region: Optional[str] = None) -> OCRReading:
+        with self.turn.hold(threading.current_thread().name):
+            return self.ocr.read_price(img_bgr, region)
+
+    def read_prices_batch(self, rois: List[np.ndarray],
+                          regions: Optional[List[Optional[str]]] = None) -> List[OCRReading]:
+        with self.turn.hold(threading.current_thread().name):
+            return self.ocr.read_prices_batch(rois, regions)
+
+    def read_price_value(self, img_bgr: np.ndarray) -> Optional[float]:
+        return self.read_price(img_bgr).value
+
+    def __getattr__(self, item):
+        return getattr(self.ocr, item)
+
+
+@dataclass
+class InstanceSpec:
+    """orchestrate 的一个实例：配置档 + 窗口偏移 + 输入目标"""
+    name: str
+    config: str = DEFAULT_CONFIG_PATH
+    mode: str = "mode1"
+    offset: Tuple[int, int] = (0, 0)           # 本实例窗口相对配置所在窗口的位移（像素）
+    threshold: Optional[float] = None          # 模式1 阈值 / 模式2 覆盖 mode2_threshold
+    input_backend: Optional[str] = None        # None=沿用配置；"recording"=只记录不注入（试运行）
+    focus: Optional[Tuple[int, int]] = None    # 窗口内安全点击点（配置坐标），按键前用来抢回焦点
+    macro1: str = MACRO1_PATH
+    macro2: str = MACRO2_PATH
+
+    @staticmethod
+    def from_json(d: Dict[str, Any]) -> 'InstanceSpec':
+        off = d.get("offset", [0, 0])
+        focus = d.get("focus")
+        th = d.get("threshold")
+        return InstanceSpec(name=str(d["name"]), config=str(d.get("config", DEFAULT_CONFIG_PATH)),
+                            mode=str(d.get("mode", "mode1")), offset=(int(off[0]), int(off[1])),
+                            threshold=None if th is None else float(th), input_backend=d.get("input_backend"),
+                            focus=None if not focus else (int(focus[0]), int(focus[1])),
+                            macro1=str(d.get("macro1", MACRO1_PATH)), macro2=str(d.get("macro2", MACRO2_PATH)))
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"name": self.name, "config": self.config, "mode": self.mode, "offset": list(self.offset),
+                "threshold": self.threshold, "input_backend": self.input_backend,
+                "focus": list(self.focus) if self.focus else None, "macro1": self.macro1, "macro2": self.macro2}
+
+    @staticmethod
+    def load_all(path: str) -> List['InstanceSpec']:
+        """instances.json：实例数组，或 {"instances": [...]}"""
+        with open(path, "r", encoding="utf-8") as f:
+            d = json.load(f)
+        specs = [InstanceSpec.from_json(x) for x in (d["instances"] if isinstance(d, dict) else d)]
+        names = [s.name for s in specs]
+        if len(set(names)) != len(names):
+            raise ValueError(f"实例名重复：{names}")
+        return specs
+
+
+class Orchestrator:
+    """
+    多开编排：N 个独立的模式1 / 模式2 worker，各自的配置档（按窗口偏移平移）、输入目标；
+    共享一个 OCR（本进程 OCRManager 经 SharedOCR 轮流使用，或 OCRService 服务进程）、
+    Screen 和价格历史库。所有实例的输入经同一个 FairTurn 按到达顺序轮流发出。
+    """
+    def __init__(self, specs: List[InstanceSpec], ocr, logger=lambda s: None,
+                 history: Optional[PriceHistoryStore] = None):
+        self.specs = specs
+        self.log = logger
+        self.ocr = ocr if isinstance(ocr, (OCRService, SharedOCR)) else SharedOCR(ocr)
+        self.screen = Screen()
+        self.history = history
+        self.input_turn = FairTurn()
+        self.workers: Dict[str, Worker] = {}
+        self.inputs: Dict[str, InstanceInput] = {}
+        self.t_start = 0.0
+        self._last = (0.0, {})  # stats() 上次调用的 (时刻, 各实例轮次)，用于近期速率
+
+    def _instance_logger(self, name: str):
+        return lambda msg: self.log(f"[{name}] {msg}")
+
+    def build(self) -> List[str]:
+        """按 specs 创建各实例的 worker；返回配置错误（非空时不应 start）"""
+        errors = []
+        for spec in self.specs:
+            ilog = self._instance_logger(spec.name)
+            mgr = ConfigManager(spec.config, logger=ilog)
+            mgr.load()
+            dx, dy = spec.offset
+            cfg = mgr.config.shifted(dx, dy)
+            cfg.price_history_enabled = self.history is not None  # 只写共享的历史库
+            if cfg.watchlist_stats_path:
+                # 调度统计按实例分文件：同名商品的 EWMA / 波动率互不干扰，停止时也不互相覆盖
+                root, ext = os.path.splitext(cfg.watchlist_stats_path)
+                cfg.watchlist_stats_path = f"{root}.{spec.name}{ext}"
+            inner = make_input_backend(spec.input_backend or cfg.input_backend, ilog)
+            focus = (spec.focus[0] + dx, spec.focus[1] + dy) if spec.focus else None
+            if spec.mode == "mode1":
+                if spec.threshold is None and not any(it.enabled for it in cfg.mode1_watchlist):
+                    errors.append(f"{spec.name}：模式1需要 threshold（或在配置中设置监控清单）")
+                    continue
+                # 配置已整体平移，点击坐标无需再偏移
+                inp = InstanceInput(inner, self.input_turn, spec.name, focus=focus)
+                w: Worker = Mode1Worker(cfg, self.ocr, spec.threshold or 0.0, ilog, inp=inp,
+                                        screen=self.screen, history=self.history)
+            elif spec.mode == "mode2":
+                if spec.threshold is not None:
+                    cfg.mode2_threshold = spec.threshold
+                # 宏保存的是录制窗口的绝对坐标：由输入目标平移
+                inp = InstanceInput(inner, self.input_turn, spec.name, offset=(dx, dy), focus=focus)
+                op1 = MacroRecorder(ilog, spec.macro1, cfg.macro_simplify_px, cfg.macro_speed, cfg.macro_max_gap_s, inp)
+                op2 = MacroRecorder(ilog, spec.macro2, cfg.macro_simplify_px, cfg.macro_speed, cfg.macro_max_gap_s, inp)
+                if not len(op1.track) or not len(op2.track):
+                    errors.append(f"{spec.name}：模式2需要已录制的宏：{spec.macro1} / {spec.macro2}")
+                    continue
+                w = Mode2Worker(cfg, self.ocr, op1, op2, ilog, screen=self.screen, history=self.history)
+            else:
+                errors.append(f"{spec.name}：未知模式 {spec.mode}")
+                continue
+            w.name = f"{w.name}[{spec.name}]"
+            w.history_tag = spec.name
+            self.workers[spec.name] = w
+            self.inputs[spec.name] = inp
+        return errors
+
+    @property
+    def running(self) -> bool:
+        return any(w.running for w in self.workers.values())
+
+    def start(self):
+        self.t_start = time.perf_counter()
+        self._last = (self.t_start, {n: 0 for n in self.workers})
+        for w in self.workers.values():
+            w.start()
+        self.log(f"多开：已启动 {len(self.workers)} 个实例：{'、'.join(self.workers)}")
+
+    def stop(self, wait: float = 0.0):
+        for w in self.workers.values():
+            w.stop()
+        if wait > 0:
+            deadline = time.monotonic() + wait
+            for w in self.workers.values():
+                w.join(max(0.0, deadline - time.monotonic()))
+
+    def stats(self) -> Dict[str, Any]:
+        """各实例与总的轮次 / 速率（rate=启动以来平均，recent=距上次 stats() 以来）"""
+        now = time.perf_counter()
+        elapsed = max(1e-9, now - self.t_start)
+        t_prev, prev = self._last
+        dt = max(1e-9, now - t_prev)
+        cycles = {n: int(getattr(w, "cycles", 0)) for n, w in self.workers.items()}
+        self._last = (now, cycles)
+        waits = self.input_turn.stats()
+        per = {n: {"cycles": c, "rate": round(c / elapsed, 3), "recent": round((c - prev.get(n, 0)) / dt, 3),
+                   "running": self.workers[n].running, "input_wait": waits.get(n),
+                   "refocus": self.inputs[n].refocus} for n, c in cycles.items()}
+        total = sum(cycles.values())
+        out = {"elapsed_s": round(elapsed, 3), "cycles": total, "rate": round(total / elapsed, 3),
+               "recent": round((total - sum(prev.values())) / dt, 3), "instances": per}
+        if isinstance(self.ocr, SharedOCR):
+            out["ocr_wait"] = self.ocr.turn.stats()
+        return out
+
+    def report(self) -> str:
+        st = self.stats()
+        parts = [f"{n} {s['cycles']}轮 {s['rate']}轮/s" for n, s in st["instances"].items()]
+        return f"多开统计：{'；'.join(parts)}；合计 {st['cycles']}轮 {st['rate']}轮/s（{st['elapsed_s']}s）"
+
+
+def orchestrate_main(argv: List[str]) -> int:
+    """python run_app.py orchestrate [instances.json]：无界面多开，共享抓屏 / OCR，Ctrl+C 停止"""
+    import argparse
+    ap = argparse.ArgumentParser(prog="run_app.py orchestrate", description="无界面多开（多个游戏窗口）")
+    ap.add_argument("instances", nargs="?", default=INSTANCES_PATH, help="实例清单 JSON")
+    ap.add_argument("--duration", type=float, default=0.0, help="运行 N 秒后自动停止（0=直到 Ctrl+C）")
+    ap.add_argument("--stats-interval", type=float, default=10.0, help="每 N 秒输出一次速率统计（0=只在结束时）")
+    ap.add_argument("--log-file", default=None, help="同时写入 JSON Lines 日志文件（按配置大小轮转）")
+    ap.add_argument("--trace", default=None, help="结束时把热路径追踪导出为 Chrome trace JSON")
+    args = ap.parse_args(argv)
+
+    log = JsonLineLogger("多开")
+    try:
+        specs = InstanceSpec.load_all(args.instances)
+    except Exception as e:
+        log.emit(event="error", msg=f"实例清单读取失败：{args.instances}：{e}")
+        return 2
+    if not specs:
+        log.emit(event="error", msg="实例清单为空")
+        return 2
+    # 共享资源（OCR / 历史库 / 日志）按第一个实例的配置
+    base_mgr = ConfigManager(specs[0].config, logger=log)
+    base_mgr.load()
+    base = base_mgr.config
+    if args.log_file:
+        log.close()
+        log = JsonLineLogger("多开", args.log_file, int(base.log_file_max_mb * (1 << 20)), base.log_file_backups)
+    TRACER.enabled = bool(args.trace) or base.trace_enabled
+    service: Optional[OCRService] = None
+    history: Optional[PriceHistoryStore] = None
+    try:
+        ocr, service, ocr_ok = _open_headless_ocr(base, log)
+        if not ocr_ok:
+            log.emit(event="error", msg="没有可用的 OCR 引擎或字形模板")
+            return 2
+        if base.price_history_enabled:
+            history = PriceHistoryStore.shared(base.price_history_path)
+        orch = Orchestrator(specs, ocr, log, history)
+        errors = orch.build()
+        if errors:
+            for e in errors:
+                log.emit(event="error", msg=e)
+            return 2
 
-    def _on_price_update(self, p1, p2):
-        if p1 >= 0:
-            self.lbl_price1.setText(f"价格1：{p1}")
-        if p2 >= 0:
-            self.lbl_price2.setText(f"价格2：{p2}")
+        def on_signal(signum, frame):
+            log.emit(event="signal", signum=int(signum))
+            orch.stop()
+        signal.signal(signal.SIGINT, on_signal)
+        if hasattr(signal, "SIGTERM"):
+            signal.signal(signal.SIGTERM, on_signal)
 
-    def _log(self, s: str):
-        ts = time.strftime("%H:%M:%S")
-        self.log_box.append(f"[{ts}] {s}")
-        self.log_box.moveCursor(QtGui.QTextCursor.End)
+        log.emit(event="start", instances=[s.to_json() for s in specs], startup=STARTUP.report())
+        orch.start()
+        deadline = time.monotonic() + args.duration if args.duration > 0 else None
+        next_stats = time.monotonic() + args.stats_interval if args.stats_interval > 0 else None
+        # 主线程只负责信号 / 定时统计
+        while orch.running:
+            time.sleep(0.2)
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                orch.stop()
+            if next_stats is not None and now >= next_stats:
+                log.emit(event="stats", **orch.stats())
+                next_stats = now + args.stats_interval
+        orch.stop(wait=5.0)
+        log.emit(event="stats", final=True, **orch.stats())
+        log(orch.report())
+        if args.trace:
+            log.emit(event="trace", path=args.trace, spans=TRACER.export_chrome(args.trace))
+        log.emit(event="exit")
+        return 0
+    finally:
+        if history is not None:
+            history.close()
+        if service is not None:
+            service.stop()
+        log.close()
 
 # ============================= main =============================
 def main():
-    pyautogui.FAILSAFE = True  # 鼠标移到左上角可紧急终止
+    # 以脚本运行时本模块名为 __main__：先登记为 run_app，ui 里的 `from run_app import ...` 才复用同一份模块状态
+    sys.modules.setdefault("run_app", sys.modules[__name__])
+    from ui import MainWindow
+    from PySide6 import QtCore
+    from PySide6.QtWidgets import QApplication, QMessageBox
+    STARTUP.mark("qt_import")
     app = QApplication(sys.argv)
+    STARTUP.mark("qt_app")
     win = MainWindow()
     win.show()
+    STARTUP.mark("show")
 
     # “几秒后没有配置则提示配置”
     QtCore.QTimer.singleShot(3500, lambda: (
@@ -1045,4 +4119,18 @@ def main():
     sys.exit(app.exec())
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "run":
+        sys.exit(run_headless_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "orchestrate":
+        sys.exit(orchestrate_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "bench-ocr":
+        sys.exit(bench_ocr_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "bench-loop":
+        sys.exit(bench_loop_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "tune-ocr":
+        sys.exit(tune_ocr_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "flight-show":
+        sys.exit(flight_show_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "price-stats":
+        sys.exit(price_stats_main(sys.argv[2:]))
     main()
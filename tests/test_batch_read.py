@@ -0,0 +1,35 @@
+import numpy as np
+
+import run_app as R
+
+
+class BatchOCR:
+    def __init__(self):
+        self.single = 0
+        self.batches = []
+
+    def read_price(self, img, region=None):
+        self.single += 1
+        return R.OCRReading("1", 1.0, 1.0, [], "fake")
+
+    def read_prices_batch(self, rois, regions=None):
+        self.batches.append(list(regions))
+        return [R.OCRReading(str(i), float(i), 1.0, [], "fake") for i, _ in enumerate(rois)]
+
+
+def frame(v):
+    img = np.zeros((30, 120, 4), np.uint8)
+    img[5:25, 10:10 + 10 * v] = 255
+    return img
+
+
+def test_changed_regions_go_through_one_batch_call():
+    ocr = BatchOCR()
+    reader = R.GatedPriceReader(ocr, 1.0)
+    got = reader.read_many({"price1": frame(1), "price2": frame(2)})
+    assert ocr.batches == [["price1", "price2"]] and ocr.single == 0
+    assert got == {"price1": 0.0, "price2": 1.0}
+    # 价格1 未变化：沿用上次结果，只有价格2 送 OCR（单个区域不走批量）
+    got = reader.read_many({"price1": frame(1), "price2": frame(3)})
+    assert len(ocr.batches) == 1 and ocr.single == 1
+    assert got["price1"] == 0.0 and reader.gated_skips == 1
@@ -0,0 +1,26 @@
+import cv2
+import numpy as np
+
+import run_app as R
+
+
+def render_price(text: str, w: int = 200, h: int = 30) -> np.ndarray:
+    img = np.zeros((h, w, 4), np.uint8)
+    img[..., 3] = 255
+    cv2.putText(img, text, (6, h - 8), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255, 255), 2)
+    return img
+
+
+def test_one_digit_change_is_detected():
+    for w in (200, 300):
+        gate = R.FrameChangeGate(1.0)
+        assert gate.changed(render_price("12345", w))
+        assert not gate.changed(render_price("12345", w))
+        assert gate.changed(render_price("12346", w))
+
+
+def test_identical_frame_is_gated():
+    gate = R.FrameChangeGate(1.0)
+    img = render_price("9876")
+    gate.changed(img)
+    assert gate.score(img.copy()) == 0.0
@@ -0,0 +1,23 @@
+import os
+
+import numpy as np
+
+import run_app as R
+
+
+def test_dumps_are_pruned_oldest_first(tmp_path):
+    out = tmp_path / "flight"
+    rec = R.FlightRecorder(10.0, 16, str(out), keep=3)
+    img = np.zeros((20, 60, 4), np.uint8)
+    for i in range(6):
+        img[...] = i
+        rec.add("price1", img, float(i), 1.0)
+        assert rec.trigger("hotkey")
+        rec.close()
+    files = sorted(os.listdir(out))
+    assert len(files) == 3
+    assert files[-1].endswith("_hotkey_5.npz")
+    meta, regions = R.FlightRecorder.load(str(out / files[-1]))
+    frames, m = regions["price1"]
+    assert meta["reason"] == "hotkey"
+    assert len(frames) == 6 and m["value"][-1] == 5.0
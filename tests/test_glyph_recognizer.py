@@ -0,0 +1,48 @@
+import cv2
+import numpy as np
+
+import run_app as R
+
+
+def render(text: str, w: int = 160, h: int = 32) -> np.ndarray:
+    img = np.zeros((h, w, 3), np.uint8)
+    cv2.putText(img, text, (4, h - 8), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (230, 230, 230), 2)
+    return img
+
+
+def trained() -> R.GlyphDigitRecognizer:
+    g = R.GlyphDigitRecognizer(None)
+    for label in ("0123456789", "9876543210"):
+        assert g.learn(render(label, 200), label)
+    return g
+
+
+def test_reads_unseen_price():
+    g = trained()
+    r = g.read(render("40712"))
+    assert r.text == "40712"
+    assert r.value == 40712
+    assert r.confidence > 0.8
+    assert len(r.char_confidences) == 5
+
+
+def test_not_ready_without_digit_templates():
+    g = R.GlyphDigitRecognizer(None)
+    assert not g.ready
+    r = g.read(render("123"))
+    assert r.value is None and r.confidence == 0.0
+
+
+def test_learn_rejects_segmentation_mismatch():
+    g = R.GlyphDigitRecognizer(None)
+    assert not g.learn(render("123"), "1234")
+    assert not g.ready
+
+
+def test_templates_round_trip(tmp_path):
+    g = trained()
+    path = str(tmp_path / "glyphs.npz")
+    g.save(path)
+    g2 = R.GlyphDigitRecognizer(path)
+    assert g2.labels == g.labels
+    assert g2.read(render("5318")).text == "5318"
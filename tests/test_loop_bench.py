@@ -0,0 +1,11 @@
+import run_app as R
+
+
+def test_mode1_loop_item_waits_do_not_time_out(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    player = R.SyntheticMarket(100.0, 2.0, 0)
+    cfg = player.config()
+    res = R.run_loop_benchmark(player, R.OracleOCR(player), cfg, 100.0, 2.0)
+    assert res["wait_counts"]["item"] > 20
+    assert res["wait_timeouts"]["item"] <= max(1, res["wait_counts"]["item"] // 50)
+    assert res["missed"] == 0
@@ -0,0 +1,68 @@
+import sys
+import threading
+
+import numpy as np
+
+import run_app as R
+
+
+def test_concurrent_appends_keep_every_event():
+    tr = R.MacroTrack(capacity=4)   # 小容量：追加过程中反复倍增
+    per, nthreads = 3000, 4
+    old = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        def listener(who):
+            for i in range(per):
+                tr.append(float(i), R.EV_KEY_DOWN, who, i, tr.key_code(f"k{i % 7}"))
+        threads = [threading.Thread(target=listener, args=(w,)) for w in range(nthreads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(old)
+
+    t, kind, x, y, code = tr.columns()
+    assert len(tr) == per * nthreads
+    assert sorted(zip(x.tolist(), y.tolist())) == [(w, i) for w in range(nthreads) for i in range(per)]
+    assert sorted(tr.keys) == sorted(f"k{i}" for i in range(7))
+    assert all(tr.keys[c] == f"k{yy % 7}" for c, yy in zip(code.tolist(), y.tolist()))
+
+
+def test_simplify_path_drops_collinear_points_within_tolerance():
+    xy = np.array([[0, 0], [1, 0], [2, 1], [3, 0], [4, 0], [4, 10]])
+    keep = R.simplify_path(xy, 1.5)
+    assert keep.tolist() == [True, False, False, False, True, True]
+    assert R.simplify_path(xy, 0.0).all()
+    assert R.simplify_path(xy[:2], 5.0).all()
+
+
+def test_simplify_only_touches_move_runs():
+    tr = R.MacroTrack()
+    tr.append(0.0, R.EV_MOUSE_DOWN, 0, 0, 0)
+    for i in range(1, 20):
+        tr.append(i * 0.01, R.EV_MOVE, i, 0)
+    tr.append(0.3, R.EV_MOUSE_UP, 19, 0, 0)
+    removed = tr.simplify(1.0)
+    t, kind, x, y, code = tr.columns()
+    assert removed == 17
+    assert kind.tolist() == [R.EV_MOUSE_DOWN, R.EV_MOVE, R.EV_MOVE, R.EV_MOUSE_UP]
+    assert x.tolist() == [0, 1, 19, 19]
+
+
+def test_save_load_round_trip(tmp_path):
+    tr = R.MacroTrack(capacity=2)
+    tr.append(0.1, R.EV_MOVE, 10, 20)
+    tr.append(0.2, R.EV_MOUSE_DOWN, 10, 20, 1)
+    tr.append(0.3, R.EV_KEY_DOWN, code=tr.key_code("Key.esc"))
+    tr.append(0.4, R.EV_KEY_UP, code=tr.key_code("Key.esc"))
+    path = str(tmp_path / "macro.npz")
+    tr.save(path)
+    back = R.MacroTrack.load(path)
+    assert len(back) == 4
+    for a, b in zip(tr.columns(), back.columns()):
+        assert a.dtype == b.dtype and np.array_equal(a, b)
+    assert back.keys == ["Key.esc"]
+    back.append(0.5, R.EV_MOVE, 1, 1)   # 读回的轨迹仍可继续追加
+    assert len(back) == 5
@@ -0,0 +1,35 @@
+import numpy as np
+
+import run_app as R
+
+
+def reading(v: float) -> R.OCRReading:
+    return R.OCRReading(str(v), v, 1.0)
+
+
+def test_lru_eviction_keeps_recently_used():
+    c = R.OCRResultCache(maxsize=2)
+    c.put(b"a", reading(1))
+    c.put(b"b", reading(2))
+    assert c.get(b"a").value == 1      # a 变为最近使用
+    c.put(b"c", reading(3))            # 淘汰最久未用的 b
+    assert c.get(b"b") is None
+    assert c.get(b"a").value == 1 and c.get(b"c").value == 3
+    assert c.stats() == {"size": 2, "hits": 3, "misses": 1, "evictions": 1}
+
+
+def test_zero_size_is_disabled():
+    c = R.OCRResultCache(maxsize=0)
+    assert not c.enabled
+    c.put(b"a", reading(1))
+    assert c.get(b"a") is None
+
+
+def test_raw_key_depends_on_pixels_and_shape():
+    c = R.OCRResultCache(key_mode="raw")
+    img = np.zeros((10, 20, 3), np.uint8)
+    assert c.key(img) == c.key(img.copy())
+    other = img.copy()
+    other[5, 5, 0] = 1
+    assert c.key(other) != c.key(img)
+    assert c.key(img.reshape(20, 10, 3)) != c.key(img)
@@ -0,0 +1,50 @@
+import threading
+
+import run_app as R
+
+
+class DeadConn:
+    def send(self, msg):
+        raise OSError("broken pipe")
+
+
+class SilentConn:
+    """旧管道：发送成功但永远不会有回复"""
+    def __init__(self):
+        self.sent = []
+
+    def send(self, msg):
+        self.sent.append(msg)
+
+
+def make_service(conn):
+    svc = R.OCRService(R.AppConfig(), lambda s: None, slots=2)
+    for i in range(2):
+        svc._free.put(i)
+    svc._conn = conn
+    return svc
+
+
+def test_failed_send_returns_slot():
+    svc = make_service(DeadConn())
+    slot = svc._free.get()
+    assert svc._request(("ocr", slot), slot, timeout=0.1) is None
+    assert svc._free.qsize() == 2
+    assert not svc._pending
+
+
+def test_request_on_stale_connection_is_failed_on_respawn():
+    svc = make_service(SilentConn())
+    slot = svc._free.get()
+    res = []
+    t = threading.Thread(target=lambda: res.append(svc._request(("ocr", slot), slot, timeout=5.0)))
+    t.start()
+    while not svc._pending:
+        pass
+    # 与 _spawn() 相同：换上新连接后让发往旧连接的请求失败
+    with svc._send_lock:
+        svc._gen += 1
+    svc._fail_pending(svc._gen)
+    t.join(2.0)
+    assert res == [None]
+    assert svc._free.qsize() == 2
@@ -0,0 +1,62 @@
+import threading
+
+import run_app as R
+
+
+def make_recorder(inp, key: str) -> R.MacroRecorder:
+    rec = R.MacroRecorder(lambda s: None, inp=inp)
+    tr = rec.track
+    t = 0.0
+    for _ in range(5):
+        tr.append(t, R.EV_MOUSE_DOWN, 10, 10, 0)
+        tr.append(t + 0.002, R.EV_MOVE, 30, 10)
+        tr.append(t + 0.004, R.EV_MOUSE_UP, 30, 10, 0)
+        tr.append(t + 0.005, R.EV_KEY_DOWN, code=tr.key_code(key))
+        tr.append(t + 0.007, R.EV_KEY_UP, code=tr.key_code(key))
+        t += 0.01
+    return rec
+
+
+def test_concurrent_macro_replays_keep_pairs_contiguous():
+    sink = R.RecordingInput()
+    turn = R.FairTurn()
+    a = R.InstanceInput(sink, turn, "A")
+    b = R.InstanceInput(sink, turn, "B", offset=(1000, 0))
+    recs = [make_recorder(a, "a"), make_recorder(b, "b")]
+    threads = [threading.Thread(target=r.replay) for r in recs for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    def owner(op, args):
+        if op in ("key_down", "key_up"):
+            return args[0]
+        return "b" if args[0] >= 1000 else "a"
+
+    events = [(op, owner(op, args)) for _, op, args in sink.calls]
+    assert len(events) == 6 * 5 * 5
+    for i, (op, who) in enumerate(events):
+        if op in ("down", "key_down"):
+            up = "up" if op == "down" else "key_up"
+            j = next(k for k in range(i + 1, len(events)) if events[k][0] == up)
+            assert all(w == who for _, w in events[i:j + 1]), events[i:j + 1]
+
+
+def test_instances_keep_separate_watchlist_stats(tmp_path):
+    cfg = R.AppConfig()
+    cfg.input_backend = "recording"
+    cfg.watchlist_stats_path = str(tmp_path / "watchlist_stats.json")
+    cfg.mode1_watchlist = [R.WatchItem.from_json({"name": "ore", "click_coord": [5, 5], "threshold": 10})]
+    mgr = R.ConfigManager(str(tmp_path / "config.json"))
+    mgr.config = cfg
+    mgr.save()
+    specs = [R.InstanceSpec(name=n, config=mgr.path, offset=(i * 1000, 0)) for i, n in enumerate(("a", "b"))]
+    orch = R.Orchestrator(specs, R.SharedOCR(object()))
+    assert orch.build() == []
+    a, b = (orch.workers[n].scheduler for n in ("a", "b"))
+    assert a.path != b.path
+    a.update(a.items[0], 42.0)
+    a.save()
+    b.save()
+    assert R.WatchlistScheduler(cfg.mode1_watchlist, a.path).stats["ore"].last_price == 42.0
@@ -0,0 +1,34 @@
+import threading
+
+import run_app as R
+
+
+def test_shared_store_keeps_ids_across_modes(tmp_path):
+    path = str(tmp_path / "h.bin")
+    a = R.PriceHistoryStore.shared(path)
+    b = R.PriceHistoryStore.shared(path)
+    assert a is b
+    a.append("mode1", "price1", 10.0)
+    b.append("mode2", "price", 20.0)
+    a.flush()
+    reopened = R.PriceHistoryStore(path)
+    assert reopened.items == ["mode1", "mode2"]
+    assert reopened.stats(item="mode1")["n"] == 1
+    assert reopened.stats(item="mode2")["n"] == 1
+
+
+def test_interleaved_appends_keep_time_sorted(tmp_path):
+    store = R.PriceHistoryStore(str(tmp_path / "h.bin"))
+
+    def writer(name):
+        for i in range(2000):
+            store.append(name, "price", float(i))
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in ("a", "b", "c")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    t = store.records()["t"]
+    assert len(t) == 6000
+    assert (t[1:] >= t[:-1]).all()
@@ -0,0 +1,23 @@
+import numpy as np
+
+import run_app as R
+
+
+def test_keeps_leading_delay_without_max_gap():
+    t = np.array([0.5, 0.6, 2.6])
+    assert np.allclose(R.replay_schedule(t), t)
+
+
+def test_max_gap_caps_leading_and_idle_gaps():
+    t = np.array([0.5, 0.6, 2.6])
+    assert np.allclose(R.replay_schedule(t, max_gap=0.2), [0.2, 0.3, 0.5])
+
+
+def test_speed_scales_schedule():
+    t = np.array([0.0, 1.0, 3.0])
+    assert np.allclose(R.replay_schedule(t, speed=2.0), [0.0, 0.5, 1.5])
+    assert np.allclose(R.replay_schedule(t, speed=2.0, max_gap=1.0), [0.0, 0.5, 1.0])
+
+
+def test_empty_track():
+    assert len(R.replay_schedule(np.zeros(0))) == 0
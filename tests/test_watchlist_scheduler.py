@@ -0,0 +1,59 @@
+import math
+
+import run_app as R
+
+
+def items():
+    return [R.WatchItem("near", threshold=100.0), R.WatchItem("far", threshold=100.0),
+            R.WatchItem("off", threshold=100.0, enabled=False)]
+
+
+def seeded(prices, path=None) -> R.WatchlistScheduler:
+    s = R.WatchlistScheduler(items(), path)
+    for name, seq in prices.items():
+        it = next(i for i in s.items if i.name == name)
+        for p in seq:
+            s.update(it, p)
+    return s
+
+
+def test_unchecked_items_first_and_disabled_skipped():
+    s = R.WatchlistScheduler(items(), None)
+    assert [it.name for it in s.items] == ["near", "far"]
+    assert math.isinf(s.score(s.items[0], 0.0))
+    s.update(s.items[0], 150.0)
+    assert s.next().name == "far"
+
+
+def test_price_close_to_threshold_scores_higher():
+    s = seeded({"near": [104.0, 102.0], "far": [204.0, 202.0]})
+    near, far = s.items
+    for st in s.stats.values():
+        st.last_check = 10.0
+    assert s.score(near, 12.0) > s.score(far, 12.0)
+    # 冷门商品不被饿死：足够久没检查后得分反超
+    s.stats["far"].last_check = 0.5
+    assert s.score(far, 12.0) > s.score(near, 12.0)
+
+
+def test_priority_and_elapsed_scale_linearly():
+    s = seeded({"near": [110.0], "far": [110.0]})
+    near, far = s.items
+    far.priority = 3.0
+    for st in s.stats.values():
+        st.last_check = 1.0
+    assert math.isclose(s.score(far, 3.0), 3 * s.score(near, 3.0))
+    assert math.isclose(s.score(near, 5.0), 2 * s.score(near, 3.0))
+
+
+def test_ewma_and_stats_round_trip(tmp_path):
+    path = str(tmp_path / "stats.json")
+    s = seeded({"near": [100.0, 110.0, None, 90.0]}, path)
+    st = s.stats["near"]
+    assert st.checks == 4 and st.below == 1 and st.last_price == 90.0
+    assert math.isclose(st.mean, 100.0 + 0.2 * (110 - 100.0) + 0.2 * (90 - 102.0))
+    s.save()
+    back = R.WatchlistScheduler(items(), path).stats["near"]
+    assert (back.checks, back.below, back.last_price, back.mean, back.vol) == \
+           (st.checks, st.below, st.last_price, st.mean, st.vol)
+    assert back.last_check == 0.0
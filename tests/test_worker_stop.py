@@ -0,0 +1,19 @@
+import time
+
+import run_app as R
+
+
+def test_stopping_mode1_is_not_an_ocr_failure(tmp_path):
+    market = R.SyntheticMarket(duration=5)
+    cfg = market.config()
+    cfg.flight_recorder_s = 10.0
+    cfg.flight_recorder_dir = str(tmp_path / "flight")
+    logs = []
+    w = R.Mode1Worker(cfg, R.OracleOCR(market), 100.0, logs.append, inp=R.PlayerInput(market), screen=market)
+    market.start()
+    w.start()
+    time.sleep(0.5)
+    w.stop(wait=3.0)
+    assert not w.running
+    assert not [line for line in logs if "识别失败" in line]
+    assert not (tmp_path / "flight").exists()
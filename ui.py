@@ -0,0 +1,770 @@
+"""
+run_app 的 Qt 界面：MainWindow 与坐标 / 区域拾取控件。
+只由 run_app.main() 导入——无头子命令、基准与 OCR 服务子进程不加载 PySide6。
+"""
+import traceback
+from typing import List, Optional, Tuple
+
+from PySide6 import QtCore, QtGui
+from PySide6.QtCore import Qt, Signal, QRect
+from PySide6.QtGui import QCursor
+from PySide6.QtWidgets import (
+    QApplication, QWidget, QMainWindow, QLabel, QPushButton, QVBoxLayout, QHBoxLayout,
+    QGridLayout, QLineEdit, QFileDialog, QTextEdit, QSpinBox, QColorDialog, QTabWidget,
+    QMessageBox, QCheckBox, QInputDialog, QTableWidget, QTableWidgetItem
+)
+
+from run_app import (
+    STARTUP, TRACER, MACRO1_PATH, MACRO2_PATH, ConfigManager, LogPipeline, MacroRecorder, MacroReplayWorker,
+    Mode1Worker, Mode2Worker, OCRManager, OCRService, PriceHistoryStore, Region, Screen, WatchItem, Worker,
+    keyboard, make_input_backend,
+)
+
+# ============================= UI =============================
+class DragPickButton(QPushButton):
+    """
+    拖到屏幕任意位置松开以采集坐标；coordPicked(x, y)
+    """
+    coordPicked = Signal(int, int)
+
+    def mousePressEvent(self, e: QtGui.QMouseEvent):
+        super().mousePressEvent(e)
+        self.setCursor(Qt.ClosedHandCursor)
+
+    def mouseReleaseEvent(self, e: QtGui.QMouseEvent):
+        super().mouseReleaseEvent(e)
+        self.setCursor(Qt.ArrowCursor)
+        pos = QCursor.pos()
+        self.coordPicked.emit(pos.x(), pos.y())
+
+class RegionPickerOverlay(QWidget):
+    """
+    全屏半透明覆盖层，框选矩形区域；regionSelected(x,y,w,h)
+    """
+    regionSelected = Signal(int,int,int,int)
+
+    def __init__(self):
+        super().__init__(None, Qt.FramelessWindowHint | Qt.WindowStaysOnTopHint)
+        self.setAttribute(Qt.WA_TranslucentBackground, True)
+        self.start = None
+        self.end = None
+        self.setMouseTracking(True)
+        self.showFullScreen()
+
+    def paintEvent(self, e):
+        if self.start and self.end:
+            p = QtGui.QPainter(self)
+            p.setRenderHint(QtGui.QPainter.Antialiasing)
+            rect = QRect(self.start, self.end).normalized()
+            p.setPen(QtGui.QPen(QtGui.QColor(0, 255, 0, 200), 2))
+            p.setBrush(QtGui.QBrush(QtGui.QColor(0, 0, 0, 50)))
+            p.drawRect(rect)
+
+    def mousePressEvent(self, e: QtGui.QMouseEvent):
+        self.start = e.globalPosition().toPoint()
+        self.end = self.start
+        self.update()
+
+    def mouseMoveEvent(self, e: QtGui.QMouseEvent):
+        self.end = e.globalPosition().toPoint()
+        self.update()
+
+    def mouseReleaseEvent(self, e: QtGui.QMouseEvent):
+        self.end = e.globalPosition().toPoint()
+        rect = QRect(self.start, self.end).normalized()
+        self.regionSelected.emit(rect.x(), rect.y(), rect.width(), rect.height())
+        self.close()
+
+# ============================= Main Window =============================
+class MainWindow(QMainWindow):
+    UI_FLUSH_MS = 50                 # 日志批量上屏 / 价格标签合并刷新的周期
+    ocr_ready_signal = Signal(bool)  # OCR 后台加载完成
+
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("游戏商城自动抢货工具（GPU OCR）")
+        self.resize(1024, 720)
+
+        # 日志：任意线程 _log() 只入环形缓冲，定时器批量上屏；文件由后台线程轮转写入
+        self.logs = LogPipeline()
+        self.log_box = QTextEdit(readOnly=True)
+        self.log_box.setLineWrapMode(QTextEdit.NoWrap)
+        self._price_pending: Optional[Tuple[float, float]] = None
+
+        self.cfg_mgr = ConfigManager(logger=self._log)
+        self.cfg_mgr.load()
+        STARTUP.mark("config")
+        cfg = self.cfg_mgr.config
+        self.log_box.document().setMaximumBlockCount(max(100, cfg.log_max_lines))
+        if cfg.log_file:
+            self.logs.open_file(cfg.log_file, int(cfg.log_file_max_mb * (1 << 20)), cfg.log_file_backups)
+        # 模型在后台线程加载，窗口先出来；加载完成前开始按钮不可用
+        self.ocr = OCRManager.from_config(cfg, self._log, defer=True)
+        # ocr_service 开启时模型只在服务进程中加载；本地 OCRManager 仅用于字形学习等界面操作
+        self.ocr_service = OCRService(cfg, self._log, cfg.ocr_service_slots) if cfg.ocr_service else None
+        self.worker_ocr = self.ocr_service or self.ocr
+        self.mode1_thread: Optional[Mode1Worker] = None
+        self.mode2_thread: Optional[Mode2Worker] = None
+        self.replay_thread: Optional[MacroReplayWorker] = None
+
+        # Macros for Mode 2
+        # 输入后端（所有点击 / 按键 / 宏回放共用）
+        self.input = make_input_backend(cfg.input_backend, self._log)
+        self.macro1 = MacroRecorder(self._log, MACRO1_PATH, cfg.macro_simplify_px, cfg.macro_speed,
+                                    cfg.macro_max_gap_s, self.input)
+        self.macro2 = MacroRecorder(self._log, MACRO2_PATH, cfg.macro_simplify_px, cfg.macro_speed,
+                                    cfg.macro_max_gap_s, self.input)
+
+        # Global hotkeys（窗口显示后再注册，pynput 不拖慢首屏）
+        self._gh_listener = None
+        QtCore.QTimer.singleShot(0, self._setup_global_hotkeys)
+
+        self._build_ui()
+        STARTUP.mark("window")
+        self._set_start_enabled(False)
+        self.ocr_ready_signal.connect(self._on_ocr_ready)
+        if self.ocr_service is not None:
+            self.ocr_service.start(on_ready=self.ocr_ready_signal.emit)
+        else:
+            self.ocr.start_background(on_ready=self.ocr_ready_signal.emit, timer=STARTUP)
+        self._ui_timer = QtCore.QTimer(self)
+        self._ui_timer.timeout.connect(self._flush_ui)
+        self._ui_timer.start(self.UI_FLUSH_MS)
+        self._log("OCR 模型后台加载中，完成前暂不能启动模式1/2 ...")
+        self._log("提示：窗口内 F2 捕捉点、F3 框选、F8 开始、F9 停止、F10 保存飞行记录；同时支持**全局热键**：F8(模式1)、Shift+F8(模式2)、F9(停止)、F10(飞行记录)。")
+
+    # ---------- Global Hotkeys ----------
+    def _setup_global_hotkeys(self):
+        def start_mode1():
+            self._start_mode1()
+        def start_mode2():
+            self._start_mode2()
+        def stop_all():
+            self._stop_all()
+        def dump_flight():
+            self._dump_flight()
+        # 全局监听（需要管理员权限）
+        try:
+            self._gh_listener = keyboard.GlobalHotKeys({
+                '<f8>': start_mode1,
+                '<shift>+<f8>': start_mode2,
+                '<f9>': stop_all,
+                '<f10>': dump_flight,
+            })
+            self._gh_listener.start()
+            self._log("全局热键已注册：F8=模式1，Shift+F8=模式2，F9=停止，F10=保存飞行记录。若无效请用管理员运行。")
+        except Exception as e:
+            self._log(f"⚠️ 全局热键注册失败：{e}（可用窗口内快捷键代替）")
+
+    def closeEvent(self, e: QtGui.QCloseEvent):
+        try:
+            if self._gh_listener:
+                self._gh_listener.stop()
+        except:
+            pass
+        for w in self._workers():
+            w.stop(wait=1.0)
+        store = self._history_store()
+        if store is not None:
+            store.close()
+        if self.ocr_service is not None:
+            self.ocr_service.stop()
+        self.logs.close_file()
+        return super().closeEvent(e)
+
+    # ---------- UI Tabs ----------
+    def _build_ui(self):
+        self.tabs = QTabWidget()
+
+        self.tabs.addTab(self._build_config_tab(), "配置/坐标")
+        self.tabs.addTab(self._build_mode1_tab(), "模式1：扫货")
+        self.tabs.addTab(self._build_mode2_tab(), "模式2：宏控制")
+        self.tabs.addTab(self._build_perf_tab(), "性能")
+        self.tabs.addTab(self._build_log_tab(), "日志")
+
+        # Global controls
+        topbar = QHBoxLayout()
+        self.btn_load = QPushButton("读取配置")
+        self.btn_save = QPushButton("保存配置")
+        self.btn_load.clicked.connect(self._on_load)
+        self.btn_save.clicked.connect(self._on_save)
+        topbar.addWidget(self.btn_load)
+        topbar.addWidget(self.btn_save)
+        topbar.addStretch()
+
+        container = QWidget()
+        layout = QVBoxLayout(container)
+        layout.addLayout(topbar)
+        layout.addWidget(self.tabs)
+        self.setCentralWidget(container)
+
+        self.installEventFilter(self)
+
+    def _build_perf_tab(self):
+        w = QWidget()
+        v = QVBoxLayout(w)
+        h = QHBoxLayout()
+        self.cb_trace = QCheckBox("启用热路径追踪")
+        self.cb_trace.setChecked(self.cfg_mgr.config.trace_enabled)
+        TRACER.enabled = self.cfg_mgr.config.trace_enabled
+        def toggle(state):
+            TRACER.enabled = bool(state)
+            self.cfg_mgr.config.trace_enabled = bool(state)
+        self.cb_trace.stateChanged.connect(toggle)
+        btn_export = QPushButton("导出 Chrome Trace")
+        btn_clear = QPushButton("清空")
+        btn_export.clicked.connect(self._export_trace)
+        btn_clear.clicked.connect(TRACER.clear)
+        h.addWidget(self.cb_trace); h.addWidget(btn_export); h.addWidget(btn_clear); h.addStretch()
+        v.addLayout(h)
+        self.perf_box = QTextEdit(readOnly=True)
+        self.perf_box.setLineWrapMode(QTextEdit.NoWrap)
+        self.perf_box.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+        v.addWidget(self.perf_box)
+        self._perf_timer = QtCore.QTimer(self)
+        self._perf_timer.timeout.connect(self._refresh_perf)
+        self._perf_timer.start(1000)
+        return w
+
+    def _refresh_perf(self):
+        if not TRACER.enabled or not self.perf_box.isVisible():
+            return
+        bars = " ▁▂▃▄▅▆▇█"
+        head = f"{'阶段':<14}{'次数':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}   直方图 <0.1|<1|<10|<100|<1s|≥1s (ms)"
+        lines = [f"最近 5 秒（毫秒）", head]
+        for r in TRACER.summary(5.0):
+            peak = max(r["hist"]) or 1
+            spark = "".join(bars[int(c / peak * (len(bars) - 1))] for c in r["hist"])
+            lines.append(f"{r['stage']:<14}{r['n']:>6}{r['p50']:>9.2f}{r['p95']:>9.2f}{r['p99']:>9.2f}{r['max']:>9.2f}"
+                         f"   {spark}  {r['hist']}")
+        self.perf_box.setPlainText("\n".join(lines))
+
+    def _export_trace(self):
+        path, _ = QFileDialog.getSaveFileName(self, "导出 Chrome Trace", "trace.json", "JSON (*.json)")
+        if path:
+            n = TRACER.export_chrome(path)
+            self._log(f"已导出 {n} 个 span 到 {path}（chrome://tracing 或 Perfetto 打开）")
+
+    def _build_log_tab(self):
+        w = QWidget()
+        v = QVBoxLayout(w)
+        v.addWidget(self.log_box)
+        return w
+
+    def _build_config_tab(self):
+        w = QWidget()
+        grid = QGridLayout(w)
+
+        def coord_row(label_text, getter, setter):
+            row = QWidget()
+            h = QHBoxLayout(row)
+            h.addWidget(QLabel(label_text))
+            x = QLineEdit(); x.setPlaceholderText("x")
+            y = QLineEdit(); y.setPlaceholderText("y")
+            pb = DragPickButton("拖我到目标地址（松开即记录）")
+            pb.setFixedWidth(220)
+            def on_pick(px, py):
+                x.setText(str(px)); y.setText(str(py))
+            pb.coordPicked.connect(on_pick)
+            def load_vals():
+                vx, vy = getter()
+                x.setText(str(vx)); y.setText(str(vy))
+            def save_vals():
+                try:
+                    setter((int(x.text()), int(y.text())))
+                    self._log(f"{label_text} 坐标设置为 {x.text()},{y.text()}")
+                except:
+                    pass
+            btn_load = QPushButton("读入")
+            btn_save = QPushButton("应用")
+            btn_load.clicked.connect(load_vals)
+            btn_save.clicked.connect(save_vals)
+            h.addWidget(x); h.addWidget(y); h.addWidget(pb); h.addWidget(btn_load); h.addWidget(btn_save)
+            return row
+
+        def region_row(label_text, getter, setter):
+            row = QWidget()
+            h = QHBoxLayout(row)
+            h.addWidget(QLabel(label_text))
+            ex = QLineEdit(); ex.setPlaceholderText("x")
+            ey = QLineEdit(); ey.setPlaceholderText("y")
+            ew = QLineEdit(); ew.setPlaceholderText("w")
+            eh = QLineEdit(); eh.setPlaceholderText("h")
+            btn_pick = QPushButton("框选区域(F3)")
+            def pick_region():
+                overlay = RegionPickerOverlay()
+                overlay.regionSelected.connect(lambda x,y,w,h: (
+                    ex.setText(str(x)), ey.setText(str(y)), ew.setText(str(w)), eh.setText(str(h))
+                ))
+                overlay.show()
+            btn_apply = QPushButton("应用")
+            def apply_region():
+                try:
+                    setter(Region(int(ex.text()), int(ey.text()), int(ew.text()), int(eh.text())))
+                    self._log(f"{label_text} 设置为 ({ex.text()},{ey.text()},{ew.text()},{eh.text()})")
+                except:
+                    pass
+            btn_load = QPushButton("读入")
+            def load_vals():
+                r = getter()
+                ex.setText(str(r.x)); ey.setText(str(r.y)); ew.setText(str(r.w)); eh.setText(str(r.h))
+            btn_pick.clicked.connect(pick_region)
+            btn_apply.clicked.connect(apply_region)
+            btn_load.clicked.connect(load_vals)
+            h.addWidget(ex); h.addWidget(ey); h.addWidget(ew); h.addWidget(eh)
+            h.addWidget(btn_pick); h.addWidget(btn_load); h.addWidget(btn_apply)
+            return row
+
+        # 基础坐标
+        grid.addWidget(coord_row("交易行按钮", lambda: self.cfg_mgr.config.trade_button, self._set_trade), 0, 0)
+        grid.addWidget(coord_row("主界面按钮", lambda: self.cfg_mgr.config.main_menu_button, self._set_main), 1, 0)
+        grid.addWidget(coord_row("装备分类按钮", lambda: self.cfg_mgr.config.category_button, self._set_category), 2, 0)
+        grid.addWidget(coord_row("购买按钮", lambda: self.cfg_mgr.config.buy_button, self._set_buy), 3, 0)
+        grid.addWidget(coord_row("最大额度按钮", lambda: self.cfg_mgr.config.max_amount_button, self._set_max), 4, 0)
+        grid.addWidget(region_row("价格1区域", lambda: self.cfg_mgr.config.price1_region, self._set_price1), 5, 0)
+        grid.addWidget(region_row("价格2区域", lambda: self.cfg_mgr.config.price2_region, self._set_price2), 6, 0)
+
+        # （模式1）货物点击坐标 + 立即刷新开关 + 最大额度点击次数
+        grid.addWidget(coord_row("（模式1）货物点击坐标",
+                                 lambda: self.cfg_mgr.config.mode1_item_click_coord,
+                                 lambda xy: setattr(self.cfg_mgr.config, "mode1_item_click_coord", xy)
+                                 ), 7, 0)
+
+        h2 = QHBoxLayout()
+        self.cb_refresh_immediate = QCheckBox("不符合立即 Esc+再点货物刷新（推荐）")
+        self.cb_refresh_immediate.setChecked(self.cfg_mgr.config.mode1_refresh_immediate)
+        self.cb_refresh_immediate.stateChanged.connect(lambda s: setattr(self.cfg_mgr.config, "mode1_refresh_immediate", bool(s)))
+        h2.addWidget(self.cb_refresh_immediate)
+
+        h2.addWidget(QLabel("最大额度点击次数："))
+        self.spin_max_clicks = QSpinBox()
+        self.spin_max_clicks.setRange(1, 5)
+        self.spin_max_clicks.setValue(self.cfg_mgr.config.max_amount_clicks)
+        self.spin_max_clicks.valueChanged.connect(lambda v: setattr(self.cfg_mgr.config, "max_amount_clicks", int(v)))
+        h2.addWidget(self.spin_max_clicks)
+        h2.addStretch()
+        grid.addLayout(h2, 8, 0)
+
+        # Interval
+        h = QHBoxLayout()
+        h.addWidget(QLabel("OCR间隔(ms)："))
+        self.spin_interval = QSpinBox()
+        self.spin_interval.setRange(30, 5000)
+        self.spin_interval.setValue(self.cfg_mgr.config.scan_interval_ms)
+        self.spin_interval.valueChanged.connect(lambda v: setattr(self.cfg_mgr.config, "scan_interval_ms", int(v)))
+        h.addWidget(self.spin_interval)
+        h.addStretch()
+        grid.addLayout(h, 9, 0)
+
+        tips = QLabel("提示：拖拽按钮到目标位置（松开即记录）；窗口内也支持 F2/F3/F8/F9。若切到游戏，用全局热键 F8/Shift+F8/F9。")
+        tips.setWordWrap(True)
+        grid.addWidget(tips, 10, 0)
+
+        return w
+
+    def _build_mode1_tab(self):
+        w = QWidget()
+        v = QVBoxLayout(w)
+
+        h = QHBoxLayout()
+        h.addWidget(QLabel("扫货最低价阈值："))
+        self.edit_threshold = QLineEdit()
+        self.edit_threshold.setPlaceholderText("例如 1234.56")
+        h.addWidget(self.edit_threshold)
+
+        self.btn_mode1_start = QPushButton("开始模式1（F8 / 全局F8）")
+        self.btn_mode1_stop = QPushButton("停止（F9 / 全局F9）")
+        self.btn_mode1_start.clicked.connect(self._start_mode1)
+        self.btn_mode1_stop.clicked.connect(self._stop_all)
+        h.addWidget(self.btn_mode1_start)
+        h.addWidget(self.btn_mode1_stop)
+        h.addStretch()
+        v.addLayout(h)
+
+        self.lbl_price1 = QLabel("价格1：-")
+        self.lbl_price2 = QLabel("价格2：-")
+        v.addWidget(self.lbl_price1)
+        v.addWidget(self.lbl_price2)
+
+        h_glyph = QHBoxLayout()
+        self.btn_learn_glyph1 = QPushButton("字形学习（价格1区域）")
+        self.btn_learn_glyph2 = QPushButton("字形学习（价格2区域）")
+        self.btn_learn_glyph1.clicked.connect(lambda: self._learn_glyphs(self.cfg_mgr.config.price1_region))
+        self.btn_learn_glyph2.clicked.connect(lambda: self._learn_glyphs(self.cfg_mgr.config.price2_region))
+        h_glyph.addWidget(self.btn_learn_glyph1)
+        h_glyph.addWidget(self.btn_learn_glyph2)
+        h_glyph.addStretch()
+        v.addLayout(h_glyph)
+
+        # 监控清单
+        v.addWidget(QLabel("监控清单（非空时按优先级 / 价格波动 / 距上次检查时间轮换商品，覆盖上面的阈值与货物坐标）："))
+        self.tbl_watch = QTableWidget(0, 6)
+        self.tbl_watch.setHorizontalHeaderLabels(["名称", "X", "Y", "阈值", "最大额度次数", "优先级"])
+        v.addWidget(self.tbl_watch)
+        self._load_watchlist_table()
+
+        h_watch = QHBoxLayout()
+        btn_add = QPushButton("添加商品")
+        btn_del = QPushButton("删除选中")
+        btn_pick = DragPickButton("拖到商品位置（写入选中行坐标）")
+        btn_apply = QPushButton("应用清单")
+        btn_add.clicked.connect(lambda: self.tbl_watch.insertRow(self.tbl_watch.rowCount()))
+        btn_del.clicked.connect(lambda: self.tbl_watch.removeRow(self.tbl_watch.currentRow()))
+        btn_pick.coordPicked.connect(self._pick_watch_coord)
+        btn_apply.clicked.connect(self._apply_watchlist_table)
+        for b in (btn_add, btn_del, btn_pick, btn_apply):
+            h_watch.addWidget(b)
+        h_watch.addStretch()
+        v.addLayout(h_watch)
+
+        return w
+
+    def _load_watchlist_table(self):
+        items = self.cfg_mgr.config.mode1_watchlist
+        self.tbl_watch.setRowCount(len(items))
+        for r, it in enumerate(items):
+            vals = [it.name, it.click_coord[0], it.click_coord[1], it.threshold, it.max_amount_clicks, it.priority]
+            for c, val in enumerate(vals):
+                self.tbl_watch.setItem(r, c, QTableWidgetItem(str(val)))
+
+    def _pick_watch_coord(self, x, y):
+        r = self.tbl_watch.currentRow()
+        if r < 0:
+            self._log("请先在监控清单中选中一行。")
+            return
+        self.tbl_watch.setItem(r, 1, QTableWidgetItem(str(x)))
+        self.tbl_watch.setItem(r, 2, QTableWidgetItem(str(y)))
+
+    def _apply_watchlist_table(self):
+        def cell(r, c, default=""):
+            it = self.tbl_watch.item(r, c)
+            return it.text().strip() if it and it.text().strip() else default
+        items = []
+        for r in range(self.tbl_watch.rowCount()):
+            try:
+                items.append(WatchItem(name=cell(r, 0, f"商品{r+1}"),
+                                       click_coord=(int(cell(r, 1)), int(cell(r, 2))),
+                                       threshold=float(cell(r, 3)),
+                                       max_amount_clicks=int(cell(r, 4, "2")),
+                                       priority=float(cell(r, 5, "1"))))
+            except ValueError:
+                self._log(f"监控清单第 {r+1} 行不完整，已忽略。")
+        self.cfg_mgr.config.mode1_watchlist = items
+        self._log(f"监控清单已应用：{len(items)} 个商品")
+
+    def _build_mode2_tab(self):
+        w = QWidget()
+        grid = QGridLayout(w)
+
+        # price coord
+        self.btn_pick_price_coord = DragPickButton("拖到价格坐标处（松开记录）")
+        self.btn_pick_price_coord.coordPicked.connect(lambda x,y: self._set_mode2_price_coord((x,y)))
+        grid.addWidget(QLabel("价格坐标："), 0, 0)
+        self.mode2_x = QLineEdit(); self.mode2_x.setPlaceholderText("x")
+        self.mode2_y = QLineEdit(); self.mode2_y.setPlaceholderText("y")
+        grid.addWidget(self.mode2_x, 0, 1); grid.addWidget(self.mode2_y, 0, 2); grid.addWidget(self.btn_pick_price_coord, 0, 3)
+
+        # threshold
+        grid.addWidget(QLabel("价格阈值："), 1, 0)
+        self.mode2_threshold = QLineEdit(str(self.cfg_mgr.config.mode2_threshold))
+        grid.addWidget(self.mode2_threshold, 1, 1)
+
+        # target color
+        grid.addWidget(QLabel("终止条件颜色坐标："), 2, 0)
+        self.btn_pick_color_coord = DragPickButton("拖到像素位置")
+        self.btn_pick_color_coord.coordPicked.connect(lambda x,y: self._set_mode2_color_coord((x,y)))
+        self.mode2_color_x = QLineEdit(); self.mode2_color_x.setPlaceholderText("x")
+        self.mode2_color_y = QLineEdit(); self.mode2_color_y.setPlaceholderText("y")
+        grid.addWidget(self.mode2_color_x, 2, 1); grid.addWidget(self.mode2_color_y, 2, 2); grid.addWidget(self.btn_pick_color_coord, 2, 3)
+
+        grid.addWidget(QLabel("目标颜色(R,G,B)："), 3, 0)
+        self.mode2_color_r = QLineEdit(str(self.cfg_mgr.config.mode2_target_color_rgb[0]))
+        self.mode2_color_g = QLineEdit(str(self.cfg_mgr.config.mode2_target_color_rgb[1]))
+        self.mode2_color_b = QLineEdit(str(self.cfg_mgr.config.mode2_target_color_rgb[2]))
+        btn_pick_color = QPushButton("颜色选择器")
+        def pick_color():
+            c = QColorDialog.getColor()
+            if c.isValid():
+                self.mode2_color_r.setText(str(c.red()))
+                self.mode2_color_g.setText(str(c.green()))
+                self.mode2_color_b.setText(str(c.blue()))
+        grid.addWidget(self.mode2_color_r, 3, 1)
+        grid.addWidget(self.mode2_color_g, 3, 2)
+        grid.addWidget(self.mode2_color_b, 3, 3)
+        grid.addWidget(btn_pick_color, 3, 4)
+
+        # macro recorders
+        self.btn_rec1 = QPushButton("录制操作1（再点停止）")
+        self.btn_stop_rec1 = QPushButton("停止录制1")
+        self.btn_play1 = QPushButton("回放操作1")
+        self.btn_rec2 = QPushButton("录制操作2（再点停止）")
+        self.btn_stop_rec2 = QPushButton("停止录制2")
+        self.btn_play2 = QPushButton("回放操作2")
+        btn_simplify1 = QPushButton("简化轨迹1")
+        btn_simplify2 = QPushButton("简化轨迹2")
+        btn_simplify1.clicked.connect(lambda: self.macro1.simplify())
+        btn_simplify2.clicked.connect(lambda: self.macro2.simplify())
+        self.btn_rec1.clicked.connect(lambda: self.macro1.start())
+        self.btn_stop_rec1.clicked.connect(lambda: self.macro1.stop())
+        self.btn_play1.clicked.connect(lambda: self._replay_macro(self.macro1))
+        self.btn_rec2.clicked.connect(lambda: self.macro2.start())
+        self.btn_stop_rec2.clicked.connect(lambda: self.macro2.stop())
+        self.btn_play2.clicked.connect(lambda: self._replay_macro(self.macro2))
+        grid.addWidget(self.btn_rec1, 4, 0); grid.addWidget(self.btn_stop_rec1, 4, 1); grid.addWidget(self.btn_play1, 4, 2); grid.addWidget(btn_simplify1, 4, 3)
+        grid.addWidget(self.btn_rec2, 5, 0); grid.addWidget(self.btn_stop_rec2, 5, 1); grid.addWidget(self.btn_play2, 5, 2); grid.addWidget(btn_simplify2, 5, 3)
+        grid.addWidget(QLabel("回放倍速 / 空闲压缩(秒)："), 6, 0)
+        self.macro_speed = QLineEdit(str(self.cfg_mgr.config.macro_speed))
+        self.macro_max_gap = QLineEdit(str(self.cfg_mgr.config.macro_max_gap_s))
+        self.macro_max_gap.setPlaceholderText("0=不压缩")
+        grid.addWidget(self.macro_speed, 6, 1); grid.addWidget(self.macro_max_gap, 6, 2)
+
+        # controls
+        self.btn_mode2_start = QPushButton("开始模式2（Shift+F8 / 全局Shift+F8）")
+        self.btn_mode2_stop = QPushButton("停止（F9 / 全局F9）")
+        self.btn_mode2_start.clicked.connect(self._start_mode2)
+        self.btn_mode2_stop.clicked.connect(self._stop_all)
+        grid.addWidget(self.btn_mode2_start, 7, 0)
+        grid.addWidget(self.btn_mode2_stop, 7, 1)
+
+        return w
+
+    # ---------------- Event Filter for window-level hotkeys ----------------
+    def eventFilter(self, obj, event):
+        if event.type() == QtCore.QEvent.KeyPress:
+            key = event.key()
+            if key == Qt.Key_F2:
+                pos = QCursor.pos()
+                self._log(f"F2 捕捉坐标：{pos.x()},{pos.y()}")
+                self._fill_focused_coord(pos.x(), pos.y())
+                return True
+            elif key == Qt.Key_F3:
+                self._log("F3：框选区域")
+                overlay = RegionPickerOverlay()
+                overlay.regionSelected.connect(lambda x,y,w,h: self._log(f"区域：{x},{y},{w},{h}"))
+                overlay.show()
+                return True
+            elif key == Qt.Key_F8:
+                idx = self.tabs.currentIndex()
+                if idx == 1:
+                    self._start_mode1()
+                elif idx == 2:
+                    self._start_mode2()
+                else:
+                    self._start_mode1()
+                return True
+            elif key == Qt.Key_F9:
+                self._stop_all()
+                return True
+            elif key == Qt.Key_F10:
+                self._dump_flight()
+                return True
+        return super().eventFilter(obj, event)
+
+    def _fill_focused_coord(self, x, y):
+        w = QApplication.focusWidget()
+        if isinstance(w, QLineEdit):
+            w.setText(str(x))
+            # 尝试给下一个焦点控件写入 y
+            QApplication.sendEvent(self, QtGui.QKeyEvent(QtCore.QEvent.KeyPress, Qt.Key_Tab, Qt.NoModifier))
+            w2 = QApplication.focusWidget()
+            if isinstance(w2, QLineEdit):
+                w2.setText(str(y))
+
+    # ---------------- Config setters ----------------
+    def _set_trade(self, xy): self.cfg_mgr.config.trade_button = xy
+    def _set_main(self, xy): self.cfg_mgr.config.main_menu_button = xy
+    def _set_category(self, xy): self.cfg_mgr.config.category_button = xy
+    def _set_buy(self, xy): self.cfg_mgr.config.buy_button = xy
+    def _set_max(self, xy): self.cfg_mgr.config.max_amount_button = xy
+    def _set_price1(self, r: 'Region'): self.cfg_mgr.config.price1_region = r
+    def _set_price2(self, r: 'Region'): self.cfg_mgr.config.price2_region = r
+    def _set_mode2_price_coord(self, xy):
+        self.cfg_mgr.config.mode2_price_coord = xy
+        self.mode2_x.setText(str(xy[0])); self.mode2_y.setText(str(xy[1]))
+
+    # ---------------- Buttons ----------------
+    def _on_load(self):
+        try:
+            path, _ = QFileDialog.getOpenFileName(self, "选择配置", ".", "JSON (*.json)")
+            if path:
+                self.cfg_mgr.path = path
+                self.cfg_mgr.load()
+                # refresh UI reflect critical fields
+                self.spin_interval.setValue(self.cfg_mgr.config.scan_interval_ms)
+                self.mode2_threshold.setText(str(self.cfg_mgr.config.mode2_threshold))
+                self.mode2_x.setText(str(self.cfg_mgr.config.mode2_price_coord[0]))
+                self.mode2_y.setText(str(self.cfg_mgr.config.mode2_price_coord[1]))
+                self.macro_speed.setText(str(self.cfg_mgr.config.macro_speed))
+                self.macro_max_gap.setText(str(self.cfg_mgr.config.macro_max_gap_s))
+                self._apply_macro_timing()
+                # 模式1新增字段
+                self.cb_refresh_immediate.setChecked(self.cfg_mgr.config.mode1_refresh_immediate)
+                self.spin_max_clicks.setValue(self.cfg_mgr.config.max_amount_clicks)
+                self._load_watchlist_table()
+        except Exception as e:
+            self._log("读取失败：" + str(e))
+            self._log(traceback.format_exc())
+
+    def _on_save(self):
+        try:
+            try:
+                self.cfg_mgr.config.mode2_threshold = float(self.mode2_threshold.text() or "0")
+            except:
+                pass
+            self._apply_macro_timing()
+            try:
+                self.cfg_mgr.config.scan_interval_ms = int(self.spin_interval.value())
+            except:
+                pass
+            self._apply_watchlist_table()
+            self.cfg_mgr.save()
+        except Exception as e:
+            self._log("保存失败：" + str(e))
+            self._log(traceback.format_exc())
+
+    def _set_start_enabled(self, on: bool):
+        self.btn_mode1_start.setEnabled(on)
+        self.btn_mode2_start.setEnabled(on)
+
+    def _ocr_usable(self) -> bool:
+        """有可用的识别手段：重型引擎已加载，或已有字形模板"""
+        return bool(self.worker_ocr.backend) or self.ocr.glyph.ready
+
+    def _on_ocr_ready(self, ok: bool):
+        self._set_start_enabled(self._ocr_usable())
+        if ok:
+            where = "独立进程" if self.ocr_service is not None else "本进程"
+            self._log(f"OCR 就绪（{self.worker_ocr.backend}，{where}）。")
+        elif self.ocr.glyph.ready:
+            self._log("⚠️ OCR 引擎不可用，仅字形模板快速通道可用。")
+        else:
+            self._log("❌ OCR 引擎不可用且没有字形模板，模式1/2 无法启动。")
+            QMessageBox.warning(self, "OCR 不可用",
+                                "OCR 引擎加载失败，且没有字形模板。\n"
+                                "请安装 PaddleOCR / EasyOCR，或先用“字形学习”采集价格数字后再启动模式1/2。")
+        self._log(STARTUP.report())
+
+    def _ocr_not_ready(self) -> bool:
+        if not self.worker_ocr.ready.is_set():
+            self._log("OCR 模型仍在加载，请稍候再启动。")
+            return True
+        if not self._ocr_usable():
+            self._log("❌ 没有可用的 OCR（引擎加载失败且无字形模板），拒绝启动。请先进行字形学习。")
+            return True
+        return False
+
+    def _start_mode1(self):
+        if self._ocr_not_ready():
+            return
+        if self.mode1_thread and self.mode1_thread.running:
+            self._log("模式1已在运行。")
+            return
+        self._apply_watchlist_table()
+        try:
+            th = float(self.edit_threshold.text())
+        except:
+            if not self.cfg_mgr.config.mode1_watchlist:
+                QMessageBox.warning(self, "提示", "请先输入扫货最低价阈值。")
+                return
+            th = 0.0  # 监控清单模式下使用各商品自己的阈值
+        # 回调在工作线程内直接入缓冲 / 记下最新价格，不为每行/每个价格排队一次 GUI 事件
+        self.mode1_thread = Mode1Worker(self.cfg_mgr.config, self.worker_ocr, th, logger=self._log, inp=self.input,
+                                        on_price=self._on_price_update, history=self._history_store(),
+                                        on_finished=lambda: self._log("模式1线程结束"))
+        self.mode1_thread.start()
+        self._log("模式1启动。")
+
+    def _history_store(self) -> Optional[PriceHistoryStore]:
+        """模式1 / 模式2 共用一个历史库实例（两个实例会互相覆盖 id 映射旁车文件）"""
+        cfg = self.cfg_mgr.config
+        return PriceHistoryStore.shared(cfg.price_history_path) if cfg.price_history_enabled else None
+
+    def _apply_macro_timing(self):
+        cfg = self.cfg_mgr.config
+        try:
+            cfg.macro_speed = max(0.1, float(self.macro_speed.text() or "1"))
+            cfg.macro_max_gap_s = max(0.0, float(self.macro_max_gap.text() or "0"))
+        except ValueError:
+            self._log("回放倍速 / 空闲压缩输入无效，沿用原值。")
+        for m in (self.macro1, self.macro2):
+            m.speed, m.max_gap = cfg.macro_speed, cfg.macro_max_gap_s
+
+    def _start_mode2(self):
+        if self._ocr_not_ready():
+            return
+        if self.mode2_thread and self.mode2_thread.running:
+            self._log("模式2已在运行。")
+            return
+        try:
+            self.cfg_mgr.config.mode2_price_coord = (int(self.mode2_x.text()), int(self.mode2_y.text()))
+        except:
+            pass
+        try:
+            self.cfg_mgr.config.mode2_threshold = float(self.mode2_threshold.text())
+        except:
+            pass
+        self._apply_macro_timing()
+
+        self.mode2_thread = Mode2Worker(self.cfg_mgr.config, self.worker_ocr, self.macro1, self.macro2,
+                                        logger=self._log, history=self._history_store(),
+                                        on_finished=lambda: self._log("模式2线程结束"))
+        self.mode2_thread.start()
+        self._log("模式2启动。")
+
+    def _learn_glyphs(self, r: 'Region'):
+        """截取当前价格区域，由用户输入实际显示的数字作为标注，学习字形模板。"""
+        if r.w <= 0 or r.h <= 0:
+            QMessageBox.warning(self, "提示", "请先框选价格区域。")
+            return
+        img = Screen().grab_region((r.x, r.y, r.w, r.h))
+        guess = self.ocr.read_price(img).text
+        label, ok = QInputDialog.getText(self, "字形学习", "请输入该区域当前显示的数字（含小数点/逗号）：", text=guess)
+        if ok and label.strip() and self.ocr.learn_glyphs(img, label.strip()):
+            if self.ocr_service is not None:
+                self.ocr_service.reload_glyphs()
+            if self.worker_ocr.ready.is_set():
+                self._set_start_enabled(self._ocr_usable())   # 首批模板学到后即可启动
+
+    def _replay_macro(self, macro: MacroRecorder):
+        if self.replay_thread and self.replay_thread.running:
+            self._log("宏正在回放中。")
+            return
+        self._apply_macro_timing()
+        self.replay_thread = MacroReplayWorker(macro, logger=self._log)
+        self.replay_thread.start()
+
+    def _workers(self) -> List[Worker]:
+        return [w for w in (self.mode1_thread, self.mode2_thread, self.replay_thread) if w is not None]
+
+    def _stop_all(self):
+        for w in self._workers():
+            w.stop()
+        self._log("已请求停止（F9 / 全局F9）。")
+
+    def _dump_flight(self):
+        """F10：把运行中 worker 最近的 ROI 帧与识别结果转储到飞行记录目录（可在热键线程调用）"""
+        dumped = [w.name for w in self._workers() if w.running and w.dump_flight("hotkey")]
+        self._log(f"飞行记录：已转储 {'、'.join(dumped)}" if dumped else "飞行记录：没有运行中的监控或记录为空。")
+
+    def _on_price_update(self, p1, p2):
+        """可在工作线程调用：只记下最新值，由 _flush_ui 每帧渲染一次"""
+        self._price_pending = (p1, p2)
+
+    def _log(self, s: str):
+        """线程安全：仅入缓冲，由 _flush_ui 批量上屏"""
+        self.logs.write(s)
+
+    def _flush_ui(self):
+        price, self._price_pending = self._price_pending, None
+        if price is not None:
+            p1, p2 = price
+            if p1 >= 0:
+                self.lbl_price1.setText(f"价格1：{p1}")
+            if p2 >= 0:
+                self.lbl_price2.setText(f"价格2：{p2}")
+        lines, dropped = self.logs.drain()
+        if dropped:
+            lines.insert(0, f"[日志] 刷新不及，已丢弃 {dropped} 行（完整内容见日志文件）")
+        if lines:
+            self.log_box.append("\n".join(lines))
+            self.log_box.moveCursor(QtGui.QTextCursor.End)